@@ -0,0 +1,95 @@
+# db_connection_benchmark.py - Latencia por llamada: conexión por llamada vs conexión persistente
+# Uso: python -m benchmarks.db_connection_benchmark [iteraciones]
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database.db_handler import DatabaseHandler
+from database.task_cache import TaskCache
+
+
+class LegacyConnectionHandler(DatabaseHandler):
+    # Reproduce el comportamiento anterior: conexión nueva y PRAGMAs en cada llamada
+    def get_connection(self):
+        conn = sqlite3.connect(self.db_path, timeout=10.0)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA busy_timeout=10000")
+        except sqlite3.OperationalError:
+            pass
+        return conn
+
+
+class UncachedTaskCache(TaskCache):
+    # Siempre falla: get_tasks llega a SQLite en cada llamada y mide la consulta, no la caché
+    def get(self, guild_id):
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def store(self, guild_id, rows, generation):
+        pass
+
+
+def _without_task_cache(db):
+    db.task_cache = UncachedTaskCache()
+    return db
+
+
+def _measure(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1_000_000)
+    samples.sort()
+    return {
+        "media_us": statistics.fmean(samples),
+        "p50_us": samples[len(samples) // 2],
+        "p95_us": samples[int(len(samples) * 0.95) - 1],
+    }
+
+
+def _seed(db, guild_id):
+    for index in range(40):
+        db.add_task("Matemática", f"Guía {index}", "18/03/2030 12:00", 1, guild_id)
+    db.set_enrollments(1, ["Matemática", "Ética"], guild_id)
+
+
+def run(iterations=2000):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for label, handler_cls in (("por-llamada", LegacyConnectionHandler), ("persistente", DatabaseHandler)):
+            db = _without_task_cache(handler_cls(os.path.join(tmp_dir, f"{label}.db")))
+            _seed(db, 200)
+            task_ids = [task.id for task in db.get_tasks(200)]
+            results[label] = {
+                "get_tasks": _measure(lambda: db.get_tasks(200), iterations),
+                "get_sent_reminders_for_tasks": _measure(lambda: db.get_sent_reminders_for_tasks(task_ids), iterations),
+                "get_user_enrollments": _measure(lambda: db.get_user_enrollments(1, 200), iterations),
+            }
+            db.close()
+    return results
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    results = run(iterations)
+    print(f"Iteraciones por consulta: {iterations}")
+    for query in results["por-llamada"]:
+        before = results["por-llamada"][query]
+        after = results["persistente"][query]
+        speedup = before["media_us"] / after["media_us"] if after["media_us"] else 0.0
+        print(
+            f"{query:32s} antes={before['media_us']:8.1f}us (p95 {before['p95_us']:8.1f}) "
+            f"después={after['media_us']:8.1f}us (p95 {after['p95_us']:8.1f}) x{speedup:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+# storage_backend_benchmark.py - Latencia por llamada: backend SQLite vs backend en memoria
+# La diferencia aproxima cuánto de la latencia del bot proviene del almacenamiento.
+# Uso: python -m benchmarks.storage_backend_benchmark [iteraciones]
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.db_connection_benchmark import _measure, _seed, _without_task_cache
+from database.storage import create_storage
+
+
+def run(iterations=2000):
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for backend in ("sqlite", "memory"):
+            options = {"db_path": os.path.join(tmp_dir, "bot.db")} if backend == "sqlite" else {}
+            db = create_storage(backend, **options)
+            if backend == "sqlite":
+                # Sin la caché de tareas, get_tasks compara SQLite contra memoria y no dos cachés
+                _without_task_cache(db)
+            _seed(db, 200)
+            task_ids = [task.id for task in db.get_tasks(200)]
+            results[backend] = {
+                "get_tasks": _measure(lambda: db.get_tasks(200), iterations),
+                "get_task_by_id": _measure(lambda: db.get_task_by_id(task_ids[0]), iterations),
+                "get_sent_reminders_for_tasks": _measure(lambda: db.get_sent_reminders_for_tasks(task_ids), iterations),
+                "get_enrollment_snapshot": _measure(lambda: db.get_enrollment_snapshot(200), iterations),
+                "mark_reminder_sent": _measure(lambda: db.mark_reminder_sent(task_ids[0], "24h"), iterations),
+            }
+            db.close()
+    return results
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    results = run(iterations)
+    print(f"Iteraciones por operación: {iterations}")
+    for operation in results["sqlite"]:
+        sqlite_result = results["sqlite"][operation]
+        memory_result = results["memory"][operation]
+        print(
+            f"{operation:32s} sqlite={sqlite_result['media_us']:8.1f}us (p95 {sqlite_result['p95_us']:8.1f}) "
+            f"memoria={memory_result['media_us']:8.1f}us (p95 {memory_result['p95_us']:8.1f}) "
+            f"almacenamiento≈{sqlite_result['media_us'] - memory_result['media_us']:8.1f}us"
+        )
+
+
+if __name__ == "__main__":
+    main()
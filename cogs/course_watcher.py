@@ -1,22 +1,37 @@
 import asyncio
+import copy
 import datetime
 import hashlib
+import http.cookies
+import json
 import os
 import re
 import random
 import logging
-from urllib.parse import urljoin
+import time
+import zlib
+from collections import OrderedDict
+from urllib.parse import urljoin, urlsplit
 from zoneinfo import ZoneInfo
 
 import aiohttp
+from yarl import URL
 import discord
+try:
+    from aiohttp.compression_utils import HAS_BROTLI
+except ImportError:
+    HAS_BROTLI = False
 from bs4 import BeautifulSoup
 from discord import app_commands
 from discord.ext import commands, tasks
 
+from database.task_row import TaskRow
 from utils.config import CHANNELS, find_channel
 from utils.date_ai import DueDateAI
 from utils.embeds import create_task_embed
+from utils.leases import get_lease_manager
+from utils.rate_limiter import FixedWindow, get_rate_limiter
+from utils.task_completion import TaskCompletionView, get_task_message_index
 
 COURSES = {
     "INFRAESTRUCTURA DE RED": "https://www.cvirtualuees.edu.sv/course/view.php?id=23879",
@@ -39,6 +54,23 @@ TIMEZONE_NAME = "America/El_Salvador"
 DAILY_SCAN_LIMIT = 2
 GLOBAL_SCAN_COMMAND_KEY = "tareas_nuevas_global"
 MAX_TRACKED_CHANNEL_TIMESTAMPS = 2000
+# Cursos escaneados a la vez y peticiones simultáneas por host (COURSE_SCAN_CONCURRENCY / COURSE_SCAN_PER_HOST)
+DEFAULT_SCAN_CONCURRENCY = 3
+DEFAULT_PER_HOST_CONCURRENCY = 2
+
+# Sesión HTTP compartida entre escaneos: conexiones keep-alive y DNS en caché hacia CVirtual
+HTTP_TIMEOUT = aiohttp.ClientTimeout(total=30, connect=10, sock_connect=10, sock_read=25)
+HTTP_POOL_LIMIT = 10
+HTTP_KEEPALIVE_SECONDS = 60
+HTTP_DNS_CACHE_SECONDS = 600
+# br solo si aiohttp puede descomprimirlo (paquete Brotli opcional)
+HTTP_ACCEPT_ENCODING = "gzip, deflate, br" if HAS_BROTLI else "gzip, deflate"
+# Cookies de Moodle persistidas en la base (http_sessions) y pre-calentamiento antes de cada slot
+MOODLE_COOKIES_KEY = "cvirtual"
+PREWARM_MINUTES_BEFORE_SLOT = 2
+# Caché de páginas (tabla page_cache) y resultados de parseo en memoria por hash de contenido
+PAGE_CACHE_COMPRESS_LEVEL = 6
+MAX_PARSED_PAGES = 512
 
 WEEK_REGEX = re.compile(r"semana\s*\d+", re.IGNORECASE)
 MIN_WEEK_TO_SCAN = 8
@@ -55,6 +87,13 @@ COURSE_SUBJECT_MAP = {
 logger = logging.getLogger("s4vi.course_watcher")
 
 
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
 class CourseWatcher(commands.GroupCog, group_name="tareas", group_description="Escaneo de cursos virtuales"):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
@@ -64,11 +103,170 @@ class CourseWatcher(commands.GroupCog, group_name="tareas", group_description="E
         self.message_interval_seconds = 30
         self.last_channel_message_at = {}
         self.scan_lock = asyncio.Lock()
+        self._http_session = None
+        self._http_session_broken = False
+        # Estado de la sesión de Moodle en el cookie jar compartido: None (sin sesión), "jar" o "manual"
+        # (CVIRTUAL_COOKIE). auth_generation cambia con cada inicio de sesión para re-loguear una sola vez.
+        self._auth_lock = asyncio.Lock()
+        self._auth_mode = None
+        self._auth_generation = 0
+        # Semáforos de cortesía por host, escaneos compartidos entre servidores y parseos por contenido
+        self._host_semaphores = {}
+        self._scan_cache = {}
+        self._parsed_pages = OrderedDict()
+        # Límite global diario de /tareas nuevas, persistido con la clave histórica. ensure_rule
+        # conserva los contadores de la regla si el cog se recarga a mitad del día.
+        get_rate_limiter(bot).ensure_rule(
+            GLOBAL_SCAN_COMMAND_KEY,
+            FixedWindow(DAILY_SCAN_LIMIT, daily=True, timezone=self.timezone),
+            scope="global",
+            persist_key=GLOBAL_SCAN_COMMAND_KEY,
+        )
         if not self.scan_courses_task.is_running():
             self.scan_courses_task.start()
 
-    def cog_unload(self):
+    async def cog_load(self):
+        self._http_session = self._build_http_session()
+
+    async def cog_unload(self):
         self.scan_courses_task.cancel()
+        await self._close_http_session()
+
+    def _build_http_session(self) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=self._per_host_concurrency(),
+            keepalive_timeout=HTTP_KEEPALIVE_SECONDS,
+            ttl_dns_cache=HTTP_DNS_CACHE_SECONDS,
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=HTTP_TIMEOUT,
+            headers={"Accept-Encoding": HTTP_ACCEPT_ENCODING},
+        )
+
+    async def _close_http_session(self):
+        session, self._http_session = self._http_session, None
+        if session is not None and not session.closed:
+            await session.close()
+
+    # Sesión compartida; se reconstruye si se cerró o si un escaneo la marcó como rota
+    # (errores de conexión que agotaron los reintentos)
+    async def _get_http_session(self) -> aiohttp.ClientSession:
+        if self._http_session_broken:
+            logger.warning("Reconstruyendo la sesión HTTP de CVirtual tras errores de conexión")
+            self._http_session_broken = False
+            await self._close_http_session()
+        if self._http_session is None or self._http_session.closed:
+            self._http_session = self._build_http_session()
+            # Jar vacío: la sesión de Moodle se restaura desde la base o se inicia de nuevo
+            self._auth_mode = None
+        return self._http_session
+
+    # Serializar las cookies de Moodle del jar (nombre, valor y atributos) para la base
+    def _export_moodle_cookies(self, session: aiohttp.ClientSession) -> list[dict]:
+        moodle_host = urlsplit(MOODLE_BASE_URL).netloc
+        cookies = []
+        for morsel in session.cookie_jar:
+            domain = morsel["domain"] or moodle_host
+            if not moodle_host.endswith(domain.lstrip(".")):
+                continue
+            cookies.append(
+                {
+                    "name": morsel.key,
+                    "value": morsel.value,
+                    "domain": morsel["domain"],
+                    "path": morsel["path"] or "/",
+                    "expires": morsel["expires"],
+                    "secure": bool(morsel["secure"]),
+                    "httponly": bool(morsel["httponly"]),
+                }
+            )
+        return cookies
+
+    def _import_moodle_cookies(self, session: aiohttp.ClientSession, cookies: list[dict]):
+        for cookie in cookies:
+            morsel = http.cookies.Morsel()
+            morsel.set(cookie["name"], cookie["value"], cookie["value"])
+            morsel["path"] = cookie.get("path") or "/"
+            if cookie.get("domain"):
+                morsel["domain"] = cookie["domain"]
+            if cookie.get("expires"):
+                morsel["expires"] = cookie["expires"]
+            morsel["secure"] = cookie.get("secure", False)
+            morsel["httponly"] = cookie.get("httponly", False)
+            session.cookie_jar.update_cookies({cookie["name"]: morsel}, response_url=URL(MOODLE_BASE_URL))
+
+    async def _save_session_cookies(self, session: aiohttp.ClientSession):
+        cookies = self._export_moodle_cookies(session)
+        if not cookies:
+            return
+        try:
+            await self.bot.db.save_http_cookies(MOODLE_COOKIES_KEY, json.dumps(cookies))
+        except Exception:
+            logger.exception("No se pudieron guardar las cookies de Moodle")
+
+    # Restaurar la última sesión guardada; se da por válida hasta que Moodle redirija a login
+    async def _restore_session_cookies(self, session: aiohttp.ClientSession) -> bool:
+        try:
+            stored = await self.bot.db.get_http_cookies(MOODLE_COOKIES_KEY)
+            cookies = json.loads(stored) if stored else []
+        except Exception:
+            logger.exception("No se pudieron cargar las cookies de Moodle guardadas")
+            return False
+        if not cookies:
+            return False
+        self._import_moodle_cookies(session, cookies)
+        return True
+
+    # Inicio de sesión completo (página de login, POST y verificación) sobre un jar limpio
+    async def _login(self, session: aiohttp.ClientSession):
+        session.cookie_jar.clear()
+        authenticated, use_manual_cookie = await self._authenticate_session(session)
+        self._auth_generation += 1
+        if not authenticated:
+            self._auth_mode = None
+            # Las cookies guardadas ya no sirven: evitar restaurarlas en el próximo escaneo
+            try:
+                await self.bot.db.delete_http_cookies(MOODLE_COOKIES_KEY)
+            except Exception:
+                logger.exception("No se pudieron borrar las cookies de Moodle guardadas")
+            return
+        self._auth_mode = "manual" if use_manual_cookie else "jar"
+        if not use_manual_cookie:
+            await self._save_session_cookies(session)
+
+    # Sesión lista para escanear sin peticiones extra: reutiliza la vigente o la guardada en la base y
+    # solo inicia sesión si no hay ninguna. validate=True la comprueba antes (pre-calentamiento).
+    async def _ensure_authenticated(self, session: aiohttp.ClientSession, validate: bool = False) -> tuple[bool, bool]:
+        async with self._auth_lock:
+            if self._auth_mode is None and await self._restore_session_cookies(session):
+                self._auth_mode = "jar"
+                self._auth_generation += 1
+                logger.info("Sesión de Moodle restaurada desde la base")
+            if self._auth_mode is not None and validate:
+                if not await self._verify_authenticated_session(session, use_manual_cookie=self._auth_mode == "manual"):
+                    logger.info("La sesión de Moodle guardada expiró; iniciando sesión de nuevo")
+                    self._auth_mode = None
+            if self._auth_mode is None:
+                await self._login(session)
+            return self._auth_mode is not None, self._auth_mode == "manual"
+
+    # Re-login perezoso: solo cuando Moodle redirige a login, y una sola vez aunque varios cursos
+    # concurrentes detecten la misma sesión expirada
+    async def _relogin_after_redirect(self, session: aiohttp.ClientSession, seen_generation: int) -> tuple[bool, bool]:
+        async with self._auth_lock:
+            if self._auth_generation == seen_generation:
+                logger.info("Moodle redirigió a login; la sesión expiró y se inicia de nuevo")
+                await self._login(session)
+            return self._auth_mode is not None, self._auth_mode == "manual"
+
+    # Dejar la sesión lista unos minutos antes del slot para que el escaneo empiece por los cursos
+    async def _prewarm_http_session(self):
+        session = await self._get_http_session()
+        authenticated, _use_manual_cookie = await self._ensure_authenticated(session, validate=True)
+        if not authenticated:
+            logger.warning("Pre-calentamiento: no se pudo autenticar en CVirtual")
 
     @tasks.loop(minutes=1)
     async def scan_courses_task(self):
@@ -76,6 +274,11 @@ class CourseWatcher(commands.GroupCog, group_name="tareas", group_description="E
             now = datetime.datetime.now(self.timezone).replace(second=0, microsecond=0)
             slot = (now.weekday(), now.hour, now.minute)
 
+            upcoming = now + datetime.timedelta(minutes=PREWARM_MINUTES_BEFORE_SLOT)
+            if (upcoming.weekday(), upcoming.hour, upcoming.minute) in SCHEDULE_SLOTS:
+                await self._prewarm_http_session()
+                return
+
             if slot not in SCHEDULE_SLOTS:
                 return
 
@@ -84,13 +287,20 @@ class CourseWatcher(commands.GroupCog, group_name="tareas", group_description="E
                 return
 
             self.last_slot_processed = slot_key
-            logger.info("Iniciando escaneo automático en slot %s", slot_key)
+            # Con varias instancias, cada servidor se escanea solo en la que posee su arrendamiento
+            guilds = await get_lease_manager(self.bot).claim_guilds("escaneo", self.bot.guilds)
+            logger.info("Iniciando escaneo automático en slot %s (%s servidores)", slot_key, len(guilds))
 
-            for guild in self.bot.guilds:
-                try:
-                    await self._scan_and_notify(guild)
-                except Exception:
-                    logger.exception("Error en escaneo automático para guild %s", guild.id)
+            # Un solo escaneo de CVirtual por slot, compartido por todos los servidores
+            scan_token = f"slot:{slot_key}"
+            try:
+                for guild in guilds:
+                    try:
+                        await self._scan_and_notify(guild, scan_token=scan_token)
+                    except Exception:
+                        logger.exception("Error en escaneo automático para guild %s", guild.id)
+            finally:
+                self._forget_course_scans(scan_token)
         except Exception:
             logger.exception("Fallo no controlado en scan_courses_task")
 
@@ -121,16 +331,16 @@ class CourseWatcher(commands.GroupCog, group_name="tareas", group_description="E
             return
 
         bypass_limit = bool(contrasena and contrasena.strip() == BYPASS_SCAN_PASSWORD)
-        current_day = self._current_day_key()
         if not bypass_limit:
-            current_count = self.bot.db.get_daily_command_usage(GLOBAL_SCAN_COMMAND_KEY, current_day)
-            if current_count >= DAILY_SCAN_LIMIT:
+            # El cupo se reserva en daily_command_usage con una sola sentencia: es el mismo para todas
+            # las instancias que comparten la base, no uno por proceso
+            limit = await get_rate_limiter(self.bot).hit(GLOBAL_SCAN_COMMAND_KEY, interaction)
+            if not limit.allowed:
                 await interaction.followup.send(
                     "Este comando alcanzó el límite global de 2 usos para hoy. Intenta mañana o usa la contraseña de bypass autorizada.",
                     ephemeral=True,
                 )
                 return
-            self.bot.db.increment_daily_command_usage(GLOBAL_SCAN_COMMAND_KEY, current_day)
 
         new_items_total = 0
         created_tasks_total = 0
@@ -138,15 +348,26 @@ class CourseWatcher(commands.GroupCog, group_name="tareas", group_description="E
         auth_failed_guilds = 0
         already_assigned_items = []
         blocked_detected = False
-        for guild in self.bot.guilds:
-            if interaction.guild and guild.id != interaction.guild.id:
-                continue
+        scan_duration_ms = 0
+        page_cache = None
+        # Escaneo forzado: token propio, nunca reutiliza el resultado de un slot o de otro comando
+        scan_token = f"manual:{interaction.id}"
+        guilds = [guild for guild in self.bot.guilds if not interaction.guild or guild.id == interaction.guild.id]
+        try:
+            reports = []
+            for guild in guilds:
+                reports.append(
+                    await self._scan_and_notify(
+                        guild,
+                        requested_week=semana,
+                        command_user_id=interaction.user.id,
+                        scan_token=scan_token,
+                    )
+                )
+        finally:
+            self._forget_course_scans(scan_token)
 
-            report = await self._scan_and_notify(
-                guild,
-                requested_week=semana,
-                command_user_id=interaction.user.id,
-            )
+        for report in reports:
             new_items_total += report["new_activities"]
             created_tasks_total += report["created_tasks"]
             updated_tasks_total += report.get("updated_tasks", 0)
@@ -155,6 +376,9 @@ class CourseWatcher(commands.GroupCog, group_name="tareas", group_description="E
             already_assigned_items.extend(report["already_assigned"])
             if report.get("blocked"):
                 blocked_detected = True
+            # Los servidores comparten el mismo escaneo: su duración no se suma
+            scan_duration_ms = max(scan_duration_ms, report.get("scan_duration_ms", 0))
+            page_cache = report.get("page_cache") or page_cache
 
         if auth_failed_guilds > 0 and new_items_total == 0 and created_tasks_total == 0 and updated_tasks_total == 0:
             await interaction.followup.send(
@@ -179,10 +403,15 @@ class CourseWatcher(commands.GroupCog, group_name="tareas", group_description="E
             return
 
         summary_lines = [
-            f"Escaneo completado: {new_items_total} actividades nuevas detectadas.",
+            f"Escaneo completado en {scan_duration_ms / 1000:.1f} s: {new_items_total} actividades nuevas detectadas.",
             f"Tareas programadas en canales de materia: {created_tasks_total}.",
             f"Tareas existentes actualizadas por cambios en CVirtual: {updated_tasks_total}.",
         ]
+        if page_cache and page_cache["requests"]:
+            summary_lines.append(
+                f"Caché de páginas: {page_cache['hit_ratio'] * 100:.0f}% sin cambios, "
+                f"{page_cache['parse_skipped']} parseos evitados, {page_cache['bytes_saved'] / 1024:.1f} KB ahorrados."
+            )
 
         if already_assigned_items:
             summary_lines.append("\nTareas ya asignadas (mostradas solo para ti):")
@@ -193,18 +422,16 @@ class CourseWatcher(commands.GroupCog, group_name="tareas", group_description="E
 
         await interaction.followup.send("\n".join(summary_lines), ephemeral=True)
 
-    def _current_day_key(self):
-        return datetime.datetime.now(self.timezone).strftime("%Y-%m-%d")
-
     async def _scan_and_notify(
         self,
         guild: discord.Guild,
         requested_week: int | None = None,
         command_user_id: int | None = None,
+        scan_token: str | None = None,
     ) -> dict:
         async with self.scan_lock:
             channel = self._resolve_updates_channel(guild)
-            scan_result = await self._scan_courses_for_guild(guild.id, requested_week=requested_week)
+            scan_result = await self._scan_courses_for_guild(guild.id, requested_week=requested_week, scan_token=scan_token)
             new_items = scan_result["new_items"]
             detected_items = scan_result["detected_items"]
 
@@ -231,116 +458,260 @@ class CourseWatcher(commands.GroupCog, group_name="tareas", group_description="E
                 "auth_failed": bool(scan_result.get("auth_failed")),
                 "already_assigned": task_report["already_assigned"],
                 "blocked": bool(scan_result.get("blocked")),
+                "scan_duration_ms": scan_result.get("duration_ms", 0),
+                "page_cache": scan_result.get("page_cache"),
             }
 
-    async def _scan_courses_for_guild(self, guild_id: int, requested_week: int | None = None):
+    async def _scan_courses_for_guild(self, guild_id: int, requested_week: int | None = None, scan_token: str | None = None):
         new_items = []
         detected_items = []
-        scan_blocked = False
 
-        timeout = aiohttp.ClientTimeout(total=30, connect=10, sock_connect=10, sock_read=25)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            authenticated, use_manual_cookie_for_scan = await self._authenticate_session(session)
-            if not authenticated:
-                return {
-                    "new_items": [],
-                    "detected_items": [],
-                    "auth_failed": True,
-                    "blocked": False,
-                }
+        scan = await self._get_course_scan(requested_week, scan_token)
+        if scan["auth_failed"]:
+            return {
+                "new_items": [],
+                "detected_items": [],
+                "auth_failed": True,
+                "blocked": False,
+            }
 
-            for course_name, course_url in COURSES.items():
-                if scan_blocked:
-                    break
+        # Fusión en el orden de COURSES (determinista sin importar qué curso terminó antes);
+        # una sola transacción por curso y solo los hashes insertados son novedades. Copias por
+        # servidor: el resultado en caché se comparte entre todos.
+        course_results = scan["course_results"]
+        for course_name in COURSES:
+            if course_results.get(course_name) is None:
+                continue
+            items = [dict(item) for item in course_results[course_name]]
+            detected_items.extend(items)
+            hashed_items = []
+            for item in items:
+                hashed_items.append({**item, "item_hash": self._hash_item(item)})
+            new_hashes = await self.bot.db.add_course_watch_items_bulk(hashed_items, guild_id)
+            for item, hashed_item in zip(items, hashed_items):
+                item_hash = hashed_item["item_hash"]
+                if item_hash in new_hashes:
+                    new_hashes.discard(item_hash)
+                    new_items.append(item)
 
-                html, blocked = await self._fetch_course_html(
+        return {
+            "new_items": new_items,
+            "detected_items": detected_items,
+            "auth_failed": False,
+            "blocked": scan["blocked"],
+            "duration_ms": scan["duration_ms"],
+            "page_cache": scan.get("page_cache"),
+        }
+
+    # Los cursos son globales: un escaneo por (cursos, semana, token) se reutiliza para todos los
+    # servidores de un mismo reparto (el slot programado o una ejecución de /tareas nuevas). Se guarda
+    # la tarea en curso, así que servidores concurrentes esperan el mismo escaneo en lugar de repetirlo.
+    # Sin token se escanea siempre.
+    async def _get_course_scan(self, requested_week: int | None = None, scan_token: str | None = None) -> dict:
+        if scan_token is None:
+            return await self._scan_courses(requested_week)
+
+        cache = self._scan_cache
+        key = (tuple(COURSES.items()), requested_week, scan_token)
+        scan_task = cache.get(key)
+        if scan_task is not None and scan_task.done() and (scan_task.cancelled() or scan_task.exception() is not None):
+            scan_task = None
+        if scan_task is None:
+            scan_task = asyncio.ensure_future(self._scan_courses(requested_week))
+            cache[key] = scan_task
+        else:
+            logger.info("Reutilizando el escaneo de cursos de %s (semana %s)", scan_token, requested_week or "actual")
+        scan = await asyncio.shield(scan_task)
+        # Un fallo de autenticación o un bloqueo no se comparten: el siguiente servidor lo reintenta
+        if (scan["auth_failed"] or scan["blocked"]) and cache.get(key) is scan_task:
+            del cache[key]
+        return scan
+
+    # Soltar los escaneos de un reparto terminado
+    def _forget_course_scans(self, scan_token: str):
+        for key in [key for key in self._scan_cache if key[2] == scan_token]:
+            del self._scan_cache[key]
+
+    async def _scan_courses(self, requested_week: int | None = None) -> dict:
+        started = time.perf_counter()
+        # Métricas propias de este escaneo: otro escaneo simultáneo (otra semana, un pre-calentamiento
+        # o un re-login) no las mezcla ni las reinicia
+        page_stats = self._new_page_stats()
+        session = await self._get_http_session()
+        authenticated, use_manual_cookie_for_scan = await self._ensure_authenticated(session)
+        if not authenticated:
+            return {"course_results": {}, "auth_failed": True, "blocked": False, "duration_ms": 0}
+
+        course_results, scan_blocked = await self._scan_courses_concurrently(
+            session,
+            requested_week,
+            use_manual_cookie_for_scan,
+            page_stats=page_stats,
+        )
+
+        duration_ms = round((time.perf_counter() - started) * 1000, 1)
+        page_cache = self._page_cache_report(page_stats)
+        logger.info(
+            "Escaneo de cursos: %s/%s cursos en %.1f ms (concurrencia %s, %s por host)%s. "
+            "Caché de páginas: %s peticiones, %s sin cambios (304), %s con el mismo contenido, "
+            "%s parseos evitados, %.0f%% aciertos, %.1f KB ahorrados",
+            len(course_results),
+            len(COURSES),
+            duration_ms,
+            self._scan_concurrency(),
+            self._per_host_concurrency(),
+            " - bloqueado" if scan_blocked else "",
+            page_cache["requests"],
+            page_cache["not_modified"],
+            page_cache["unchanged"],
+            page_cache["parse_skipped"],
+            page_cache["hit_ratio"] * 100,
+            page_cache["bytes_saved"] / 1024,
+        )
+        return {
+            "course_results": course_results,
+            "auth_failed": False,
+            "blocked": scan_blocked,
+            "duration_ms": duration_ms,
+            "page_cache": page_cache,
+        }
+
+    def _scan_concurrency(self) -> int:
+        return max(1, _env_int("COURSE_SCAN_CONCURRENCY", DEFAULT_SCAN_CONCURRENCY))
+
+    def _per_host_concurrency(self) -> int:
+        return max(1, _env_int("COURSE_SCAN_PER_HOST", DEFAULT_PER_HOST_CONCURRENCY))
+
+    # Semáforo de cortesía por host: limita las peticiones simultáneas a CVirtual sin importar
+    # cuántos cursos se estén escaneando a la vez
+    def _host_slot(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc.lower()
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self._per_host_concurrency())
+            self._host_semaphores[host] = semaphore
+        return semaphore
+
+    # Ejecutar el pipeline de cada curso en paralelo (como máximo COURSE_SCAN_CONCURRENCY a la vez).
+    # Devuelve {curso: items} de los cursos completos y si hubo bloqueo; un bloqueo en cualquier curso
+    # cancela los demás, igual que el recorrido secuencial se detenía en el primero.
+    async def _scan_courses_concurrently(self, session, requested_week, use_manual_cookie, page_stats=None):
+        course_slots = asyncio.Semaphore(self._scan_concurrency())
+
+        async def scan_course(course_name, course_url):
+            async with course_slots:
+                return await self._scan_course(
                     session,
+                    course_name,
                     course_url,
-                    use_manual_cookie=use_manual_cookie_for_scan,
+                    requested_week,
+                    use_manual_cookie,
+                    page_stats=page_stats,
                 )
-                if blocked:
-                    scan_blocked = True
-                    break
-                if not html:
-                    continue
 
-                target_week = await asyncio.to_thread(
-                    self._resolve_target_week_from_html,
-                    html,
-                    course_url,
-                    requested_week,
+        pending = {
+            asyncio.create_task(scan_course(course_name, course_url)): course_name
+            for course_name, course_url in COURSES.items()
+        }
+        course_names = dict(pending)
+        results = {}
+        scan_blocked = False
+        try:
+            while pending and not scan_blocked:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    course_name = pending.pop(task)
+                    try:
+                        items, blocked = task.result()
+                    except Exception:
+                        logger.exception("Error escaneando el curso %s", course_name)
+                        continue
+                    if blocked:
+                        scan_blocked = True
+                    elif items is not None:
+                        results[course_name] = items
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+                logger.info(
+                    "Escaneo cancelado por bloqueo: %s",
+                    ", ".join(course_names[task] for task in pending),
                 )
+        return results, scan_blocked
 
-                target_url = course_url
-                target_week_name = None
-                target_html = html
-
-                if target_week:
-                    target_url = target_week["week_url"]
-                    target_week_name = target_week["week_name"]
-                    if target_url != course_url:
-                        section_html, section_blocked = await self._fetch_course_html(
-                            session,
-                            target_url,
-                            use_manual_cookie=use_manual_cookie_for_scan,
-                        )
-                        if section_blocked:
-                            scan_blocked = True
-                            break
-                        if section_html:
-                            target_html = section_html
-
-                if scan_blocked:
-                    break
-
-                items = await asyncio.to_thread(
-                    self._extract_activities,
-                    course_name,
+    # Pipeline de un curso: portada, sección de la semana y detalles de cada tarea (en paralelo).
+    # Devuelve (items, bloqueado); items es None si la portada no cargó.
+    async def _scan_course(self, session, course_name, course_url, requested_week, use_manual_cookie, page_stats=None):
+        html, blocked = await self._fetch_course_html(
+            session,
+            course_url,
+            use_manual_cookie=use_manual_cookie,
+            page_stats=page_stats,
+        )
+        if blocked:
+            return None, True
+        if not html:
+            return None, False
+
+        target_week = await self._parse_once(
+            "semana",
+            html,
+            self._resolve_target_week_from_html,
+            course_url,
+            requested_week,
+            page_stats=page_stats,
+        )
+
+        target_url = course_url
+        target_week_name = None
+        target_html = html
+
+        if target_week:
+            target_url = target_week["week_url"]
+            target_week_name = target_week["week_name"]
+            if target_url != course_url:
+                section_html, section_blocked = await self._fetch_course_html(
+                    session,
                     target_url,
-                    target_html,
-                    target_week_name,
+                    use_manual_cookie=use_manual_cookie,
+                    page_stats=page_stats,
                 )
+                if section_blocked:
+                    return None, True
+                if section_html:
+                    target_html = section_html
+
+        items = await self._parse_once(
+            "actividades",
+            target_html,
+            self._extract_activities_from_html,
+            course_name,
+            target_url,
+            target_week_name,
+            page_stats=page_stats,
+        )
 
-                task_interrupted = False
-                for item in items:
-                    if item["activity_type"] == "TAREA":
-                        details = await self._extract_assignment_details(
-                            session,
-                            item["url"],
-                            use_manual_cookie=use_manual_cookie_for_scan,
-                        )
-                        if details.get("blocked"):
-                            scan_blocked = True
-                            task_interrupted = True
-                            break
-                        item["due_date"] = details["due_date"]
-                        item["instructions"] = details["instructions"]
-
-                    detected_items.append(item)
-
-                if scan_blocked or task_interrupted:
-                    break
-
-                for item in items:
-                    item_hash = self._hash_item(item)
-                    created = self.bot.db.add_course_watch_item(
-                        item_hash=item_hash,
-                        course_name=item["course_name"],
-                        week_name=item["week_name"],
-                        activity_type=item["activity_type"],
-                        title=item["title"],
-                        url=item["url"],
-                        guild_id=guild_id,
-                    )
-                    if created:
-                        new_items.append(item)
+        assignments = [item for item in items if item["activity_type"] == "TAREA"]
+        details_list = await asyncio.gather(
+            *(
+                self._extract_assignment_details(
+                    session,
+                    item["url"],
+                    use_manual_cookie=use_manual_cookie,
+                    page_stats=page_stats,
+                )
+                for item in assignments
+            )
+        )
+        for item, details in zip(assignments, details_list):
+            if details.get("blocked"):
+                return None, True
+            item["due_date"] = details["due_date"]
+            item["instructions"] = details["instructions"]
 
-        return {
-            "new_items": new_items,
-            "detected_items": detected_items,
-            "auth_failed": False,
-            "blocked": scan_blocked,
-        }
+        return items, False
 
     async def _schedule_detected_tasks(self, guild: discord.Guild, items: list[dict], command_user_id: int | None = None):
         created_tasks = 0
@@ -357,11 +728,11 @@ class CourseWatcher(commands.GroupCog, group_name="tareas", group_description="E
         if not items:
             return {"created_tasks": 0, "updated_tasks": 0, "already_assigned": []}
 
-        tasks_cache = self.bot.db.get_tasks(guild.id)
+        tasks_cache = await self.bot.db.get_tasks(guild.id)
         existing_by_key = {}
         for task in tasks_cache:
-            subject = (task[1] or "").strip().lower()
-            normalized_title = self._normalize_task_title(task[2] or "")
+            subject = (task.subject or "").strip().lower()
+            normalized_title = self._normalize_task_title(task.title or "")
             existing_by_key[(subject, normalized_title)] = task
 
         actor_id = command_user_id or getattr(self.bot.user, "id", 0) or 0
@@ -386,21 +757,23 @@ class CourseWatcher(commands.GroupCog, group_name="tareas", group_description="E
             existing_task = existing_by_key.get(task_key)
 
             if existing_task:
-                task_id = existing_task[0]
-                current_subject = existing_task[1] or ""
-                current_title = existing_task[2] or ""
-                current_due = existing_task[3] or ""
+                task_id = existing_task.id
+                current_subject = existing_task.subject or ""
+                current_title = existing_task.title or ""
+                current_due = existing_task.due_date or ""
 
                 should_update_title = current_title.strip() != title.strip()
                 should_update_subject = current_subject.strip() != subject.strip()
                 should_update_due = current_due.strip() != due_date.strip()
+                should_update_instructions = bool(instructions) and (existing_task.instructions or "").strip() != instructions.strip()
 
-                if should_update_title or should_update_subject or should_update_due:
-                    self.bot.db.update_task(
+                if should_update_title or should_update_subject or should_update_due or should_update_instructions:
+                    await self.bot.db.update_task(
                         task_id,
                         title=title if should_update_title else None,
                         due_date=due_date if should_update_due else None,
                         subject=subject if should_update_subject else None,
+                        instructions=instructions if should_update_instructions else None,
                     )
 
                     await self._refresh_task_messages(
@@ -439,12 +812,13 @@ class CourseWatcher(commands.GroupCog, group_name="tareas", group_description="E
                     target_channel,
                     content="@everyone 📥 **Nueva tarea detectada automáticamente**",
                     embed=embed,
+                    view=TaskCompletionView(),
                     allowed_mentions=discord.AllowedMentions(everyone=True),
                 )
             except Exception:
                 continue
 
-            task_id = self.bot.db.add_task(
+            task_id = await self.bot.db.add_task(
                 subject,
                 title,
                 due_date,
@@ -454,8 +828,9 @@ class CourseWatcher(commands.GroupCog, group_name="tareas", group_description="E
                 target_channel.id,
                 1,
                 source_url=source_url,
+                instructions=instructions,
             )
-            self.bot.db.add_task_message(task_id, target_channel.id, msg.id)
+            await get_task_message_index(self.bot).add(task_id, target_channel.id, msg.id)
 
             embed.set_footer(text=f"ID: {task_id} | Estado: Pendiente")
             try:
@@ -466,23 +841,20 @@ class CourseWatcher(commands.GroupCog, group_name="tareas", group_description="E
             dates_channel = resolve_channel("fechas-de-entrega")
             if dates_channel:
                 try:
-                    date_msg = await self._send_with_channel_delay(dates_channel, embed=embed)
-                    self.bot.db.add_task_message(task_id, dates_channel.id, date_msg.id)
+                    date_msg = await self._send_with_channel_delay(dates_channel, embed=embed, view=TaskCompletionView())
+                    await get_task_message_index(self.bot).add(task_id, dates_channel.id, date_msg.id)
                 except Exception:
                     pass
 
             created_tasks += 1
-            existing_by_key[task_key] = (
-                task_id,
-                subject,
-                title,
-                due_date,
-                None,
-                None,
-                None,
-                None,
-                None,
-                None,
+            existing_by_key[task_key] = TaskRow(
+                id=task_id,
+                subject=subject,
+                title=title,
+                due_date=due_date,
+                guild_id=guild.id,
+                source_url=source_url,
+                instructions=instructions,
             )
 
         return {
@@ -531,7 +903,7 @@ class CourseWatcher(commands.GroupCog, group_name="tareas", group_description="E
         source_url: str | None = None,
         instructions: str | None = None,
     ):
-        tracked_messages = self.bot.db.get_task_messages(task_id)
+        tracked_messages = await self.bot.db.get_task_messages(task_id)
         if not tracked_messages:
             return
 
@@ -559,8 +931,14 @@ class CourseWatcher(commands.GroupCog, group_name="tareas", group_description="E
         session: aiohttp.ClientSession,
         assignment_url: str,
         use_manual_cookie: bool = True,
+        page_stats: dict | None = None,
     ):
-        html, blocked = await self._fetch_course_html(session, assignment_url, use_manual_cookie=use_manual_cookie)
+        html, blocked = await self._fetch_course_html(
+            session,
+            assignment_url,
+            use_manual_cookie=use_manual_cookie,
+            page_stats=page_stats,
+        )
         if not html:
             return {
                 "due_date": "No asignada",
@@ -568,9 +946,11 @@ class CourseWatcher(commands.GroupCog, group_name="tareas", group_description="E
                 "blocked": bool(blocked),
             }
 
-        detected_due_date, detected_instructions = await asyncio.gather(
-            asyncio.to_thread(self._extract_due_date_from_html, html),
-            asyncio.to_thread(self._extract_instructions_from_html, html),
+        detected_due_date, detected_instructions = await self._parse_once(
+            "tarea",
+            html,
+            self._parse_assignment_html,
+            page_stats=page_stats,
         )
         return {
             "due_date": detected_due_date or "No asignada",
@@ -578,6 +958,13 @@ class CourseWatcher(commands.GroupCog, group_name="tareas", group_description="E
             "blocked": False,
         }
 
+    # Mismo parseo que _extract_activities con el HTML primero, como espera _parse_once
+    def _extract_activities_from_html(self, html: str, course_name: str, course_url: str, forced_week_name: str | None = None):
+        return self._extract_activities(course_name, course_url, html, forced_week_name)
+
+    def _parse_assignment_html(self, html: str):
+        return self._extract_due_date_from_html(html), self._extract_instructions_from_html(html)
+
     def _resolve_target_week_from_html(self, html: str, course_url: str, requested_week: int | None = None):
         soup = BeautifulSoup(html, "html.parser")
         return self._resolve_target_week(soup, course_url, requested_week=requested_week)
@@ -744,15 +1131,21 @@ class CourseWatcher(commands.GroupCog, group_name="tareas", group_description="E
         session: aiohttp.ClientSession,
         url: str,
         use_manual_cookie: bool = True,
+        relogin: bool = True,
+        page_stats: dict | None = None,
     ) -> tuple[str, bool]:
+        auth_generation = self._auth_generation
+        cached_page = await self._load_cached_page(url)
         request_kwargs = self._cookie_request_kwargs(use_manual_cookie=use_manual_cookie)
         response_data = await self._request_text_with_retry(
             session,
             "GET",
             url,
             use_manual_cookie=use_manual_cookie,
+            cached_page=cached_page,
             **request_kwargs,
         )
+        self._count_page(page_stats, "requests")
         if not response_data["ok"]:
             blocked = response_data.get("blocked", False)
             logger.warning("No se pudo cargar %s: %s", url, response_data.get("reason"))
@@ -760,10 +1153,107 @@ class CourseWatcher(commands.GroupCog, group_name="tareas", group_description="E
 
         final_url = response_data["final_url"]
         if "login/index.php" in final_url:
+            # Sesión reutilizada que expiró: iniciar sesión y reintentar una vez
+            if relogin:
+                authenticated, use_manual_cookie = await self._relogin_after_redirect(session, auth_generation)
+                if authenticated:
+                    return await self._fetch_course_html(
+                        session,
+                        url,
+                        use_manual_cookie=use_manual_cookie,
+                        relogin=False,
+                        page_stats=page_stats,
+                    )
             logger.warning("Redirigido a login al cargar %s", url)
             return "", False
 
-        return response_data["text"], False
+        if response_data.get("not_modified"):
+            self._count_page(page_stats, "not_modified")
+            self._count_page(page_stats, "bytes_saved", cached_page["size"])
+            return cached_page["text"], False
+
+        text = response_data["text"]
+        content_hash = self._content_hash(text)
+        validators = (response_data.get("etag"), response_data.get("last_modified"))
+        if cached_page and cached_page["content_hash"] == content_hash:
+            self._count_page(page_stats, "unchanged")
+            if validators == (cached_page["etag"], cached_page["last_modified"]):
+                return text, False
+        await self._store_cached_page(url, validators, content_hash, text)
+        return text, False
+
+    @staticmethod
+    def _content_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _conditional_headers(cached_page: dict) -> dict:
+        headers = {}
+        if cached_page.get("etag"):
+            headers["If-None-Match"] = cached_page["etag"]
+        if cached_page.get("last_modified"):
+            headers["If-Modified-Since"] = cached_page["last_modified"]
+        return headers
+
+    async def _load_cached_page(self, url: str) -> dict | None:
+        try:
+            row = await self.bot.db.get_cached_page(url)
+            if row is None:
+                return None
+            etag, last_modified, content_hash, body = row
+            text = zlib.decompress(body).decode("utf-8")
+        except Exception:
+            logger.exception("No se pudo leer la página en caché de %s", url)
+            return None
+        return {
+            "etag": etag,
+            "last_modified": last_modified,
+            "content_hash": content_hash,
+            "text": text,
+            "size": len(text.encode("utf-8")),
+        }
+
+    async def _store_cached_page(self, url: str, validators: tuple, content_hash: str, text: str):
+        etag, last_modified = validators
+        try:
+            body = await asyncio.to_thread(zlib.compress, text.encode("utf-8"), PAGE_CACHE_COMPRESS_LEVEL)
+            await self.bot.db.save_cached_page(url, etag, last_modified, content_hash, body)
+        except Exception:
+            logger.exception("No se pudo guardar la página en caché de %s", url)
+
+    # Métricas de la caché de páginas de un escaneo; cada escaneo crea las suyas y las pasa por el
+    # pipeline. Las peticiones sin métricas (pre-calentamiento, re-login) no se cuentan.
+    @staticmethod
+    def _new_page_stats() -> dict:
+        return {"requests": 0, "not_modified": 0, "unchanged": 0, "parse_skipped": 0, "bytes_saved": 0}
+
+    @staticmethod
+    def _count_page(page_stats: dict | None, stat: str, amount: int = 1):
+        if page_stats is not None:
+            page_stats[stat] += amount
+
+    @staticmethod
+    def _page_cache_report(page_stats: dict) -> dict:
+        stats = dict(page_stats)
+        requests = stats["requests"]
+        hits = stats["not_modified"] + stats["unchanged"]
+        stats["hit_ratio"] = round(hits / requests, 3) if requests else 0.0
+        return stats
+
+    # Parsear una página solo si su contenido cambió: el resultado se reutiliza por (tipo, hash, argumentos).
+    # Se devuelven copias porque el escaneo completa los items con fecha e instrucciones.
+    async def _parse_once(self, kind: str, html: str, parse, *args, page_stats: dict | None = None):
+        parsed_pages = self._parsed_pages
+        key = (kind, self._content_hash(html), args)
+        if key in parsed_pages:
+            parsed_pages.move_to_end(key)
+            self._count_page(page_stats, "parse_skipped")
+            return copy.deepcopy(parsed_pages[key])
+        result = await asyncio.to_thread(parse, html, *args)
+        parsed_pages[key] = copy.deepcopy(result)
+        while len(parsed_pages) > MAX_PARSED_PAGES:
+            parsed_pages.popitem(last=False)
+        return result
 
     async def _request_text_with_retry(
         self,
@@ -772,20 +1262,34 @@ class CourseWatcher(commands.GroupCog, group_name="tareas", group_description="E
         url: str,
         use_manual_cookie: bool = True,
         max_attempts: int = 4,
+        cached_page: dict | None = None,
         **kwargs,
     ) -> dict:
         last_reason = "error-desconocido"
+        connection_failed = False
 
         for attempt in range(1, max_attempts + 1):
             try:
                 request_kwargs = dict(kwargs)
                 if "headers" not in request_kwargs:
                     request_kwargs.update(self._cookie_request_kwargs(use_manual_cookie=use_manual_cookie))
+                if cached_page:
+                    request_kwargs["headers"] = {**request_kwargs.get("headers", {}), **self._conditional_headers(cached_page)}
 
-                async with session.request(method.upper(), url, **request_kwargs) as response:
+                async with self._host_slot(url), session.request(method.upper(), url, **request_kwargs) as response:
                     status = response.status
                     final_url = str(response.url)
+                    # Sin cambios desde la versión en caché: el cuerpo no viaja
+                    if status == 304 and cached_page:
+                        return {
+                            "ok": True,
+                            "text": cached_page["text"],
+                            "status": status,
+                            "final_url": url,
+                            "not_modified": True,
+                        }
                     text = await response.text()
+                    headers = getattr(response, "headers", None) or {}
 
                     if self._is_cloudflare_or_error_page(text):
                         last_reason = "cloudflare-bloqueo"
@@ -805,6 +1309,8 @@ class CourseWatcher(commands.GroupCog, group_name="tareas", group_description="E
                             "text": text,
                             "status": status,
                             "final_url": final_url,
+                            "etag": headers.get("ETag"),
+                            "last_modified": headers.get("Last-Modified"),
                         }
 
                     retryable = status in {403, 408, 425, 429, 500, 502, 503, 504}
@@ -821,6 +1327,7 @@ class CourseWatcher(commands.GroupCog, group_name="tareas", group_description="E
                     }
             except (aiohttp.ClientError, asyncio.TimeoutError) as error:
                 last_reason = f"{type(error).__name__}"
+                connection_failed = isinstance(error, aiohttp.ClientConnectionError)
                 if attempt < max_attempts:
                     await self._sleep_backoff(attempt)
                     continue
@@ -831,6 +1338,9 @@ class CourseWatcher(commands.GroupCog, group_name="tareas", group_description="E
                     await self._sleep_backoff(attempt)
                     continue
 
+        # Conexiones que fallan en todos los intentos (o una sesión cerrada) invalidan el pool compartido
+        if connection_failed or getattr(session, "closed", False):
+            self._http_session_broken = True
         return {
             "ok": False,
             "blocked": False,
@@ -0,0 +1,108 @@
+import logging
+
+from discord.ext import commands
+
+from database.db_handler import read_enrollment_csv
+from database.instrumentation import QUERY_STATS
+from utils.config import SUBJECTS_MAP
+
+# Tamaño máximo del CSV de inscripciones aceptado como adjunto
+MAX_ENROLLMENT_CSV_BYTES = 2 * 1024 * 1024
+# Límite de caracteres de un mensaje de Discord menos el bloque de código
+MAX_REPORT_CHARS = 1900
+# Tareas archivadas listadas por consulta
+ARCHIVE_RESULTS_LIMIT = 15
+
+
+class DatabaseAdmin(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.logger = logging.getLogger("s4vi.database_admin")
+
+    # Comando administrativo: resumen de métricas de consultas SQLite
+    @commands.command(name="dbstats")
+    @commands.has_permissions(administrator=True)
+    async def dbstats(self, ctx, limit: int = 10):
+        report = QUERY_STATS.format_report(limit=max(1, min(limit, 25)))
+        if len(report) > MAX_REPORT_CHARS:
+            report = report[:MAX_REPORT_CHARS] + "\n..."
+        await ctx.send(f"```\n{report}\n```")
+
+    # Reiniciar los contadores (p. ej. antes de medir un cambio)
+    @commands.command(name="dbstats-reset")
+    @commands.has_permissions(administrator=True)
+    async def dbstats_reset(self, ctx):
+        QUERY_STATS.reset()
+        self.logger.info("Métricas de consultas reiniciadas por %s", ctx.author)
+        await ctx.send("Métricas de consultas reiniciadas.")
+
+    # Alta masiva de inscripciones desde un CSV adjunto (columnas: user_id, materia)
+    @commands.command(name="importar-inscripciones")
+    @commands.has_permissions(administrator=True)
+    async def importar_inscripciones(self, ctx, modo: str = ""):
+        if not ctx.message.attachments:
+            await ctx.send("Adjunte un archivo CSV con columnas `user_id,materia`.")
+            return
+
+        attachment = ctx.message.attachments[0]
+        if attachment.size > MAX_ENROLLMENT_CSV_BYTES:
+            await ctx.send("El archivo supera el tamaño permitido.")
+            return
+
+        text = (await attachment.read()).decode("utf-8-sig", errors="replace")
+        rows, skipped = read_enrollment_csv(text)
+
+        # Aceptar el nombre visible o el nombre interno de la materia
+        internal_by_name = {label.lower(): subject for label, subject in SUBJECTS_MAP.items()}
+        internal_by_name.update({subject.lower(): subject for subject in SUBJECTS_MAP.values()})
+        resolved = []
+        unknown = set()
+        for user_id, subject in rows:
+            internal = internal_by_name.get(subject.lower())
+            if internal is None:
+                unknown.add(subject)
+                skipped += 1
+                continue
+            resolved.append((user_id, internal))
+
+        result = await self.bot.db.import_enrollments(resolved, ctx.guild.id, replace=modo.lower() == "reemplazar")
+        msg = (
+            f"Inscripciones importadas: {result['users']} usuarios, "
+            f"{result['added']} agregadas, {result['removed']} eliminadas, {skipped} filas omitidas."
+        )
+        if unknown:
+            msg += f"\nMaterias no reconocidas: {', '.join(sorted(unknown))[:500]}"
+        self.logger.info("Importación de inscripciones en %s: %s", ctx.guild.id, result)
+        await ctx.send(msg)
+
+    # Consultar el archivo de tareas vencidas: sin argumento lista las más recientes,
+    # con un ID muestra su detalle y con texto busca por título, materia o indicaciones
+    @commands.command(name="archivo")
+    @commands.has_permissions(administrator=True)
+    async def archivo(self, ctx, *, consulta: str = ""):
+        consulta = consulta.strip()
+        if consulta.lstrip("#").isdigit():
+            archived = await self.bot.db.get_archived_task(int(consulta.lstrip("#")))
+            if archived is None or archived["task"].guild_id != ctx.guild.id:
+                await ctx.send("La tarea no está en el archivo.")
+                return
+            task = archived["task"]
+            await ctx.send(
+                f"#{task.id} [{task.subject}] {task.title}\n"
+                f"Entrega: {task.due_date} | Mensajes: {len(archived['messages'])} | "
+                f"Entregas registradas: {len(archived['delivered_by'])}"
+            )
+            return
+
+        tasks = await self.bot.db.get_archived_tasks(ctx.guild.id, query=consulta or None, limit=ARCHIVE_RESULTS_LIMIT)
+        if not tasks:
+            await ctx.send("No hay tareas archivadas que coincidan.")
+            return
+        report = "\n".join(f"#{task.id} [{task.subject}] {task.title[:80]} — {task.due_date}" for task in tasks)
+        if len(report) > MAX_REPORT_CHARS:
+            report = report[:MAX_REPORT_CHARS] + "\n..."
+        await ctx.send(f"```\n{report}\n```")
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(DatabaseAdmin(bot))
@@ -1,14 +1,36 @@
 # deliveries.py - Gestión de entregas de tareas
+import logging
+
 import discord
 from discord import app_commands
 from discord.ext import commands
 from utils.config import SUBJECTS, CHANNELS
 from utils.embeds import create_success_embed, create_error_embed
+from utils.rate_limiter import task_autocomplete_limit
+from utils.task_completion import COMPLETE_EMOJI, TaskCompletionView, complete_task_from_message
+
+logger = logging.getLogger("s4vi.deliveries")
 
 class Deliveries(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
 
+    # Registrar la vista persistente para que los botones de mensajes anteriores sigan respondiendo
+    async def cog_load(self):
+        self.bot.add_view(TaskCompletionView())
+
+    # Reaccionar ✅ en cualquier mensaje rastreado de una tarea la marca como entregada.
+    # Evento raw: funciona aunque el mensaje no esté en la caché del cliente.
+    @commands.Cog.listener()
+    async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
+        if payload.guild_id is None or str(payload.emoji) != COMPLETE_EMOJI:
+            return
+        if self.bot.user is not None and payload.user_id == self.bot.user.id:
+            return
+        task = await complete_task_from_message(self.bot, payload.guild_id, payload.user_id, payload.message_id)
+        if task is not None:
+            logger.info("Tarea %s marcada como entregada por reacción de %s", task.id, payload.user_id)
+
     # Registrar la entrega de una tarea por parte de un usuario
     @app_commands.command(name="completar-tarea", description="Marcar una tarea como completada")
     @app_commands.describe(
@@ -30,23 +52,23 @@ class Deliveries(commands.Cog):
 
         from utils.config import SUBJECTS_MAP
         internal_subject = SUBJECTS_MAP.get(materia, materia)
-        tasks = self.bot.db.get_tasks(interaction.guild.id)
         target_task = None
 
-        # Extraer el ID de la tarea del input
+        # Extraer el ID de la tarea del input (búsqueda directa por clave primaria)
         if tarea.isdigit():
-            tid = int(tarea)
-            target_task = next((t for t in tasks if t[0] == tid), None)
+            candidate = await self.bot.db.get_task_by_id(int(tarea))
+            if candidate and candidate.guild_id == interaction.guild.id:
+                target_task = candidate
         
         if not target_task:
             await interaction.response.send_message(create_error_embed("Tarea no encontrada."), ephemeral=True)
             return
 
         # Registrar entrega en la base de datos
-        self.bot.db.mark_as_delivered(target_task[0], interaction.user.id, interaction.guild.id)
+        await self.bot.db.mark_as_delivered(target_task.id, interaction.user.id, interaction.guild.id)
 
         # Confirmar éxito
-        embed = create_success_embed(f"Tarea **{target_task[2]}** marcada como entregada.")
+        embed = create_success_embed(f"Tarea **{target_task.title}** marcada como entregada.")
         embed.set_footer(text=f"Usuario: {interaction.user.display_name}")
         await interaction.response.send_message(embed=embed)
 
@@ -57,21 +79,14 @@ class Deliveries(commands.Cog):
 
     # Autocompletado para tareas basado en la materia seleccionada
     @tarea_entregada.autocomplete('tarea')
+    @task_autocomplete_limit
     async def tarea_autocomplete(self, interaction: discord.Interaction, current: str):
         materia_sel = interaction.namespace.materia
         from utils.config import SUBJECTS_MAP
         internal_subject = SUBJECTS_MAP.get(materia_sel, "")
         
-        tasks = self.bot.db.get_tasks(interaction.guild.id)
-        choices = []
-        for t in tasks:
-            if internal_subject and t[1] != internal_subject:
-                continue
-            
-            label = f"#{t[0]} - {t[2]}"
-            if current.lower() in label.lower():
-                choices.append(app_commands.Choice(name=label, value=str(t[0])))
-        return choices[:25]
+        tasks = await self.bot.db.search_tasks(interaction.guild.id, current, subject=internal_subject or None, limit=25)
+        return [app_commands.Choice(name=f"#{t.id} - {t.title}"[:100], value=str(t.id)) for t in tasks]
 
 async def setup(bot):
     await bot.add_cog(Deliveries(bot))
@@ -44,7 +44,7 @@ class Enrollment(commands.Cog):
             return
 
         # Actualizar registros de inscripción en la base de datos
-        self.bot.db.set_enrollments(interaction.user.id, valid_subjects, interaction.guild.id)
+        await self.bot.db.set_enrollments(interaction.user.id, valid_subjects, interaction.guild.id)
 
         msg = msg_header
         if invalid_subjects:
@@ -24,7 +24,8 @@ class Help(commands.Cog):
         student_cmds = (
             "**/mis-tareas**\nLista de tareas próximas no entregadas.\n\n"
             "**/inscribirme** `[materias]`\nSuscripción a materias para recibir recordatorios.\n*Uso: /inscribirme materias: Matemática, Programación*\n\n"
-            "**/completar-tarea** `[materia]` `[tarea]`\nRegistrar entrega de tarea.\n*Uso: Se debe ejecutar en el canal de entregas*"
+            "**/completar-tarea** `[materia]` `[tarea]`\nRegistrar entrega de tarea.\n*Uso: Se debe ejecutar en el canal de entregas. También puedes pulsar el botón o reaccionar ✅ en el mensaje de la tarea*\n\n"
+            "**/buscar-tarea** `[consulta]` `[materia]`\nBúsqueda por título, materia o indicaciones (sin importar tildes)."
         )
         embed.add_field(name="🎓 Estudiantes", value=student_cmds, inline=False)
 
@@ -34,7 +35,11 @@ class Help(commands.Cog):
                 "**/crear-tarea** `[materia]` `[titulo]` `[fecha]`\nCreación de nuevas tareas.\n\n"
                 "**/editar-tarea** `[id]` `[titulo]` `[fecha]`\nModificación de tareas existentes.\n\n"
                 "**/eliminar-tarea** `[id]`\nEliminación permanente de registros.\n\n"
-                "**!sync**\nSincronización manual de la interfaz de comandos."
+                "**!sync**\nSincronización manual de la interfaz de comandos.\n\n"
+                "**!dbstats** `[límite]`\nMétricas de consultas a la base de datos.\n\n"
+                "**!importar-inscripciones** `[reemplazar]`\nInscripción masiva desde un CSV adjunto (`user_id,materia`).\n\n"
+                "**!backup**\nRespaldo inmediato de la base de datos.\n\n"
+                "**!archivo** `[id o búsqueda]`\nConsulta de tareas vencidas archivadas."
             )
             embed.add_field(name="🛡️ Administración / Delegados", value=staff_cmds, inline=False)
 
@@ -0,0 +1,107 @@
+import logging
+import os
+
+from discord.ext import commands, tasks
+
+from utils.leases import get_lease_manager
+
+DEFAULT_INTERVAL_HOURS = 6
+DEFAULT_BACKUP_INTERVAL_HOURS = 24
+
+
+def _interval_hours(name, default, minimum=1):
+    try:
+        return max(minimum, int(os.getenv(name, default)))
+    except ValueError:
+        return default
+
+
+class Maintenance(commands.Cog):
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.logger = logging.getLogger("s4vi.maintenance")
+        self.database_maintenance.change_interval(hours=_interval_hours("DB_MAINTENANCE_INTERVAL_HOURS", DEFAULT_INTERVAL_HOURS))
+        if not self.database_maintenance.is_running():
+            self.database_maintenance.start()
+        # DB_BACKUP_INTERVAL_HOURS=0 desactiva los respaldos programados (el comando !backup sigue disponible)
+        backup_hours = _interval_hours("DB_BACKUP_INTERVAL_HOURS", DEFAULT_BACKUP_INTERVAL_HOURS, minimum=0)
+        if backup_hours:
+            self.database_backup.change_interval(hours=backup_hours)
+            if not self.database_backup.is_running():
+                self.database_backup.start()
+
+    def cog_unload(self):
+        self.database_maintenance.cancel()
+        self.database_backup.cancel()
+
+    # Archivado, retención y compactación periódica de la base de datos
+    @tasks.loop(hours=DEFAULT_INTERVAL_HOURS)
+    async def database_maintenance(self):
+        # Una sola instancia mantiene la base compartida
+        if not await get_lease_manager(self.bot).acquire("mantenimiento-db"):
+            return
+        try:
+            report = await self.bot.db.run_maintenance()
+            deleted = sum(report["deleted"].values())
+            if deleted or report["archived"] or report["pages_freed"]:
+                self.logger.info(
+                    "Mantenimiento: %s tareas archivadas, %s filas purgadas, %s páginas liberadas en %.1f ms",
+                    report["archived"],
+                    deleted,
+                    report["pages_freed"],
+                    report["duration_ms"],
+                )
+        except Exception:
+            self.logger.exception("Fallo en el mantenimiento de base de datos")
+
+    @database_maintenance.before_loop
+    async def before_database_maintenance(self):
+        await self.bot.wait_until_ready()
+
+    # Respaldo en caliente periódico de la base de datos
+    @tasks.loop(hours=DEFAULT_BACKUP_INTERVAL_HOURS)
+    async def database_backup(self):
+        if not await get_lease_manager(self.bot).acquire("respaldo-db"):
+            return
+        try:
+            await self.bot.db.backup()
+        except Exception:
+            self.logger.exception("Fallo en el respaldo programado de la base de datos")
+
+    @database_backup.before_loop
+    async def before_database_backup(self):
+        await self.bot.wait_until_ready()
+
+    # Crear un respaldo a demanda
+    @commands.command(name="backup")
+    @commands.has_permissions(administrator=True)
+    async def backup(self, ctx):
+        try:
+            report = await self.bot.db.backup()
+        except Exception as error:
+            self.logger.exception("Fallo en el respaldo solicitado por %s", ctx.author)
+            await ctx.send(f"El respaldo falló: {error}")
+            return
+
+        if report is None:
+            await ctx.send("El backend de almacenamiento actual no admite respaldos.")
+            return
+        await ctx.send(
+            f"Respaldo creado en {report['duration_ms']} ms: `{os.path.basename(report['path'])}` "
+            f"({report['pages_copied']} páginas en {report['steps']} pasos, {report['bytes'] / 1024:.1f} KB)."
+        )
+
+    # Ejecutar el mantenimiento a demanda
+    @commands.command(name="mantenimiento-db")
+    @commands.has_permissions(administrator=True)
+    async def mantenimiento_db(self, ctx):
+        report = await self.bot.db.run_maintenance()
+        deleted = ", ".join(f"{table}={count}" for table, count in report["deleted"].items()) or "ninguna"
+        await ctx.send(
+            f"Mantenimiento completado en {report['duration_ms']} ms. Tareas archivadas: {report['archived']}. "
+            f"Filas purgadas: {deleted}. Páginas liberadas: {report['pages_freed']}."
+        )
+
+
+async def setup(bot: commands.Bot):
+    await bot.add_cog(Maintenance(bot))
@@ -3,9 +3,11 @@ import discord
 from discord.ext import tasks, commands
 from utils.config import find_channel
 from utils.embeds import create_reminder_embed
+from utils.leases import get_lease_manager
 import datetime
 import asyncio
 import logging
+import time
 
 
 REMINDER_CHECKS = (
@@ -15,6 +17,10 @@ REMINDER_CHECKS = (
     (0, "final"),
 )
 
+# Ventana consultada en cada tick: tareas vencidas hace <= 30 min hasta el umbral mayor
+REMINDER_LOOKBACK_SECONDS = 30 * 60
+REMINDER_LOOKAHEAD_SECONDS = max(hours for hours, _ in REMINDER_CHECKS) * 3600
+
 class Reminders(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
@@ -30,34 +36,30 @@ class Reminders(commands.Cog):
     @tasks.loop(minutes=1)
     async def check_reminders(self):
         async with self.reminders_lock:
-            for guild in self.bot.guilds:
+            # Con varias instancias, cada una atiende solo los servidores cuyo arrendamiento posee
+            guilds = await get_lease_manager(self.bot).claim_guilds("recordatorios", self.bot.guilds)
+            for guild in guilds:
                 try:
-                    tasks_list = self.bot.db.get_tasks(guild.id)
+                    now_ts = time.time()
+                    tasks_list = await self.bot.db.get_tasks_due_between(
+                        guild.id,
+                        now_ts - REMINDER_LOOKBACK_SECONDS,
+                        now_ts + REMINDER_LOOKAHEAD_SECONDS,
+                        reminders_only=True,
+                    )
                     if not tasks_list:
                         continue
 
-                    now = datetime.datetime.now()
-                    task_ids = [task[0] for task in tasks_list]
-                    sent_reminders = self.bot.db.get_sent_reminders_for_tasks(task_ids)
-                    enrollment_snapshot = self.bot.db.get_enrollment_snapshot(guild.id)
-                    delivered_pairs = self.bot.db.get_delivered_pairs_for_tasks(guild.id, task_ids)
+                    task_ids = [task.id for task in tasks_list]
+                    sent_reminders = await self.bot.db.get_sent_reminders_for_tasks(task_ids)
+                    enrollment_snapshot = await self.bot.db.get_enrollment_snapshot(guild.id)
+                    delivered_pairs = await self.bot.db.get_delivered_pairs_for_tasks(guild.id, task_ids)
                     channel_cache = {}
 
                     for task in tasks_list:
-                        tid, due_date_str = task[0], task[3]
-                        reminders_active = task[8] if len(task) > 8 else 1
-
-                        if not reminders_active:
-                            continue
-
-                        try:
-                            due_date = datetime.datetime.strptime(due_date_str, "%d/%m/%Y %H:%M")
-                        except ValueError:
-                            # Omitir tareas sin fecha asignada o formatos inválidos
-                            continue
-
-                        diff = due_date - now
-                        hours_left = diff.total_seconds() / 3600
+                        tid = task.id
+                        # due_ts ya viene normalizado: sin strptime por fila en cada tick
+                        hours_left = (task.due_ts - now_ts) / 3600
 
                         # Ignorar tareas vencidas
                         if hours_left < -0.5:
@@ -75,7 +77,7 @@ class Reminders(commands.Cog):
                                     delivered_pairs=delivered_pairs,
                                     channel_cache=channel_cache,
                                 )
-                                self.bot.db.mark_reminder_sent(tid, r_type)
+                                await self.bot.db.mark_reminder_sent(tid, r_type)
                                 sent_reminders.add((tid, r_type))
                                 break
                 except Exception:
@@ -91,7 +93,7 @@ class Reminders(commands.Cog):
 
     # Enviar notificación de recordatorio al canal de la materia
     async def send_reminder(self, guild, task, r_type, hours_left, enrollment_snapshot=None, delivered_pairs=None, channel_cache=None):
-        tid, subject, title, due_date_str = task[0], task[1], task[2], task[3]
+        tid, subject, title = task.id, task.subject, task.title
         
         # Localizar el canal designado para la materia
         if channel_cache is None:
@@ -107,10 +109,8 @@ class Reminders(commands.Cog):
             return
 
         # Formatear el tiempo restante preciso
-        now = datetime.datetime.now()
         try:
-            due_date = datetime.datetime.strptime(due_date_str, "%d/%m/%Y %H:%M")
-            diff = due_date - now
+            diff = datetime.timedelta(seconds=task.due_ts - time.time())
             
             days = diff.days
             hours, remainder = divmod(diff.seconds, 3600)
@@ -141,7 +141,7 @@ class Reminders(commands.Cog):
                 continue
 
             if enrollment_snapshot is None:
-                is_enrolled = self.bot.db.is_user_enrolled_in_subject(member.id, subject, guild.id)
+                is_enrolled = await self.bot.db.is_user_enrolled_in_subject(member.id, subject, guild.id)
             else:
                 if member.id in users_with_enrollments:
                     is_enrolled = subject in subjects_by_user.get(member.id, set())
@@ -149,7 +149,7 @@ class Reminders(commands.Cog):
                     is_enrolled = True
 
             if delivered_pairs is None:
-                has_delivered = self.bot.db.is_delivered(tid, member.id)
+                has_delivered = await self.bot.db.is_delivered(tid, member.id)
             else:
                 has_delivered = (tid, member.id) in delivered_lookup
             
@@ -1,6 +1,8 @@
 import logging
 from discord.ext import commands, tasks
 
+from utils.leases import get_lease_manager
+
 
 class Stability(commands.Cog):
     def __init__(self, bot: commands.Bot):
@@ -17,6 +19,7 @@ class Stability(commands.Cog):
         try:
             await self._ensure_course_watcher_loop()
             await self._ensure_reminders_loop()
+            self._ensure_lease_heartbeat()
         except Exception:
             self.logger.exception("Watchdog detectó un error inesperado")
 
@@ -46,6 +49,13 @@ class Stability(commands.Cog):
             self.logger.warning("Watchdog detectó loop scan_courses_task en estado failed; reiniciando")
             loop_task.restart()
 
+    # Sin latido los arrendamientos caducan y otra instancia asumiría este trabajo mientras sigue en curso
+    def _ensure_lease_heartbeat(self):
+        leases = get_lease_manager(self.bot)
+        if leases.db is not None and not leases.is_running():
+            self.logger.warning("Watchdog reiniciando el latido de arrendamientos")
+            leases.start()
+
     async def _ensure_reminders_loop(self):
         cog = self.bot.get_cog("Reminders")
         if cog is None:
@@ -5,11 +5,16 @@ from discord.ext import commands
 from utils.config import SUBJECTS, ROLES, find_channel, SUBJECTS_MAP
 from utils.date_ai import DueDateAI
 from utils.embeds import create_task_embed, create_success_embed
+from utils.rate_limiter import task_autocomplete_limit
+from utils.task_completion import TaskCompletionView, get_task_message_index
 import datetime
 import logging
 
 
 logger = logging.getLogger("s4vi.tasks")
+# Resultados por búsqueda (cada uno es un campo del embed) y opciones por autocompletado (límite de Discord)
+SEARCH_RESULTS_LIMIT = 10
+AUTOCOMPLETE_CHOICES_LIMIT = 25
 
 class Tasks(commands.Cog):
     def __init__(self, bot):
@@ -104,14 +109,14 @@ class Tasks(commands.Cog):
         
         try:
             # Enviar el mensaje y obtener la referencia al mismo
-            original_msg = await interaction.followup.send(embed=embed)
+            original_msg = await interaction.followup.send(embed=embed, view=TaskCompletionView())
             
             # Persistir los datos de la tarea en la base de datos
-            task_id = self.bot.db.add_task(internal_subject, titulo, formatted_date_str, interaction.user.id, 
+            task_id = await self.bot.db.add_task(internal_subject, titulo, formatted_date_str, interaction.user.id, 
                                           interaction.guild.id, original_msg.id, interaction.channel.id, int(recordatorios))
             
-            # Guardar el mensaje original en la tabla de rastreo
-            self.bot.db.add_task_message(task_id, interaction.channel.id, original_msg.id)
+            # Guardar el mensaje original en la tabla de rastreo (y en el índice mensaje -> tarea)
+            await get_task_message_index(self.bot).add(task_id, interaction.channel.id, original_msg.id)
             
             # Actualizar el pie de página con el identificador único de la tarea
             embed.set_footer(text=f"ID: {task_id} | Estado: Pendiente")
@@ -124,8 +129,8 @@ class Tasks(commands.Cog):
         subject_channel = find_channel(interaction.guild, internal_subject)
         if subject_channel:
             try:
-                sub_msg = await subject_channel.send(content=f"🔔 **NUEVA TAREA** para **{materia}**!", embed=embed)
-                self.bot.db.add_task_message(task_id, subject_channel.id, sub_msg.id)
+                sub_msg = await subject_channel.send(content=f"🔔 **NUEVA TAREA** para **{materia}**!", embed=embed, view=TaskCompletionView())
+                await get_task_message_index(self.bot).add(task_id, subject_channel.id, sub_msg.id)
             except discord.errors.Forbidden:
                 await interaction.followup.send(f"No se pudo notificar en {subject_channel.mention} por falta de permisos.")
         
@@ -133,8 +138,8 @@ class Tasks(commands.Cog):
         dates_channel = find_channel(interaction.guild, "fechas-de-entrega")
         if dates_channel:
             try:
-                date_msg = await dates_channel.send(embed=embed)
-                self.bot.db.add_task_message(task_id, dates_channel.id, date_msg.id)
+                date_msg = await dates_channel.send(embed=embed, view=TaskCompletionView())
+                await get_task_message_index(self.bot).add(task_id, dates_channel.id, date_msg.id)
             except Exception:
                 logger.exception("No se pudo notificar tarea %s en canal de fechas", task_id)
 
@@ -145,20 +150,21 @@ class Tasks(commands.Cog):
     # Comando para listar tareas pendientes del usuario local
     @app_commands.command(name="mis-tareas", description="Ver tus tareas pendientes")
     async def tareas_pendientes(self, interaction: discord.Interaction):
-        tasks = self.bot.db.get_tasks(interaction.guild.id)
+        tasks = await self.bot.db.get_tasks(interaction.guild.id)
         if not tasks:
             await interaction.response.send_message("No hay tareas registradas actualmente.", ephemeral=True)
             return
 
-        user_enrollments = self.bot.db.get_user_enrollments(interaction.user.id, interaction.guild.id)
+        user_enrollments = await self.bot.db.get_user_enrollments(interaction.user.id, interaction.guild.id)
+        delivered_pairs = await self.bot.db.get_delivered_pairs_for_tasks(interaction.guild.id, [task.id for task in tasks])
         embed = discord.Embed(title="📋 Tareas Pendientes", color=0x3498db)
         found = False
 
         for task in tasks:
-            tid, subject, title, due_date = task[0], task[1], task[2], task[3]
+            tid, subject, title, due_date = task.id, task.subject, task.title, task.due_date
             
             # Saltar si ya fue entregada o no está inscrito en la materia
-            if self.bot.db.is_delivered(tid, interaction.user.id):
+            if (tid, interaction.user.id) in delivered_pairs:
                 continue
             if user_enrollments and subject not in user_enrollments:
                 continue
@@ -177,6 +183,40 @@ class Tasks(commands.Cog):
         else:
             await interaction.response.send_message(embed=embed)
 
+    # Búsqueda de tareas por título, materia o indicaciones (ignora tildes y mayúsculas)
+    @app_commands.command(name="buscar-tarea", description="Buscar tareas por título, materia o indicaciones")
+    @app_commands.describe(
+        consulta="Palabras a buscar (ej. guía álgebra)",
+        materia="Filtrar por materia (opcional)"
+    )
+    async def tarea_buscar(self, interaction: discord.Interaction, consulta: str, materia: str = None):
+        internal_subject = SUBJECTS_MAP.get(materia, materia) if materia else None
+        tasks = await self.bot.db.search_tasks(
+            interaction.guild.id,
+            consulta,
+            subject=internal_subject,
+            limit=SEARCH_RESULTS_LIMIT,
+        )
+        if not tasks:
+            await interaction.response.send_message("No se encontraron tareas para esa búsqueda.", ephemeral=True)
+            return
+
+        embed = discord.Embed(title=f"🔎 Resultados: {self._clip_text(consulta, 200)}", color=0x3498db)
+        for task in tasks:
+            value = f"**Materia:** {task.subject}\n**Entrega:** {task.due_date}"
+            if task.instructions:
+                value += f"\n{self._clip_text(task.instructions, 200)}"
+            embed.add_field(
+                name=f"#{task.id} - {self._clip_text(task.title, 220)}",
+                value=value,
+                inline=False
+            )
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    @tarea_buscar.autocomplete('materia')
+    async def materia_search_autocomplete(self, interaction: discord.Interaction, current: str):
+        return [app_commands.Choice(name=subj, value=subj) for subj in SUBJECTS if current.lower() in subj.lower()][:25]
+
     # Comando para editar una tarea existente
     @app_commands.command(name="editar-tarea", description="Editar una tarea existente")
     @app_commands.describe(
@@ -196,7 +236,7 @@ class Tasks(commands.Cog):
             await interaction.response.send_message("Formato de ID inválido.", ephemeral=True)
             return
 
-        task_data = self.bot.db.get_task_by_id(task_id)
+        task_data = await self.bot.db.get_task_by_id(task_id)
         if not task_data:
             await interaction.response.send_message("Tarea no encontrada.", ephemeral=True)
             return
@@ -228,11 +268,12 @@ class Tasks(commands.Cog):
             return
 
         # Actualizar registros en la base de datos
-        self.bot.db.update_task(task_id, title=titulo, due_date=new_date)
+        await self.bot.db.update_task(task_id, title=titulo, due_date=new_date)
         
         # Recuperar el conjunto de datos actualizado
-        updated_task = self.bot.db.get_task_by_id(task_id)
-        sub, tit, due, msg_id, chan_id = updated_task[1], updated_task[2], updated_task[3], updated_task[6], updated_task[7]
+        updated_task = await self.bot.db.get_task_by_id(task_id)
+        sub, tit, due = updated_task.subject, updated_task.title, updated_task.due_date
+        msg_id, chan_id = updated_task.message_id, updated_task.channel_id
 
         # Actualizar el mensaje de anuncio original si es accesible
         if msg_id and chan_id:
@@ -240,7 +281,13 @@ class Tasks(commands.Cog):
                 channel = self.bot.get_channel(chan_id)
                 if channel:
                     msg = await channel.fetch_message(msg_id)
-                    new_embed = create_task_embed(tit, sub, due)
+                    new_embed = create_task_embed(
+                        tit,
+                        sub,
+                        due,
+                        source_url=updated_task.source_url,
+                        instructions=updated_task.instructions,
+                    )
                     new_embed.set_author(name=msg.embeds[0].author.name if msg.embeds else "S4VI Bot")
                     new_embed.set_footer(text=f"ID: {task_id} | Estado: Pendiente")
                     await msg.edit(embed=new_embed)
@@ -250,14 +297,25 @@ class Tasks(commands.Cog):
         await interaction.followup.send(embed=create_success_embed(f"Tarea #{task_id} actualizada correctamente."), ephemeral=True)
 
     @tarea_editar.autocomplete('tarea')
+    @task_autocomplete_limit
     async def task_edit_autocomplete(self, interaction: discord.Interaction, current: str):
-        tasks = self.bot.db.get_tasks(interaction.guild.id)
-        choices = []
-        for t in tasks:
-            label = f"{t[0]}: {t[2]} ({t[1]})"
-            if current.lower() in label.lower():
-                choices.append(app_commands.Choice(name=self._clip_text(label, 100), value=str(t[0])))
-        return choices[:25]
+        tasks = await self.bot.db.search_tasks(interaction.guild.id, current, limit=AUTOCOMPLETE_CHOICES_LIMIT)
+        return [
+            app_commands.Choice(name=self._clip_text(f"{t.id}: {t.title} ({t.subject})", 100), value=str(t.id))
+            for t in tasks
+        ]
+
+    # Borrar de Discord los mensajes devueltos por delete_tasks / delete_tasks_for_guild
+    async def _delete_discord_messages(self, message_refs):
+        get_task_message_index(self.bot).forget(message_refs)
+        for chan_id, msg_id in message_refs:
+            try:
+                channel = self.bot.get_channel(chan_id)
+                if channel:
+                    msg = await channel.fetch_message(msg_id)
+                    await msg.delete()
+            except Exception as e:
+                logger.warning("Error al eliminar mensaje %s en canal %s: %s", msg_id, chan_id, e)
 
     # Comando para eliminar una tarea y sus mensajes asociados
     @app_commands.command(name="eliminar-tarea", description="Eliminar una tarea de forma permanente")
@@ -273,22 +331,9 @@ class Tasks(commands.Cog):
         if materia.strip() == "00923":
             await interaction.response.defer(ephemeral=True)
 
-            deleted_tasks = 0
-            for task in self.bot.db.get_tasks(interaction.guild.id):
-                task_id = task[0]
-
-                cached_messages = self.bot.db.get_task_messages(task_id)
-                for chan_id, msg_id in cached_messages:
-                    try:
-                        channel = self.bot.get_channel(chan_id)
-                        if channel:
-                            msg = await channel.fetch_message(msg_id)
-                            await msg.delete()
-                    except Exception as e:
-                        logger.warning("Error al eliminar mensaje %s en canal %s: %s", msg_id, chan_id, e)
-
-                self.bot.db.delete_task(task_id)
-                deleted_tasks += 1
+            # Una sola transacción en la base; los mensajes se limpian después en Discord
+            deleted_tasks, message_refs = await self.bot.db.delete_tasks_for_guild(interaction.guild.id)
+            await self._delete_discord_messages(message_refs)
 
             # Las tareas se vuelven a generar con /tareas nuevas.
             await interaction.followup.send(
@@ -307,7 +352,7 @@ class Tasks(commands.Cog):
             await interaction.response.send_message("Formato de ID inválido.", ephemeral=True)
             return
 
-        task_data = self.bot.db.get_task_by_id(task_id)
+        task_data = await self.bot.db.get_task_by_id(task_id)
         if not task_data:
             await interaction.response.send_message("Tarea no encontrada.", ephemeral=True)
             return
@@ -315,17 +360,8 @@ class Tasks(commands.Cog):
         await interaction.response.defer(ephemeral=True)
 
         # Intentar eliminar todos los mensajes asociados a la tarea en los diferentes canales
-        cached_messages = self.bot.db.get_task_messages(task_id)
-        for chan_id, msg_id in cached_messages:
-            try:
-                channel = self.bot.get_channel(chan_id)
-                if channel:
-                    msg = await channel.fetch_message(msg_id)
-                    await msg.delete()
-            except Exception as e:
-                logger.warning("Error al eliminar mensaje %s en canal %s: %s", msg_id, chan_id, e)
-
-        self.bot.db.delete_task(task_id)
+        _deleted, message_refs = await self.bot.db.delete_tasks([task_id])
+        await self._delete_discord_messages(message_refs)
         await interaction.followup.send(embed=create_success_embed(f"Tarea #{task_id} y su mensaje asociado han sido eliminados."), ephemeral=True)
 
     @tarea_eliminar.autocomplete('materia')
@@ -333,21 +369,22 @@ class Tasks(commands.Cog):
         return [app_commands.Choice(name=subj, value=subj) for subj in SUBJECTS if current.lower() in subj.lower()][:25]
 
     @tarea_eliminar.autocomplete('tarea')
+    @task_autocomplete_limit
     async def task_delete_autocomplete(self, interaction: discord.Interaction, current: str):
         materia_sel = interaction.namespace.materia
         internal_subject = SUBJECTS_MAP.get(materia_sel, "")
         
-        tasks = self.bot.db.get_tasks(interaction.guild.id)
-        choices = []
-        for t in tasks:
-            # Filtrar por materia si se ha seleccionado una
-            if internal_subject and t[1] != internal_subject:
-                continue
-                
-            label = f"{t[0]}: {t[2]} ({t[1]})"
-            if current.lower() in label.lower():
-                choices.append(app_commands.Choice(name=self._clip_text(label, 100), value=str(t[0])))
-        return choices[:25]
+        # Filtrar por materia si se ha seleccionado una
+        tasks = await self.bot.db.search_tasks(
+            interaction.guild.id,
+            current,
+            subject=internal_subject or None,
+            limit=AUTOCOMPLETE_CHOICES_LIMIT,
+        )
+        return [
+            app_commands.Choice(name=self._clip_text(f"{t.id}: {t.title} ({t.subject})", 100), value=str(t.id))
+            for t in tasks
+        ]
 
 async def setup(bot):
     await bot.add_cog(Tasks(bot))
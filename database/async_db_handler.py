@@ -0,0 +1,143 @@
+# async_db_handler.py - Fachada asíncrona para que SQLite nunca bloquee el event loop de Discord
+import asyncio
+import functools
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Métodos que modifican la base de datos; se serializan en el hilo escritor
+WRITE_METHODS = frozenset(
+    {
+        "init_db",
+        "add_task",
+        "add_task_message",
+        "update_task",
+        "delete_task",
+        "delete_tasks",
+        "delete_tasks_for_guild",
+        "set_enrollments",
+        "import_enrollments",
+        "mark_as_delivered",
+        "mark_reminder_sent",
+        "add_course_watch_item",
+        "add_course_watch_items_bulk",
+        "increment_daily_command_usage",
+        "add_daily_command_usage",
+        "reserve_daily_command_usage",
+        "acquire_lease",
+        "release_leases",
+        "save_http_cookies",
+        "delete_http_cookies",
+        "save_cached_page",
+        "flush_writes",
+    }
+)
+# run_maintenance y backup quedan fuera a propósito: trabajan en lotes/pasos cortos con pausas
+# y no deben retener el hilo escritor durante todo el job; SQLite serializa cada lote con busy_timeout.
+# Tampoco van al pool de lectura: sus pausas lo ocuparían. Corren en un hilo propio, uno tras otro.
+MAINTENANCE_METHODS = frozenset({"run_maintenance", "backup"})
+
+DEFAULT_READER_THREADS = 2
+
+
+# Misma API que DatabaseHandler pero awaitable: las lecturas usan un pool pequeño
+# de hilos (WAL permite lecturas concurrentes) y las escrituras se encolan en un
+# único hilo escritor para que nunca compitan entre sí por el lock de SQLite.
+# Con un backend particionado (write_shard_for), cada servidor tiene su propio hilo escritor.
+class AsyncDatabaseHandler:
+    def __init__(self, handler, reader_threads: int = DEFAULT_READER_THREADS):
+        self.handler = handler
+        self._reader_pool = ThreadPoolExecutor(
+            max_workers=max(1, reader_threads),
+            thread_name_prefix="s4vi-db-reader",
+        )
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="s4vi-db-writer")
+        self._maintenance = ThreadPoolExecutor(max_workers=1, thread_name_prefix="s4vi-db-maintenance")
+        # Hilos escritores por servidor en orden de uso; como las bases, limitados a max_open_shards
+        self._shard_writers = OrderedDict()
+        # Escritores desalojados que aún vacían su cola: servidor -> futuro que marca el final de la cola
+        self._draining_writers = {}
+        self._closed = False
+
+    def __getattr__(self, name):
+        # Solo se invoca para atributos no definidos: delega en el handler síncrono
+        attr = getattr(self.handler, name)
+        if name.startswith("_") or not callable(attr):
+            return attr
+
+        if name in WRITE_METHODS and hasattr(self.handler, "write_shard_for"):
+            wrapper = self._wrap_sharded_write(name, attr)
+        elif name in WRITE_METHODS:
+            wrapper = self._wrap(attr, self._writer)
+        elif name in MAINTENANCE_METHODS:
+            wrapper = self._wrap(attr, self._maintenance)
+        else:
+            wrapper = self._wrap(attr, self._reader_pool)
+        # Cachear el wrapper para no reconstruirlo en cada llamada
+        self.__dict__[name] = wrapper
+        return wrapper
+
+    def _wrap(self, method, executor):
+        @functools.wraps(method)
+        async def call(*args, **kwargs):
+            return await self._submit(executor, method, *args, **kwargs)
+
+        return call
+
+    # Escrituras de servidores distintos no esperan en la misma cola; las globales usan el escritor común
+    def _wrap_sharded_write(self, name, method):
+        @functools.wraps(method)
+        async def call(*args, **kwargs):
+            shard = self.handler.write_shard_for(name, args, kwargs)
+            return await self._submit(self._writer_for_shard(shard), method, *args, **kwargs)
+
+        return call
+
+    def _writer_for_shard(self, shard):
+        if shard is None:
+            return self._writer
+        writer = self._shard_writers.get(shard)
+        if writer is None:
+            writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"s4vi-db-writer-{shard}")
+            drained = self._draining_writers.pop(shard, None)
+            if drained is not None and not drained.done():
+                # El escritor anterior de este servidor sigue vaciando su cola: lo nuevo espera detrás
+                writer.submit(drained.result)
+            self._shard_writers[shard] = writer
+            max_writers = getattr(self.handler, "max_open_shards", None)
+            while max_writers and len(self._shard_writers) > max_writers:
+                # Lo ya encolado en el escritor desalojado termina antes de que su hilo salga;
+                # la última tarea de su cola (FIFO, un hilo) marca cuándo terminó
+                evicted, stale = self._shard_writers.popitem(last=False)
+                self._draining_writers[evicted] = stale.submit(lambda: None)
+                stale.shutdown(wait=False)
+            for evicted in [key for key, drained in self._draining_writers.items() if drained.done()]:
+                del self._draining_writers[evicted]
+        else:
+            self._shard_writers.move_to_end(shard)
+        return writer
+
+    async def _submit(self, executor, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+
+    # Ejecutar una función arbitraria de lectura sobre el handler síncrono
+    async def run_read(self, fn, *args, **kwargs):
+        return await self._submit(self._reader_pool, fn, *args, **kwargs)
+
+    # Ejecutar una función arbitraria de escritura en el hilo escritor
+    async def run_write(self, fn, *args, **kwargs):
+        return await self._submit(self._writer, fn, *args, **kwargs)
+
+    async def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        # Esperar a que se vacíe la cola de escrituras antes de cerrar conexiones
+        await asyncio.to_thread(self._writer.shutdown, wait=True)
+        for writer in list(self._shard_writers.values()):
+            await asyncio.to_thread(writer.shutdown, wait=True)
+        for drained in list(self._draining_writers.values()):
+            await asyncio.wrap_future(drained)
+        await asyncio.to_thread(self._maintenance.shutdown, wait=True)
+        await asyncio.to_thread(self._reader_pool.shutdown, wait=True)
+        await asyncio.to_thread(self.handler.close)
@@ -0,0 +1,145 @@
+# backup.py - Respaldos en caliente con la API de backup de SQLite (por pasos), rotación y compresión
+import datetime
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import time
+
+logger = logging.getLogger("s4vi.database")
+
+DEFAULT_BACKUP_DIR = os.path.join("database", "backups")
+DEFAULT_PAGES_PER_STEP = 256
+DEFAULT_STEP_SLEEP_MS = 10
+DEFAULT_KEEP = 7
+# Reinicios tolerados (otra conexión escribió durante el respaldo) antes de copiar en un solo paso
+MAX_STEP_RESTARTS = 3
+
+
+class _BackupRestarted(Exception):
+    pass
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_flag(name, default=False):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in {"1", "true", "yes", "on"}
+
+
+def _backup_name(db_path, now):
+    stem = os.path.splitext(os.path.basename(db_path))[0] or "bot"
+    # Milisegundos para que dos respaldos en el mismo segundo no se sobrescriban
+    return f"{stem}-{now.strftime('%Y%m%d-%H%M%S-%f')[:-3]}.db"
+
+
+def _copy_in_steps(source_conn, dest_conn, pages_per_step, step_sleep_ms):
+    progress_state = {"steps": 0, "total": 0, "remaining": None, "restarts": 0}
+
+    def on_progress(_status, remaining, total):
+        # Si otra conexión escribe en el origen, SQLite reinicia la copia desde el principio
+        if progress_state["remaining"] is not None and remaining > progress_state["remaining"]:
+            raise _BackupRestarted()
+        progress_state["steps"] += 1
+        progress_state["remaining"] = remaining
+        progress_state["total"] = total
+
+    while True:
+        progress_state["remaining"] = None
+        try:
+            source_conn.backup(dest_conn, pages=pages_per_step, progress=on_progress, sleep=step_sleep_ms / 1000)
+            return progress_state
+        except _BackupRestarted:
+            progress_state["restarts"] += 1
+            if progress_state["restarts"] >= MAX_STEP_RESTARTS:
+                # En WAL una copia de un solo paso es una única transacción de lectura: no bloquea escritores
+                logger.info("Respaldo reiniciado %s veces por escrituras concurrentes; copiando en un solo paso", progress_state["restarts"])
+                source_conn.backup(dest_conn, pages=-1, progress=on_progress)
+                return progress_state
+
+
+def _compress(path):
+    compressed_path = f"{path}.gz"
+    with open(path, "rb") as source, gzip.open(compressed_path, "wb", compresslevel=6) as target:
+        shutil.copyfileobj(source, target, length=1024 * 1024)
+    os.remove(path)
+    return compressed_path
+
+
+# Conservar solo los `keep` respaldos más recientes de la misma base
+def rotate_backups(backup_dir, db_path, keep):
+    stem = os.path.splitext(os.path.basename(db_path))[0] or "bot"
+    backups = sorted(
+        name
+        for name in os.listdir(backup_dir)
+        if name.startswith(f"{stem}-") and (name.endswith(".db") or name.endswith(".db.gz"))
+    )
+    removed = []
+    for name in backups[:-keep] if keep > 0 else []:
+        try:
+            os.remove(os.path.join(backup_dir, name))
+            removed.append(name)
+        except OSError:
+            logger.warning("No se pudo eliminar el respaldo antiguo %s", name)
+    return removed
+
+
+# Respaldo en línea desde una conexión abierta. Devuelve un informe con duración y páginas copiadas.
+def create_backup(source_conn, db_path, backup_dir=None, pages_per_step=None, step_sleep_ms=None, compress=None, keep=None):
+    backup_dir = backup_dir or os.getenv("DB_BACKUP_DIR") or DEFAULT_BACKUP_DIR
+    pages_per_step = max(1, pages_per_step or _env_int("DB_BACKUP_PAGES_PER_STEP", DEFAULT_PAGES_PER_STEP))
+    step_sleep_ms = max(0, step_sleep_ms if step_sleep_ms is not None else _env_int("DB_BACKUP_STEP_SLEEP_MS", DEFAULT_STEP_SLEEP_MS))
+    compress = _env_flag("DB_BACKUP_COMPRESS") if compress is None else compress
+    keep = keep if keep is not None else _env_int("DB_BACKUP_KEEP", DEFAULT_KEEP)
+
+    os.makedirs(backup_dir, exist_ok=True)
+    final_path = os.path.join(backup_dir, _backup_name(db_path, datetime.datetime.now()))
+    partial_path = f"{final_path}.partial"
+
+    started = time.perf_counter()
+    dest_conn = sqlite3.connect(partial_path)
+    try:
+        progress = _copy_in_steps(source_conn, dest_conn, pages_per_step, step_sleep_ms)
+        integrity = dest_conn.execute("PRAGMA quick_check").fetchone()[0]
+        if integrity != "ok":
+            raise sqlite3.DatabaseError(f"El respaldo no pasó quick_check: {integrity}")
+    except BaseException:
+        dest_conn.close()
+        # No dejar copias a medias que la rotación pudiera confundir con respaldos válidos
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    dest_conn.close()
+
+    os.replace(partial_path, final_path)
+    if compress:
+        final_path = _compress(final_path)
+    removed = rotate_backups(backup_dir, db_path, keep)
+
+    report = {
+        "path": final_path,
+        "pages_copied": progress["total"],
+        "steps": progress["steps"],
+        "restarts": progress["restarts"],
+        "bytes": os.path.getsize(final_path),
+        "compressed": compress,
+        "rotated": removed,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+        "finished_at": time.time(),
+    }
+    logger.info(
+        "Respaldo creado: %s (%s páginas en %s pasos, %.1f ms)",
+        final_path,
+        report["pages_copied"],
+        report["steps"],
+        report["duration_ms"],
+    )
+    return report
@@ -1,156 +1,294 @@
 # db_handler.py - Gestión de base de datos SQLite
 import sqlite3
+import csv
 import datetime
+import io
+import os
+import threading
+import time
+
+from database.backup import create_backup
+from database.due_dates import due_date_to_ts
+from database.instrumentation import (
+    QUERY_STATS,
+    InstrumentedConnection,
+    instrument_handler,
+    instrumentation_enabled,
+)
+from database.maintenance import run_maintenance
+from database.migrations import apply_migrations
+from database.search import FIELD_WEIGHTS, fts_match_expression, query_terms, rank_tasks, task_id_from_query
+from database.task_cache import TaskCache
+from database.task_row import TASK_SELECT_COLUMNS, TaskRow, task_row_factory
+from database.write_batcher import WriteBatcher
+
+# Perfiles de rendimiento: synchronous y tamaño de mmap aplicados una sola vez por conexión
+PERFORMANCE_PROFILES = {
+    "safe": {"synchronous": "FULL", "mmap_size": 0},
+    "balanced": {"synchronous": "NORMAL", "mmap_size": 64 * 1024 * 1024},
+    "fast": {"synchronous": "OFF", "mmap_size": 256 * 1024 * 1024},
+}
+DEFAULT_PERFORMANCE_PROFILE = "balanced"
+STATEMENT_CACHE_SIZE = 256
+BUSY_TIMEOUT_MS = 10000
+# Métodos que no se instrumentan (infraestructura, no consultas)
+UNINSTRUMENTED_METHODS = frozenset({"get_connection", "close", "get_query_stats"})
+# Filas por sentencia en inserciones multi-fila (8 parámetros por fila, muy por debajo del límite de SQLite)
+BULK_INSERT_CHUNK_ROWS = 100
+# IDs por sentencia en borrados masivos (por debajo del límite de variables de SQLite)
+DELETE_CHUNK_IDS = 500
+
+
+def resolve_performance_profile(name=None):
+    profile_name = (name or os.getenv("DB_PERFORMANCE_PROFILE") or DEFAULT_PERFORMANCE_PROFILE).strip().lower()
+    if profile_name not in PERFORMANCE_PROFILES:
+        profile_name = DEFAULT_PERFORMANCE_PROFILE
+    return profile_name, PERFORMANCE_PROFILES[profile_name]
+
+
+# Leer un CSV de inscripciones (user_id, materia); acepta texto o archivo y omite
+# encabezado y filas inválidas. Devuelve (filas, omitidas)
+def read_enrollment_csv(source):
+    if isinstance(source, str):
+        source = io.StringIO(source)
+
+    rows = []
+    skipped = 0
+    for index, record in enumerate(csv.reader(source)):
+        if not record or not any(field.strip() for field in record):
+            continue
+        if len(record) < 2 or not record[1].strip():
+            skipped += 1
+            continue
+        try:
+            user_id = int(record[0].strip())
+        except ValueError:
+            # La primera fila no numérica se trata como encabezado
+            if index > 0:
+                skipped += 1
+            continue
+        rows.append((user_id, record[1].strip()))
+    return rows, skipped
+
 
 class DatabaseHandler:
-    def __init__(self, db_path="database/bot.db"):
+    def __init__(
+        self,
+        db_path="database/bot.db",
+        performance_profile=None,
+        write_batch_rows=None,
+        write_batch_ms=None,
+        instrumentation=None,
+    ):
         self.db_path = db_path
+        self.profile_name, self.profile = resolve_performance_profile(performance_profile)
+        self.instrumented = instrumentation_enabled() if instrumentation is None else bool(instrumentation)
+        if self.instrumented:
+            self._enable_instrumentation()
+        # Una conexión persistente por hilo; los PRAGMAs se aplican solo al abrirla
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        # Caché write-through de get_tasks compartida por todos los cogs
+        self.task_cache = TaskCache()
+        self.maintenance_stats = {"runs": 0, "deleted": {}, "last_run": None}
+        self.backup_stats = {"runs": 0, "failures": 0, "last_run": None}
         self.init_db()
-
-    def get_connection(self):
-        conn = sqlite3.connect(self.db_path, timeout=10.0)
+        # Escrituras pequeñas y frecuentes se confirman en lote (group commit)
+        self._write_batcher = WriteBatcher(self.get_connection, max_rows=write_batch_rows, max_delay_ms=write_batch_ms)
+
+    def _open_connection(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=BUSY_TIMEOUT_MS / 1000,
+            cached_statements=STATEMENT_CACHE_SIZE,
+            check_same_thread=False,
+            factory=InstrumentedConnection if self.instrumented else sqlite3.Connection,
+        )
         try:
+            # Necesario en cada conexión para que apliquen los ON DELETE CASCADE
+            conn.execute("PRAGMA foreign_keys=ON")
             conn.execute("PRAGMA journal_mode=WAL")
-            conn.execute("PRAGMA busy_timeout=10000")
+            conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+            conn.execute(f"PRAGMA synchronous={self.profile['synchronous']}")
+            conn.execute(f"PRAGMA mmap_size={int(self.profile['mmap_size'])}")
         except sqlite3.OperationalError:
             pass
         return conn
 
-    # Inicializar las tablas de la base de datos si no existen
-    def init_db(self):
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Definición de la tabla de tareas
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS tasks (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    subject TEXT NOT NULL,
-                    title TEXT NOT NULL,
-                    due_date TEXT NOT NULL,
-                    created_by INTEGER NOT NULL,
-                    guild_id INTEGER NOT NULL,
-                    message_id INTEGER,
-                    channel_id INTEGER,
-                    reminders_active INTEGER DEFAULT 1,
-                    source_url TEXT
-                )
-            ''')
+    # Medición opt-in (DB_INSTRUMENTATION=1): envuelve cada método público de consulta
+    def _enable_instrumentation(self):
+        instrument_handler(self, skip=UNINSTRUMENTED_METHODS)
 
-            # Tabla para rastrear todos los mensajes relacionados con una tarea (anuncios, notificaciones, etc.)
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS task_messages (
-                    task_id INTEGER NOT NULL,
-                    channel_id INTEGER NOT NULL,
-                    message_id INTEGER NOT NULL,
-                    FOREIGN KEY (task_id) REFERENCES tasks (id)
-                )
-            ''')
-            
-            # Mapeo de inscripciones de usuarios por materia
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS enrollments (
-                    user_id INTEGER NOT NULL,
-                    subject TEXT NOT NULL,
-                    guild_id INTEGER NOT NULL,
-                    PRIMARY KEY (user_id, subject, guild_id)
-                )
-            ''')
-            
-            # Seguimiento de entregas de tareas
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS deliveries (
-                    task_id INTEGER NOT NULL,
-                    user_id INTEGER NOT NULL,
-                    delivery_date TEXT NOT NULL,
-                    guild_id INTEGER NOT NULL,
-                    PRIMARY KEY (task_id, user_id)
-                )
-            ''')
-            
-            # Seguimiento de recordatorios enviados para evitar duplicados
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS sent_reminders (
-                    task_id INTEGER NOT NULL,
-                    reminder_type TEXT NOT NULL,
-                    PRIMARY KEY (task_id, reminder_type)
-                )
-            ''')
+    # Métricas de consultas acumuladas en el proceso (vacías si la instrumentación está apagada)
+    def get_query_stats(self):
+        return QUERY_STATS.snapshot()
 
-            # Registro de actividades detectadas en cursos virtuales (evita duplicados por hash)
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS course_watch_items (
-                    item_hash TEXT PRIMARY KEY,
-                    course_name TEXT NOT NULL,
-                    week_name TEXT NOT NULL,
-                    activity_type TEXT NOT NULL,
-                    title TEXT NOT NULL,
-                    url TEXT NOT NULL,
-                    guild_id INTEGER NOT NULL,
-                    first_seen TEXT NOT NULL
-                )
-            ''')
+    # Obtener la conexión del hilo actual (se abre una vez y se reutiliza)
+    def get_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._open_connection()
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
 
-            # Contador diario global para comandos sensibles (rate limiting persistente)
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS daily_command_usage (
-                    command_key TEXT NOT NULL,
-                    usage_day TEXT NOT NULL,
-                    usage_count INTEGER NOT NULL DEFAULT 0,
-                    PRIMARY KEY (command_key, usage_day)
-                )
-            ''')
+    # Barrera: confirmar escrituras agrupadas antes de una lectura que dependa de ellas
+    def flush_writes(self):
+        return self._write_batcher.flush()
+
+    # Contadores del group commit (filas escritas, commits ahorrados, etc.)
+    def get_write_batch_stats(self):
+        return self._write_batcher.snapshot()
+
+    # Contadores de la caché de tareas (aciertos, fallos, desalojos y tamaño)
+    def get_task_cache_stats(self):
+        return self.task_cache.snapshot()
+
+    # Job de mantenimiento: archivado y retención por lotes, incremental_vacuum y PRAGMA optimize
+    def run_maintenance(self, retention_days=None, batch_rows=None, pause_ms=None, max_pages=None, archive_grace_days=None):
+        # Las escrituras pendientes podrían referenciar tareas a archivar o purgar
+        self.flush_writes()
+        report = run_maintenance(
+            self.get_connection(),
+            retention_days=retention_days,
+            batch_rows=batch_rows,
+            pause_ms=pause_ms,
+            max_pages=max_pages,
+            archive_grace_days=archive_grace_days,
+        )
+        if report["archived"] or report["deleted"].get("tasks"):
+            self.task_cache.invalidate()
+
+        self.maintenance_stats["runs"] += 1
+        for table, deleted in report["deleted"].items():
+            self.maintenance_stats["deleted"][table] = self.maintenance_stats["deleted"].get(table, 0) + deleted
+        self.maintenance_stats["last_run"] = report
+        return report
+
+    # Respaldo en caliente con la API de backup (por pasos); ver database/backup.py
+    def backup(self, backup_dir=None, pages_per_step=None, step_sleep_ms=None, compress=None, keep=None):
+        # Incluir en la copia las escrituras agrupadas aún en memoria
+        self.flush_writes()
+        try:
+            report = create_backup(
+                self.get_connection(),
+                self.db_path,
+                backup_dir=backup_dir,
+                pages_per_step=pages_per_step,
+                step_sleep_ms=step_sleep_ms,
+                compress=compress,
+                keep=keep,
+            )
+        except Exception:
+            self.backup_stats["failures"] += 1
+            raise
+        self.backup_stats["runs"] += 1
+        self.backup_stats["last_run"] = report
+        return report
 
-            # Migración: Agregar columna reminders_active si no existe
-            try:
-                cursor.execute('ALTER TABLE tasks ADD COLUMN reminders_active INTEGER DEFAULT 1')
-            except sqlite3.OperationalError:
-                pass  # La columna ya existe o la tabla es nueva y ya la tiene
+    def get_backup_stats(self):
+        return dict(self.backup_stats)
 
-            # Migración: Agregar columna source_url si no existe
+    def get_maintenance_stats(self):
+        return {
+            "runs": self.maintenance_stats["runs"],
+            "deleted": dict(self.maintenance_stats["deleted"]),
+            "last_run": self.maintenance_stats["last_run"],
+        }
+
+    # Cerrar todas las conexiones abiertas por el handler
+    def close(self):
+        # Garantiza durabilidad: nada pendiente en memoria al cerrar
+        self._write_batcher.close()
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
             try:
-                cursor.execute('ALTER TABLE tasks ADD COLUMN source_url TEXT')
-            except sqlite3.OperationalError:
+                conn.close()
+            except sqlite3.Error:
                 pass
+        self._local = threading.local()
 
-            # Índices para optimizar consultas frecuentes
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_guild_id ON tasks (guild_id)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_task_messages_task_id ON task_messages (task_id)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_enrollments_guild_user ON enrollments (guild_id, user_id)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_deliveries_guild_task_user ON deliveries (guild_id, task_id, user_id)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_course_watch_items_guild ON course_watch_items (guild_id)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_daily_command_usage_day ON daily_command_usage (usage_day)')
-            
-            conn.commit()
-
-    # Registrar una nueva tarea en la base de datos
-    def add_task(self, subject, title, due_date, created_by, guild_id, message_id=None, channel_id=None, reminders_active=1, source_url=None):
+    # Aplicar las migraciones pendientes (no ejecuta DDL si el esquema está al día)
+    def init_db(self):
+        conn = self.get_connection()
+        applied = apply_migrations(conn)
+        # Sin FTS5 la migración no crea el índice y search_tasks busca en memoria
+        self.fts_enabled = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tasks_fts'"
+        ).fetchone() is not None
+        return applied
+
+    # Registrar una nueva tarea en la base de datos.
+    # task_id explícito: en modo particionado el ID lo asigna el directorio global (database/sharding.py)
+    def add_task(self, subject, title, due_date, created_by, guild_id, message_id=None, channel_id=None, reminders_active=1, source_url=None, instructions=None, task_id=None):
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(
-                'INSERT INTO tasks (subject, title, due_date, created_by, guild_id, message_id, channel_id, reminders_active, source_url) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
-                (subject, title, due_date, created_by, guild_id, message_id, channel_id, reminders_active, source_url),
+                'INSERT INTO tasks (id, subject, title, due_date, created_by, guild_id, message_id, channel_id, reminders_active, source_url, due_ts, instructions) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (task_id, subject, title, due_date, created_by, guild_id, message_id, channel_id, reminders_active, source_url, due_date_to_ts(due_date), instructions),
             )
             conn.commit()
-            return cursor.lastrowid
-
-    # Registrar un mensaje asociado a una tarea
+            task_id = cursor.lastrowid
+
+        self.task_cache.upsert(TaskRow(
+            id=task_id,
+            subject=subject,
+            title=title,
+            due_date=due_date,
+            created_by=created_by,
+            guild_id=guild_id,
+            message_id=message_id,
+            channel_id=channel_id,
+            reminders_active=reminders_active,
+            source_url=source_url,
+            due_ts=due_date_to_ts(due_date),
+            instructions=instructions,
+        ))
+        return task_id
+
+    # Registrar un mensaje asociado a una tarea (OR IGNORE: un mensaje repetido no invalida el lote)
     def add_task_message(self, task_id, channel_id, message_id):
+        self._write_batcher.enqueue(
+            'INSERT OR IGNORE INTO task_messages (task_id, channel_id, message_id) VALUES (?, ?, ?)',
+            (task_id, channel_id, message_id),
+            key=("task_messages", message_id),
+        )
+
+    # Pares (message_id, task_id) de todos los mensajes rastreados, para precargar el índice en memoria
+    def get_task_message_index(self):
+        self.flush_writes()
         with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('INSERT INTO task_messages (task_id, channel_id, message_id) VALUES (?, ?, ?)',
-                           (task_id, channel_id, message_id))
-            conn.commit()
+            return conn.execute('SELECT message_id, task_id FROM task_messages').fetchall()
+
+    # Tarea dueña de un mensaje (búsqueda por clave primaria); None si no está rastreado o no es una tarea
+    # del servidor. Se llama con cada reacción ✅: solo vuelca el lote si ese mensaje está pendiente.
+    def get_task_id_for_message(self, guild_id, message_id):
+        if self._write_batcher.is_pending(("task_messages", message_id)):
+            self.flush_writes()
+        with self.get_connection() as conn:
+            row = conn.execute(
+                '''
+                SELECT tm.task_id FROM task_messages tm
+                JOIN tasks t ON t.id = tm.task_id
+                WHERE tm.message_id = ? AND t.guild_id = ?
+                ''',
+                (message_id, guild_id),
+            ).fetchone()
+        return row[0] if row else None
 
     # Obtener todos los mensajes asociados a una tarea
     def get_task_messages(self, task_id):
+        self.flush_writes()
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT channel_id, message_id FROM task_messages WHERE task_id = ?', (task_id,))
             return cursor.fetchall()
 
     # Actualizar los atributos de una tarea existente
-    def update_task(self, task_id, title=None, due_date=None, subject=None, source_url=None):
+    def update_task(self, task_id, title=None, due_date=None, subject=None, source_url=None, instructions=None):
         with self.get_connection() as conn:
             cursor = conn.cursor()
             updates = []
@@ -161,12 +299,17 @@ class DatabaseHandler:
             if due_date:
                 updates.append("due_date = ?")
                 params.append(due_date)
+                updates.append("due_ts = ?")
+                params.append(due_date_to_ts(due_date))
             if subject:
                 updates.append("subject = ?")
                 params.append(subject)
             if source_url is not None:
                 updates.append("source_url = ?")
                 params.append(source_url)
+            if instructions is not None:
+                updates.append("instructions = ?")
+                params.append(instructions)
             
             if not updates:
                 return False
@@ -175,47 +318,257 @@ class DatabaseHandler:
             query = f"UPDATE tasks SET {', '.join(updates)} WHERE id = ?"
             cursor.execute(query, params)
             conn.commit()
-            return cursor.rowcount > 0
+            updated = cursor.rowcount > 0
+
+        if updated:
+            updated_task = self.get_task_by_id(task_id)
+            if updated_task is not None:
+                self.task_cache.upsert(updated_task)
+        return updated
 
     # Obtener todas las tareas de un servidor específico
     def get_tasks(self, guild_id):
+        cached = self.task_cache.get(guild_id)
+        if cached is not None:
+            return cached
+
+        generation = self.task_cache.generation()
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT * FROM tasks WHERE guild_id = ?', (guild_id,))
-            return cursor.fetchall()
+            cursor.row_factory = task_row_factory
+            cursor.execute(f'SELECT {TASK_SELECT_COLUMNS} FROM tasks WHERE guild_id = ?', (guild_id,))
+            rows = cursor.fetchall()
+
+        self.task_cache.store(guild_id, rows, generation)
+        return rows
 
     # Obtener una sola tarea por su ID único
     def get_task_by_id(self, task_id):
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('SELECT * FROM tasks WHERE id = ?', (task_id,))
+            cursor.row_factory = task_row_factory
+            cursor.execute(f'SELECT {TASK_SELECT_COLUMNS} FROM tasks WHERE id = ?', (task_id,))
             return cursor.fetchone()
 
+    # Tareas para autocompletados (id, materia y título), servidas desde la caché por servidor
+    def get_task_choices(self, guild_id, subject=None):
+        tasks = self.get_tasks(guild_id)
+        if subject:
+            tasks = [task for task in tasks if task.subject == subject]
+        return sorted(tasks, key=lambda task: task.id)
+
+    # Búsqueda por título, materia e instrucciones (sin tildes, por prefijo), ordenada por relevancia
+    def search_tasks(self, guild_id, query, subject=None, limit=25):
+        terms = query_terms(query)
+        if not terms:
+            return self.get_task_choices(guild_id, subject)[:limit]
+
+        results = []
+        task_id = task_id_from_query(query)
+        if task_id is not None:
+            task = self.get_task_by_id(task_id)
+            if task is not None and task.guild_id == guild_id and (not subject or task.subject == subject):
+                results.append(task)
+
+        if not self.fts_enabled:
+            matches = rank_tasks(self.get_task_choices(guild_id, subject), terms, limit)
+        else:
+            weights = ", ".join(str(weight) for weight in FIELD_WEIGHTS.values())
+            columns = ", ".join(f"t.{column}" for column in TASK_SELECT_COLUMNS.split(", "))
+            query_sql = (
+                f'SELECT {columns} FROM tasks_fts JOIN tasks t ON t.id = tasks_fts.rowid '
+                f'WHERE tasks_fts MATCH ? AND t.guild_id = ?'
+            )
+            params = [fts_match_expression(terms), guild_id]
+            if subject:
+                query_sql += ' AND t.subject = ?'
+                params.append(subject)
+            query_sql += f' ORDER BY bm25(tasks_fts, {weights}), t.id LIMIT ?'
+            params.append(limit)
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = task_row_factory
+                cursor.execute(query_sql, params)
+                matches = cursor.fetchall()
+
+        results.extend(task for task in matches if task.id != task_id)
+        return results[:limit]
+
+    # Tareas con entrega dentro de [start, end] (epoch o datetime con zona) usando el índice (guild_id, due_ts)
+    def get_tasks_due_between(self, guild_id, start, end, reminders_only=False):
+        if isinstance(start, datetime.datetime):
+            start = start.timestamp()
+        if isinstance(end, datetime.datetime):
+            end = end.timestamp()
+
+        query = 'SELECT id, subject, title, due_date, due_ts FROM tasks WHERE guild_id = ? AND due_ts BETWEEN ? AND ?'
+        if reminders_only:
+            query += ' AND reminders_active = 1'
+        query += ' ORDER BY due_ts'
+
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = task_row_factory
+            cursor.execute(query, (guild_id, int(start), int(end)))
+            return cursor.fetchall()
+
     # Eliminar una tarea y todos los registros asociados
     def delete_task(self, task_id):
+        self.delete_tasks([task_id])
+
+    # Eliminar varias tareas en una sola transacción; mensajes, entregas y recordatorios
+    # caen por ON DELETE CASCADE. Devuelve (tareas eliminadas, mensajes a limpiar en Discord)
+    def delete_tasks(self, task_ids):
+        task_ids = list(dict.fromkeys(task_ids))
+        if not task_ids:
+            return 0, []
+
+        self.flush_writes()
+        deleted = 0
+        message_refs = []
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('DELETE FROM tasks WHERE id = ?', (task_id,))
-            cursor.execute('DELETE FROM sent_reminders WHERE task_id = ?', (task_id,))
-            cursor.execute('DELETE FROM deliveries WHERE task_id = ?', (task_id,))
-            cursor.execute('DELETE FROM task_messages WHERE task_id = ?', (task_id,))
-            
-            # Reiniciar la secuencia de autoincremento si no quedan tareas
-            cursor.execute('SELECT COUNT(*) FROM tasks')
-            if cursor.fetchone()[0] == 0:
-                cursor.execute("UPDATE sqlite_sequence SET seq = 0 WHERE name = 'tasks'")
-                
-            conn.commit()
+            for start in range(0, len(task_ids), DELETE_CHUNK_IDS):
+                chunk = task_ids[start:start + DELETE_CHUNK_IDS]
+                placeholders = ", ".join("?" for _ in chunk)
+                cursor.execute(
+                    f'SELECT channel_id, message_id FROM task_messages WHERE task_id IN ({placeholders})',
+                    chunk,
+                )
+                message_refs.extend(cursor.fetchall())
+                cursor.execute(f'DELETE FROM tasks WHERE id IN ({placeholders})', chunk)
+                deleted += cursor.rowcount
+            self._reset_task_sequence_if_empty(cursor)
+
+        self.task_cache.discard(task_ids)
+        return deleted, message_refs
+
+    # Purga completa de un servidor en una sola transacción
+    def delete_tasks_for_guild(self, guild_id):
+        self.flush_writes()
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT tm.channel_id, tm.message_id
+                FROM task_messages tm
+                JOIN tasks t ON t.id = tm.task_id
+                WHERE t.guild_id = ?
+            ''', (guild_id,))
+            message_refs = cursor.fetchall()
+            cursor.execute('DELETE FROM tasks WHERE guild_id = ?', (guild_id,))
+            deleted = cursor.rowcount
+            self._reset_task_sequence_if_empty(cursor)
+
+        self.task_cache.invalidate(guild_id)
+        return deleted, message_refs
+
+    # Reiniciar la secuencia de autoincremento si no quedan tareas (sin reutilizar IDs archivados)
+    def _reset_task_sequence_if_empty(self, cursor):
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM tasks)')
+        if not cursor.fetchone()[0]:
+            cursor.execute(
+                "UPDATE sqlite_sequence SET seq = (SELECT COALESCE(MAX(id), 0) FROM tasks_archive) WHERE name = 'tasks'"
+            )
+
+    # Consulta administrativa del archivo: más recientes primero, con filtro de texto opcional
+    def get_archived_tasks(self, guild_id, query=None, subject=None, limit=20):
+        sql = f'SELECT {TASK_SELECT_COLUMNS} FROM tasks_archive WHERE guild_id = ?'
+        params = [guild_id]
+        if subject:
+            sql += ' AND subject = ?'
+            params.append(subject)
+        sql += ' ORDER BY due_ts DESC, id DESC'
+        terms = query_terms(query)
+        if not terms:
+            sql += ' LIMIT ?'
+            params.append(limit)
+
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = task_row_factory
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        return rank_tasks(rows, terms, limit) if terms else rows
+
+    # Una tarea archivada con sus mensajes y entregas conservados (None si no está en el archivo)
+    def get_archived_task(self, task_id):
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = task_row_factory
+            cursor.execute(f'SELECT {TASK_SELECT_COLUMNS} FROM tasks_archive WHERE id = ?', (task_id,))
+            task = cursor.fetchone()
+            if task is None:
+                return None
+            messages = conn.execute(
+                'SELECT channel_id, message_id FROM task_messages_archive WHERE task_id = ?', (task_id,)
+            ).fetchall()
+            delivered_by = [
+                row[0] for row in conn.execute('SELECT user_id FROM deliveries_archive WHERE task_id = ? ORDER BY user_id', (task_id,))
+            ]
+        return {"task": task, "messages": messages, "delivered_by": delivered_by}
 
     # Administrar inscripciones de materias para usuarios
+    # Solo se tocan las filas que cambian; devuelve (agregadas, eliminadas)
     def set_enrollments(self, user_id, subjects, guild_id):
+        wanted = {subject.strip() for subject in subjects if subject and subject.strip()}
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('DELETE FROM enrollments WHERE user_id = ? AND guild_id = ?', (user_id, guild_id))
-            for subject in subjects:
-                cursor.execute('INSERT INTO enrollments (user_id, subject, guild_id) VALUES (?, ?, ?)',
-                               (user_id, subject.strip(), guild_id))
-            conn.commit()
+            cursor.execute('SELECT subject FROM enrollments WHERE user_id = ? AND guild_id = ?', (user_id, guild_id))
+            current = {row[0] for row in cursor.fetchall()}
+
+            added = sorted(wanted - current)
+            removed = sorted(current - wanted)
+            if removed:
+                cursor.executemany('DELETE FROM enrollments WHERE user_id = ? AND subject = ? AND guild_id = ?',
+                                   [(user_id, subject, guild_id) for subject in removed])
+            if added:
+                cursor.executemany('INSERT OR IGNORE INTO enrollments (user_id, subject, guild_id) VALUES (?, ?, ?)',
+                                   [(user_id, subject, guild_id) for subject in added])
+        return added, removed
+
+    # Alta masiva de una cohorte en una sola transacción. rows: pares (user_id, materia).
+    # Con replace=True, cada usuario del lote queda inscrito exactamente en sus materias del lote
+    def import_enrollments(self, rows, guild_id, replace=False):
+        subjects_by_user = {}
+        for user_id, subject in rows:
+            subject = (subject or "").strip()
+            if subject:
+                subjects_by_user.setdefault(int(user_id), set()).add(subject)
+
+        result = {"users": len(subjects_by_user), "added": 0, "removed": 0}
+        if not subjects_by_user:
+            return result
+
+        inserts = [
+            (user_id, subject, guild_id)
+            for user_id, subjects in subjects_by_user.items()
+            for subject in sorted(subjects)
+        ]
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            if replace:
+                user_ids = list(subjects_by_user)
+                stale = []
+                for start in range(0, len(user_ids), DELETE_CHUNK_IDS):
+                    chunk = user_ids[start:start + DELETE_CHUNK_IDS]
+                    placeholders = ", ".join("?" for _ in chunk)
+                    cursor.execute(
+                        f'SELECT user_id, subject FROM enrollments WHERE guild_id = ? AND user_id IN ({placeholders})',
+                        [guild_id, *chunk],
+                    )
+                    stale.extend(
+                        (user_id, subject, guild_id)
+                        for user_id, subject in cursor.fetchall()
+                        if subject not in subjects_by_user[user_id]
+                    )
+                if stale:
+                    cursor.executemany('DELETE FROM enrollments WHERE user_id = ? AND subject = ? AND guild_id = ?', stale)
+                    result["removed"] = len(stale)
+
+            changes_before = conn.total_changes
+            cursor.executemany('INSERT OR IGNORE INTO enrollments (user_id, subject, guild_id) VALUES (?, ?, ?)', inserts)
+            result["added"] = conn.total_changes - changes_before
+        return result
 
     # Obtener las materias inscritas por un usuario específico
     def get_user_enrollments(self, user_id, guild_id):
@@ -250,6 +603,7 @@ class DatabaseHandler:
         placeholders = ','.join('?' for _ in task_ids)
         query = f'SELECT task_id, user_id FROM deliveries WHERE guild_id = ? AND task_id IN ({placeholders})'
 
+        self.flush_writes()
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(query, [guild_id, *task_ids])
@@ -273,15 +627,15 @@ class DatabaseHandler:
 
     # Marcar una tarea como entregada para un usuario específico
     def mark_as_delivered(self, task_id, user_id, guild_id):
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            cursor.execute('INSERT OR REPLACE INTO deliveries (task_id, user_id, delivery_date, guild_id) VALUES (?, ?, ?, ?)',
-                           (task_id, user_id, now, guild_id))
-            conn.commit()
+        now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self._write_batcher.enqueue(
+            'INSERT OR REPLACE INTO deliveries (task_id, user_id, delivery_date, guild_id) VALUES (?, ?, ?, ?)',
+            (task_id, user_id, now, guild_id),
+        )
 
     # Determinar si un usuario ha entregado una tarea específica
     def is_delivered(self, task_id, user_id):
+        self.flush_writes()
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT 1 FROM deliveries WHERE task_id = ? AND user_id = ?', (task_id, user_id))
@@ -289,6 +643,7 @@ class DatabaseHandler:
 
     # Verificar si ya se ha enviado un tipo específico de recordatorio
     def is_reminder_sent(self, task_id, reminder_type):
+        self.flush_writes()
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT 1 FROM sent_reminders WHERE task_id = ? AND reminder_type = ?', (task_id, reminder_type))
@@ -302,6 +657,7 @@ class DatabaseHandler:
         placeholders = ','.join('?' for _ in task_ids)
         query = f'SELECT task_id, reminder_type FROM sent_reminders WHERE task_id IN ({placeholders})'
 
+        self.flush_writes()
         with self.get_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(query, task_ids)
@@ -311,26 +667,85 @@ class DatabaseHandler:
 
     # Marcar un recordatorio como enviado
     def mark_reminder_sent(self, task_id, reminder_type):
-        with self.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('INSERT INTO sent_reminders (task_id, reminder_type) VALUES (?, ?)', (task_id, reminder_type))
-            conn.commit()
+        # OR IGNORE: un duplicado no debe invalidar el lote completo
+        self._write_batcher.enqueue(
+            'INSERT OR IGNORE INTO sent_reminders (task_id, reminder_type) VALUES (?, ?)',
+            (task_id, reminder_type),
+        )
 
     # Guardar actividad detectada por el monitor de cursos (si no existe previamente)
     def add_course_watch_item(self, item_hash, course_name, week_name, activity_type, title, url, guild_id):
+        # La novedad se decide contra la tabla y el lote pendiente de forma atómica; la inserción se agrupa
+        def exists():
+            with self.get_connection() as conn:
+                return conn.execute('SELECT 1 FROM course_watch_items WHERE item_hash = ?', (item_hash,)).fetchone() is not None
+
+        first_seen = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        return self._write_batcher.enqueue_if_absent(
+            '''
+            INSERT OR IGNORE INTO course_watch_items
+            (item_hash, course_name, week_name, activity_type, title, url, guild_id, first_seen)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''',
+            (item_hash, course_name, week_name, activity_type, title, url, guild_id, first_seen),
+            ("course_watch_items", item_hash),
+            exists,
+        )
+
+    # Guardar en bloque las actividades de un curso; devuelve los hashes que no existían
+    def add_course_watch_items_bulk(self, items, guild_id):
+        first_seen = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        rows = {}
+        for item in items:
+            rows.setdefault(item["item_hash"], (
+                item["item_hash"],
+                item["course_name"],
+                item["week_name"],
+                item["activity_type"],
+                item["title"],
+                item["url"],
+                guild_id,
+                first_seen,
+            ))
+        if not rows:
+            return set()
+
+        # Las inserciones individuales aún en lote deben verse antes de decidir qué es nuevo
+        self.flush_writes()
+        values = list(rows.values())
+        new_hashes = set()
         with self.get_connection() as conn:
             cursor = conn.cursor()
-            first_seen = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            cursor.execute(
-                '''
-                INSERT OR IGNORE INTO course_watch_items
-                (item_hash, course_name, week_name, activity_type, title, url, guild_id, first_seen)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''',
-                (item_hash, course_name, week_name, activity_type, title, url, guild_id, first_seen)
-            )
+            if sqlite3.sqlite_version_info >= (3, 35, 0):
+                for start in range(0, len(values), BULK_INSERT_CHUNK_ROWS):
+                    chunk = values[start:start + BULK_INSERT_CHUNK_ROWS]
+                    placeholders = ", ".join("(?, ?, ?, ?, ?, ?, ?, ?)" for _ in chunk)
+                    cursor.execute(
+                        f'''
+                        INSERT OR IGNORE INTO course_watch_items
+                        (item_hash, course_name, week_name, activity_type, title, url, guild_id, first_seen)
+                        VALUES {placeholders}
+                        RETURNING item_hash
+                        ''',
+                        [value for row in chunk for value in row],
+                    )
+                    new_hashes.update(row[0] for row in cursor.fetchall())
+            else:
+                # SQLite sin RETURNING: se calcula la diferencia dentro de la misma transacción
+                placeholders = ",".join("?" for _ in rows)
+                cursor.execute(f'SELECT item_hash FROM course_watch_items WHERE item_hash IN ({placeholders})', list(rows))
+                existing = {row[0] for row in cursor.fetchall()}
+                cursor.executemany(
+                    '''
+                    INSERT OR IGNORE INTO course_watch_items
+                    (item_hash, course_name, week_name, activity_type, title, url, guild_id, first_seen)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ''',
+                    values,
+                )
+                new_hashes = set(rows) - existing
             conn.commit()
-            return cursor.rowcount > 0
+        return new_hashes
 
     # Obtener el uso diario de un comando global
     def get_daily_command_usage(self, command_key, usage_day):
@@ -357,3 +772,143 @@ class DatabaseHandler:
                 (command_key, usage_day),
             )
             conn.commit()
+
+    # Sumar en bloque incrementos acumulados en memoria: entries = [(command_key, usage_day, delta)]
+    def add_daily_command_usage(self, entries):
+        entries = [(command_key, usage_day, int(delta)) for command_key, usage_day, delta in entries if delta]
+        if not entries:
+            return
+        with self.get_connection() as conn:
+            conn.executemany(
+                '''
+                INSERT INTO daily_command_usage (command_key, usage_day, usage_count)
+                VALUES (?, ?, ?)
+                ON CONFLICT(command_key, usage_day)
+                DO UPDATE SET usage_count = usage_count + excluded.usage_count
+                ''',
+                entries,
+            )
+
+    # Reservar un uso del día si quedan: devuelve el contador tras reservar o None si ya se alcanzó
+    # `limit`. Comprobar e incrementar es una sola sentencia, así varias instancias comparten el cupo.
+    def reserve_daily_command_usage(self, command_key, usage_day, limit):
+        with self.get_connection() as conn:
+            if sqlite3.sqlite_version_info >= (3, 35, 0):
+                row = conn.execute(
+                    '''
+                    INSERT INTO daily_command_usage (command_key, usage_day, usage_count)
+                    VALUES (?, ?, 1)
+                    ON CONFLICT(command_key, usage_day)
+                    DO UPDATE SET usage_count = usage_count + 1 WHERE usage_count < ?
+                    RETURNING usage_count
+                    ''',
+                    (command_key, usage_day, limit),
+                ).fetchone()
+                return int(row[0]) if row else None
+            # SQLite sin RETURNING: leer y sumar dentro de una transacción con el lock de escritura
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                'SELECT usage_count FROM daily_command_usage WHERE command_key = ? AND usage_day = ?',
+                (command_key, usage_day),
+            ).fetchone()
+            used = int(row[0]) if row else 0
+            if used >= limit:
+                return None
+            conn.execute(
+                '''
+                INSERT INTO daily_command_usage (command_key, usage_day, usage_count)
+                VALUES (?, ?, 1)
+                ON CONFLICT(command_key, usage_day)
+                DO UPDATE SET usage_count = usage_count + 1
+                ''',
+                (command_key, usage_day),
+            )
+            return used + 1
+
+    # Tomar o renovar un arrendamiento: lo obtiene si está libre, caducado o ya es de `owner`.
+    # Un solo UPSERT condicional, así dos procesos nunca creen ser dueños a la vez.
+    def acquire_lease(self, name, owner, ttl_seconds, now=None):
+        now = time.time() if now is None else now
+        with self.get_connection() as conn:
+            cursor = conn.execute(
+                '''
+                INSERT INTO leases (name, owner, acquired_at, expires_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET
+                    acquired_at = CASE WHEN leases.owner = excluded.owner THEN leases.acquired_at ELSE excluded.acquired_at END,
+                    owner = excluded.owner,
+                    expires_at = excluded.expires_at
+                WHERE leases.owner = excluded.owner OR leases.expires_at <= excluded.acquired_at
+                ''',
+                (name, owner, now, now + ttl_seconds),
+            )
+            conn.commit()
+            return cursor.rowcount > 0
+
+    # Liberar arrendamientos propios (al cerrar) para que otra instancia los tome sin esperar la caducidad
+    def release_leases(self, names, owner):
+        names = list(names)
+        if not names:
+            return 0
+        with self.get_connection() as conn:
+            cursor = conn.executemany('DELETE FROM leases WHERE name = ? AND owner = ?', [(name, owner) for name in names])
+            conn.commit()
+            return cursor.rowcount
+
+    # Arrendamientos vigentes (opcionalmente por prefijo): [(name, owner, expires_at)]
+    def get_leases(self, prefix=None, now=None):
+        now = time.time() if now is None else now
+        with self.get_connection() as conn:
+            if prefix:
+                return conn.execute(
+                    'SELECT name, owner, expires_at FROM leases WHERE expires_at > ? AND substr(name, 1, ?) = ? ORDER BY name',
+                    (now, len(prefix), prefix),
+                ).fetchall()
+            return conn.execute('SELECT name, owner, expires_at FROM leases WHERE expires_at > ? ORDER BY name', (now,)).fetchall()
+
+    # Cookies de una sesión externa (JSON), compartidas entre reinicios e instancias
+    def save_http_cookies(self, name, cookies):
+        with self.get_connection() as conn:
+            conn.execute(
+                '''
+                INSERT INTO http_sessions (name, cookies, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET cookies = excluded.cookies, updated_at = excluded.updated_at
+                ''',
+                (name, cookies, time.time()),
+            )
+            conn.commit()
+
+    def get_http_cookies(self, name):
+        with self.get_connection() as conn:
+            row = conn.execute('SELECT cookies FROM http_sessions WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+    def delete_http_cookies(self, name):
+        with self.get_connection() as conn:
+            conn.execute('DELETE FROM http_sessions WHERE name = ?', (name,))
+            conn.commit()
+
+    # Página en caché del monitor de cursos: (etag, last_modified, content_hash, body comprimido) o None
+    def get_cached_page(self, url):
+        with self.get_connection() as conn:
+            return conn.execute(
+                'SELECT etag, last_modified, content_hash, body FROM page_cache WHERE url = ?',
+                (url,),
+            ).fetchone()
+
+    def save_cached_page(self, url, etag, last_modified, content_hash, body):
+        with self.get_connection() as conn:
+            conn.execute(
+                '''
+                INSERT INTO page_cache (url, etag, last_modified, content_hash, body, fetched_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    etag = excluded.etag,
+                    last_modified = excluded.last_modified,
+                    content_hash = excluded.content_hash,
+                    body = excluded.body,
+                    fetched_at = excluded.fetched_at
+                ''',
+                (url, etag, last_modified, content_hash, body, time.time()),
+            )
+            conn.commit()
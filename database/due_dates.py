@@ -0,0 +1,17 @@
+# due_dates.py - Normalización de fechas de entrega a epoch
+import datetime
+from zoneinfo import ZoneInfo
+
+# Las fechas de entrega se capturan como "DD/MM/AAAA HH:MM" en hora de El Salvador;
+# due_ts guarda el mismo instante como epoch (segundos) para poder indexarlo
+DUE_DATE_FORMAT = "%d/%m/%Y %H:%M"
+DUE_DATE_TIMEZONE = ZoneInfo("America/El_Salvador")
+
+
+# Convertir una fecha de entrega de texto a epoch; None si no tiene fecha válida
+def due_date_to_ts(due_date):
+    try:
+        parsed = datetime.datetime.strptime(str(due_date or "").strip(), DUE_DATE_FORMAT)
+    except ValueError:
+        return None
+    return int(parsed.replace(tzinfo=DUE_DATE_TIMEZONE).timestamp())
@@ -0,0 +1,309 @@
+# instrumentation.py - Métricas opt-in de DatabaseHandler: latencias, slow-query log y auditoría de planes
+import collections
+import functools
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger("s4vi.database")
+
+# Límites superiores (ms) de los buckets del histograma de latencias
+LATENCY_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000)
+DEFAULT_SLOW_QUERY_MS = 100
+SLOW_QUERY_LOG_SIZE = 100
+WHITESPACE_REGEX = re.compile(r"\s+")
+
+
+def _env_flag(name):
+    return (os.getenv(name) or "").strip().lower() in {"1", "true", "yes", "on"}
+
+
+def instrumentation_enabled():
+    return _env_flag("DB_INSTRUMENTATION")
+
+
+def _env_slow_query_ms():
+    try:
+        return float(os.getenv("DB_SLOW_QUERY_MS", DEFAULT_SLOW_QUERY_MS))
+    except ValueError:
+        return DEFAULT_SLOW_QUERY_MS
+
+
+def _bucket_label(elapsed_ms):
+    for limit in LATENCY_BUCKETS_MS:
+        if elapsed_ms <= limit:
+            return f"<={limit}ms"
+    return f">{LATENCY_BUCKETS_MS[-1]}ms"
+
+
+def _normalize_sql(sql):
+    return WHITESPACE_REGEX.sub(" ", sql).strip()
+
+
+# Forma de los parámetros sin sus valores (evita registrar datos de usuarios)
+def param_shape(params):
+    if params is None:
+        return "()"
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{key}: {type(value).__name__}" for key, value in params.items()) + "}"
+    return "(" + ", ".join(type(value).__name__ for value in params) + ")"
+
+
+def _new_entry():
+    return {
+        "calls": 0,
+        "total_ms": 0.0,
+        "max_ms": 0.0,
+        "rows": 0,
+        "histogram": collections.Counter(),
+    }
+
+
+class QueryStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.slow_query_ms = DEFAULT_SLOW_QUERY_MS
+        self.plan_audit = False
+        self.reset()
+
+    def configure(self, slow_query_ms=None, plan_audit=None):
+        if slow_query_ms is not None:
+            self.slow_query_ms = slow_query_ms
+        if plan_audit is not None:
+            self.plan_audit = plan_audit
+
+    def reset(self):
+        with self._lock:
+            self.methods = collections.defaultdict(_new_entry)
+            self.statements = collections.defaultdict(_new_entry)
+            self.slow_queries = collections.deque(maxlen=SLOW_QUERY_LOG_SIZE)
+            self.audited_statements = set()
+            self.full_scans = {}
+
+    def _record(self, entry, elapsed_ms, rows):
+        entry["calls"] += 1
+        entry["total_ms"] += elapsed_ms
+        entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+        entry["rows"] += max(0, rows or 0)
+        entry["histogram"][_bucket_label(elapsed_ms)] += 1
+
+    def record_method(self, name, elapsed_ms, rows):
+        with self._lock:
+            self._record(self.methods[name], elapsed_ms, rows)
+
+    def record_statement(self, sql, params, elapsed_ms, rows):
+        statement = _normalize_sql(sql)
+        with self._lock:
+            self._record(self.statements[statement], elapsed_ms, rows)
+            is_slow = elapsed_ms >= self.slow_query_ms
+            if is_slow:
+                self.slow_queries.append(
+                    {
+                        "sql": statement,
+                        "params": param_shape(params),
+                        "ms": round(elapsed_ms, 2),
+                        "at": time.time(),
+                    }
+                )
+        if is_slow:
+            logger.warning("Consulta lenta (%.1f ms): %s %s", elapsed_ms, statement, param_shape(params))
+
+    # Filas leídas de una sentencia ya registrada (statement normalizada)
+    def record_fetched_rows(self, statement, rows):
+        with self._lock:
+            self.statements[statement]["rows"] += rows
+
+    # Devuelve True si la sentencia aún no fue auditada (la marca como auditada)
+    def claim_audit(self, sql):
+        statement = _normalize_sql(sql)
+        with self._lock:
+            if statement in self.audited_statements:
+                return False
+            self.audited_statements.add(statement)
+            return True
+
+    def record_full_scan(self, sql, details):
+        statement = _normalize_sql(sql)
+        with self._lock:
+            self.full_scans[statement] = details
+        logger.warning("Escaneo completo de tabla detectado: %s -> %s", statement, "; ".join(details))
+
+    def _entry_snapshot(self, entry):
+        calls = entry["calls"]
+        return {
+            "calls": calls,
+            "avg_ms": round(entry["total_ms"] / calls, 3) if calls else 0.0,
+            "max_ms": round(entry["max_ms"], 3),
+            "rows": entry["rows"],
+            "histogram": dict(entry["histogram"]),
+        }
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "methods": {name: self._entry_snapshot(entry) for name, entry in self.methods.items()},
+                "statements": {sql: self._entry_snapshot(entry) for sql, entry in self.statements.items()},
+                "slow_queries": list(self.slow_queries),
+                "full_scans": {sql: list(details) for sql, details in self.full_scans.items()},
+                "slow_query_ms": self.slow_query_ms,
+                "plan_audit": self.plan_audit,
+            }
+
+    # Resumen de texto para el comando administrativo
+    def format_report(self, limit=10):
+        data = self.snapshot()
+        lines = ["Métodos (llamadas | prom ms | máx ms | filas):"]
+        methods = sorted(data["methods"].items(), key=lambda item: item[1]["avg_ms"] * item[1]["calls"], reverse=True)
+        for name, entry in methods[:limit]:
+            lines.append(f"  {name}: {entry['calls']} | {entry['avg_ms']} | {entry['max_ms']} | {entry['rows']}")
+        if not methods:
+            lines.append("  (sin datos; active DB_INSTRUMENTATION=1)")
+
+        lines.append(f"Consultas lentas (>= {data['slow_query_ms']} ms): {len(data['slow_queries'])}")
+        for slow in data["slow_queries"][-limit:]:
+            lines.append(f"  {slow['ms']} ms {slow['sql'][:120]} {slow['params']}")
+
+        if data["plan_audit"]:
+            lines.append(f"Escaneos completos detectados: {len(data['full_scans'])}")
+            for sql, details in list(data["full_scans"].items())[:limit]:
+                lines.append(f"  {sql[:120]} -> {'; '.join(details)}")
+        return "\n".join(lines)
+
+
+QUERY_STATS = QueryStats()
+
+# Proveedores adicionales de métricas (caché, lotes, mantenimiento...) expuestos junto a las consultas
+STATS_PROVIDERS = {}
+
+
+def register_stats_provider(name, provider):
+    STATS_PROVIDERS[name] = provider
+
+
+def collect_stats():
+    data = {"consultas": QUERY_STATS.snapshot()}
+    for name, provider in list(STATS_PROVIDERS.items()):
+        try:
+            data[name] = provider()
+        except Exception:
+            logger.exception("No se pudieron obtener métricas de %s", name)
+            data[name] = None
+    return data
+
+
+def _is_full_scan(detail):
+    return detail.startswith("SCAN ") and "USING" not in detail
+
+
+# Filas por sentencia: las que devuelven resultados (SELECT, RETURNING) cuentan lo leído con
+# fetch*/iteración; el resto usa rowcount (filas modificadas), que SQLite deja en -1 para un SELECT
+class InstrumentedCursor(sqlite3.Cursor):
+    _fetched_statement = None
+
+    def execute(self, sql, parameters=()):
+        if QUERY_STATS.plan_audit and sql.lstrip()[:6].upper() in {"SELECT", "UPDATE", "DELETE"}:
+            self._audit_plan(sql, parameters)
+        self._fetched_statement = None
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            returns_rows = self.description is not None
+            QUERY_STATS.record_statement(sql, parameters, (time.perf_counter() - started) * 1000, 0 if returns_rows else self.rowcount)
+            if returns_rows:
+                self._fetched_statement = _normalize_sql(sql)
+
+    def executemany(self, sql, seq_of_parameters):
+        seq_of_parameters = list(seq_of_parameters)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            sample = seq_of_parameters[0] if seq_of_parameters else ()
+            QUERY_STATS.record_statement(sql, sample, (time.perf_counter() - started) * 1000, self.rowcount)
+
+    def _count_fetched(self, rows):
+        if self._fetched_statement is not None and rows:
+            QUERY_STATS.record_fetched_rows(self._fetched_statement, rows)
+
+    def fetchone(self):
+        row = super().fetchone()
+        self._count_fetched(row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany() if size is None else super().fetchmany(size)
+        self._count_fetched(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        self._count_fetched(len(rows))
+        return rows
+
+    def __next__(self):
+        row = super().__next__()
+        self._count_fetched(1)
+        return row
+
+    def _audit_plan(self, sql, parameters):
+        if not QUERY_STATS.claim_audit(sql):
+            return
+        try:
+            plan_cursor = sqlite3.Cursor(self.connection)
+            plan_cursor.execute(f"EXPLAIN QUERY PLAN {sql}", parameters)
+            details = [row[3] for row in plan_cursor.fetchall()]
+        except sqlite3.Error:
+            return
+        scans = [detail for detail in details if _is_full_scan(detail)]
+        if scans:
+            QUERY_STATS.record_full_scan(sql, scans)
+
+
+# Conexión cuyos cursores registran tiempos por sentencia
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def _result_rows(result):
+    if result is None or isinstance(result, bool):
+        return 0
+    if isinstance(result, (list, tuple, set, dict)):
+        return len(result)
+    return 1
+
+
+# Envolver un método público del handler para contar llamadas, latencia y filas devueltas
+def instrument_method(name, method):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        result = None
+        try:
+            result = method(*args, **kwargs)
+            return result
+        finally:
+            QUERY_STATS.record_method(name, (time.perf_counter() - started) * 1000, _result_rows(result))
+
+    return wrapper
+
+
+# Aplicar la configuración de entorno y envolver los métodos públicos de un backend de almacenamiento
+def instrument_handler(handler, skip=()):
+    QUERY_STATS.configure(slow_query_ms=_env_slow_query_ms(), plan_audit=_env_flag("DB_QUERY_PLAN_AUDIT"))
+    for name in dir(type(handler)):
+        if name.startswith("_") or name in skip:
+            continue
+        method = getattr(handler, name)
+        if callable(method):
+            setattr(handler, name, instrument_method(name, method))
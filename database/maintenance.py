@@ -0,0 +1,202 @@
+# maintenance.py - Retención por tabla, borrado por lotes y compactación incremental
+import datetime
+import logging
+import os
+import time
+
+from database.task_row import TASK_SELECT_COLUMNS
+
+logger = logging.getLogger("s4vi.database")
+
+DEFAULT_BATCH_ROWS = 500
+DEFAULT_BATCH_PAUSE_MS = 50
+DEFAULT_VACUUM_PAGES = 2000
+DEFAULT_ARCHIVE_GRACE_DAYS = 14
+
+# Reglas de retención: condición de expiración, formato del corte y días por defecto.
+# Por defecto solo se purgan las filas hijas (recordatorios, entregas y mensajes) de tareas vencidas
+# hace mucho; las tareas y el archivo de !archivo se conservan salvo que se active su regla con
+# DB_RETENTION_TASKS_DAYS / DB_RETENTION_TASKS_ARCHIVE_DAYS (una tarea purgada arrastra sus hijas por
+# ON DELETE CASCADE). course_watch_items debe conservarse más que las tareas: si un ítem se purga
+# mientras sigue publicado en el curso, el siguiente escaneo lo trataría como nuevo.
+PAST_DUE_TASKS = "task_id IN (SELECT id FROM tasks WHERE due_ts IS NOT NULL AND due_ts < ?)"
+RETENTION_RULES = {
+    "sent_reminders": {
+        "where": PAST_DUE_TASKS,
+        "cutoff_format": None,
+        "default_days": 120,
+    },
+    "deliveries": {
+        "where": PAST_DUE_TASKS,
+        "cutoff_format": None,
+        "default_days": 120,
+    },
+    "task_messages": {
+        "where": PAST_DUE_TASKS,
+        "cutoff_format": None,
+        "default_days": 120,
+    },
+    "tasks": {
+        "where": "due_ts IS NOT NULL AND due_ts < ?",
+        "cutoff_format": None,
+        "default_days": 0,
+    },
+    "tasks_archive": {
+        "where": "due_ts < ?",
+        "cutoff_format": None,
+        "default_days": 0,
+    },
+    "course_watch_items": {
+        "where": "first_seen < ?",
+        "cutoff_format": "%Y-%m-%d %H:%M:%S",
+        "default_days": 365,
+    },
+    "daily_command_usage": {
+        "where": "usage_day < ?",
+        "cutoff_format": "%Y-%m-%d",
+        "default_days": 90,
+    },
+    # Páginas que no cambiaron en este tiempo se vuelven a descargar completas una vez
+    "page_cache": {
+        "where": "fetched_at < ?",
+        "cutoff_format": None,
+        "default_days": 30,
+    },
+}
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+# Días de retención por tabla (DB_RETENTION_<TABLA>_DAYS); 0 desactiva la purga
+def load_retention_days(overrides=None):
+    days = {
+        table: _env_int(f"DB_RETENTION_{table.upper()}_DAYS", rule["default_days"])
+        for table, rule in RETENTION_RULES.items()
+    }
+    days.update(overrides or {})
+    return days
+
+
+# Valor de corte comparable con la columna de la regla (epoch o texto ordenable)
+def retention_cutoff(table, days, now=None):
+    rule = RETENTION_RULES[table]
+    cutoff = (now or datetime.datetime.now()) - datetime.timedelta(days=days)
+    if rule["cutoff_format"] is None:
+        return int(cutoff.timestamp())
+    return cutoff.strftime(rule["cutoff_format"])
+
+
+# Borrar filas expiradas de una tabla en transacciones cortas de hasta batch_rows filas,
+# con una pausa entre lotes para no acaparar el lock de escritura
+def purge_table(conn, table, days, batch_rows=DEFAULT_BATCH_ROWS, pause_ms=DEFAULT_BATCH_PAUSE_MS, now=None):
+    rule = RETENTION_RULES[table]
+    cutoff = retention_cutoff(table, days, now)
+    sql = (
+        f"DELETE FROM {table} WHERE rowid IN "
+        f"(SELECT rowid FROM {table} WHERE {rule['where']} LIMIT ?)"
+    )
+
+    deleted = 0
+    batches = 0
+    while True:
+        with conn:
+            removed = conn.execute(sql, (cutoff, batch_rows)).rowcount
+        deleted += removed
+        batches += 1
+        if removed < batch_rows:
+            break
+        if pause_ms:
+            time.sleep(pause_ms / 1000)
+    return deleted, batches
+
+
+# Días de gracia tras la fecha de entrega antes de archivar (DB_ARCHIVE_GRACE_DAYS); 0 desactiva el archivado
+def load_archive_grace_days(override=None):
+    return _env_int("DB_ARCHIVE_GRACE_DAYS", DEFAULT_ARCHIVE_GRACE_DAYS) if override is None else override
+
+
+# Mover a tasks_archive las tareas vencidas hace más de grace_days junto con sus mensajes y entregas.
+# Cada lote es una transacción (copiar y borrar); los recordatorios enviados caen por ON DELETE CASCADE
+def archive_tasks(conn, grace_days, batch_rows=DEFAULT_BATCH_ROWS, pause_ms=DEFAULT_BATCH_PAUSE_MS, now=None):
+    cutoff = int(((now or datetime.datetime.now()) - datetime.timedelta(days=grace_days)).timestamp())
+    archived = 0
+    batches = 0
+    while True:
+        with conn:
+            task_ids = [
+                row[0]
+                for row in conn.execute(
+                    'SELECT id FROM tasks WHERE due_ts IS NOT NULL AND due_ts < ? ORDER BY due_ts LIMIT ?',
+                    (cutoff, batch_rows),
+                )
+            ]
+            if task_ids:
+                placeholders = ", ".join("?" for _ in task_ids)
+                conn.execute(
+                    f'INSERT OR REPLACE INTO tasks_archive ({TASK_SELECT_COLUMNS}, archived_at) '
+                    f'SELECT {TASK_SELECT_COLUMNS}, ? FROM tasks WHERE id IN ({placeholders})',
+                    [int(time.time()), *task_ids],
+                )
+                conn.execute(
+                    f'INSERT INTO task_messages_archive (task_id, channel_id, message_id) '
+                    f'SELECT task_id, channel_id, message_id FROM task_messages WHERE task_id IN ({placeholders})',
+                    task_ids,
+                )
+                conn.execute(
+                    f'INSERT OR REPLACE INTO deliveries_archive (task_id, user_id, delivery_date, guild_id) '
+                    f'SELECT task_id, user_id, delivery_date, guild_id FROM deliveries WHERE task_id IN ({placeholders})',
+                    task_ids,
+                )
+                conn.execute(f'DELETE FROM tasks WHERE id IN ({placeholders})', task_ids)
+        archived += len(task_ids)
+        batches += 1
+        if len(task_ids) < batch_rows:
+            break
+        if pause_ms:
+            time.sleep(pause_ms / 1000)
+    return archived, batches
+
+
+# Devolver al sistema páginas libres (requiere auto_vacuum=INCREMENTAL) y refrescar estadísticas
+def compact(conn, max_pages=DEFAULT_VACUUM_PAGES):
+    freelist_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    # incremental_vacuum avanza una página por paso: hay que consumir el cursor completo
+    conn.execute(f"PRAGMA incremental_vacuum({int(max_pages)})").fetchall()
+    conn.execute("PRAGMA optimize")
+    freelist_after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return {
+        "pages_freed": max(0, freelist_before - freelist_after),
+        "freelist_pages": freelist_after,
+        "page_size": conn.execute("PRAGMA page_size").fetchone()[0],
+    }
+
+
+# Ejecutar archivado, retención y compactación; devuelve un informe para logs y métricas
+def run_maintenance(conn, retention_days=None, batch_rows=None, pause_ms=None, max_pages=None, archive_grace_days=None):
+    batch_rows = max(1, batch_rows or _env_int("DB_MAINTENANCE_BATCH_ROWS", DEFAULT_BATCH_ROWS))
+    pause_ms = DEFAULT_BATCH_PAUSE_MS if pause_ms is None else pause_ms
+    max_pages = max_pages or _env_int("DB_VACUUM_PAGES", DEFAULT_VACUUM_PAGES)
+
+    started = time.perf_counter()
+    report = {"deleted": {}, "batches": 0, "archived": 0}
+    grace_days = load_archive_grace_days(archive_grace_days)
+    if grace_days and grace_days > 0:
+        report["archived"], report["batches"] = archive_tasks(conn, grace_days, batch_rows=batch_rows, pause_ms=pause_ms)
+
+    for table, days in load_retention_days(retention_days).items():
+        if not days or days <= 0:
+            continue
+        deleted, batches = purge_table(conn, table, days, batch_rows=batch_rows, pause_ms=pause_ms)
+        report["deleted"][table] = deleted
+        report["batches"] += batches
+
+    report.update(compact(conn, max_pages=max_pages))
+    report["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    report["finished_at"] = time.time()
+    logger.info("Mantenimiento de base de datos: %s", report)
+    return report
@@ -0,0 +1,504 @@
+# memory_handler.py - Backend de almacenamiento en memoria (dicts/sets), sin E/S de disco
+import datetime
+import threading
+import time
+
+from database.due_dates import due_date_to_ts
+from database.instrumentation import QUERY_STATS, instrument_handler, instrumentation_enabled
+from database.maintenance import load_archive_grace_days, load_retention_days, retention_cutoff
+from database.search import query_terms, rank_tasks, task_id_from_query
+from database.task_row import TaskRow
+
+UNINSTRUMENTED_METHODS = frozenset({"close", "get_query_stats"})
+
+
+# Misma API que DatabaseHandler con las mismas semánticas observables (IDs autoincrementales,
+# borrado en cascada, INSERT OR IGNORE). Pensado para tests, benchmarks y simulaciones de carga.
+# Las TaskRow devueltas son compartidas: los consumidores deben tratarlas como solo lectura.
+class MemoryDatabaseHandler:
+    def __init__(self, db_path=None, instrumentation=None, **_options):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._reset_state()
+        self.maintenance_stats = {"runs": 0, "deleted": {}, "last_run": None}
+        self.instrumented = instrumentation_enabled() if instrumentation is None else bool(instrumentation)
+        if self.instrumented:
+            instrument_handler(self, skip=UNINSTRUMENTED_METHODS)
+
+    def _reset_state(self):
+        self._tasks = {}
+        # guild_id -> {task_id: None}; los IDs crecen, así que el orden de inserción es el orden por ID
+        self._task_ids_by_guild = {}
+        self._next_task_id = 1
+        self._task_messages = {}
+        self._message_tasks = {}
+        self._leases = {}
+        self._http_cookies = {}
+        self._page_cache = {}
+        self._enrollments = {}
+        self._deliveries = {}
+        self._sent_reminders = set()
+        self._course_watch_items = {}
+        self._daily_command_usage = {}
+        # task_id -> (TaskRow, archived_at, mensajes, {user_id: (fecha, guild_id)})
+        self._tasks_archive = {}
+
+    def get_query_stats(self):
+        return QUERY_STATS.snapshot()
+
+    # Sin escrituras diferidas: todo es visible de inmediato
+    def flush_writes(self):
+        return 0
+
+    def get_write_batch_stats(self):
+        return {}
+
+    def get_task_cache_stats(self):
+        return {}
+
+    def close(self):
+        pass
+
+    def init_db(self):
+        return []
+
+    def add_task(self, subject, title, due_date, created_by, guild_id, message_id=None, channel_id=None, reminders_active=1, source_url=None, instructions=None):
+        with self._lock:
+            task_id = self._next_task_id
+            self._next_task_id += 1
+            self._tasks[task_id] = TaskRow(
+                id=task_id,
+                subject=subject,
+                title=title,
+                due_date=due_date,
+                created_by=created_by,
+                guild_id=guild_id,
+                message_id=message_id,
+                channel_id=channel_id,
+                reminders_active=reminders_active,
+                source_url=source_url,
+                due_ts=due_date_to_ts(due_date),
+                instructions=instructions,
+            )
+            self._task_ids_by_guild.setdefault(guild_id, {})[task_id] = None
+            return task_id
+
+    # Como con la clave foránea y la clave primaria en SQLite, se ignoran referencias a tareas
+    # inexistentes y mensajes ya registrados
+    def add_task_message(self, task_id, channel_id, message_id):
+        with self._lock:
+            if task_id in self._tasks and message_id not in self._message_tasks:
+                self._task_messages.setdefault(task_id, []).append((channel_id, message_id))
+                self._message_tasks[message_id] = task_id
+
+    def get_task_messages(self, task_id):
+        with self._lock:
+            return list(self._task_messages.get(task_id, []))
+
+    def get_task_message_index(self):
+        with self._lock:
+            return list(self._message_tasks.items())
+
+    def get_task_id_for_message(self, guild_id, message_id):
+        with self._lock:
+            task_id = self._message_tasks.get(message_id)
+            task = self._tasks.get(task_id)
+            return task_id if task is not None and task.guild_id == guild_id else None
+
+    def update_task(self, task_id, title=None, due_date=None, subject=None, source_url=None, instructions=None):
+        with self._lock:
+            task = self._tasks.get(task_id)
+            fields = {}
+            if title:
+                fields["title"] = title
+            if due_date:
+                fields["due_date"] = due_date
+                fields["due_ts"] = due_date_to_ts(due_date)
+            if subject:
+                fields["subject"] = subject
+            if source_url is not None:
+                fields["source_url"] = source_url
+            if instructions is not None:
+                fields["instructions"] = instructions
+            if not fields:
+                return False
+            if task is None:
+                return False
+            # Nueva instancia: quien conserve la fila anterior no ve cambios a medias
+            self._tasks[task_id] = TaskRow(**{**task.as_dict(), **fields})
+            return True
+
+    def get_tasks(self, guild_id):
+        with self._lock:
+            return [self._tasks[task_id] for task_id in self._task_ids_by_guild.get(guild_id, ())]
+
+    def get_task_by_id(self, task_id):
+        with self._lock:
+            return self._tasks.get(task_id)
+
+    # get_tasks ya devuelve las tareas ordenadas por ID
+    def get_task_choices(self, guild_id, subject=None):
+        tasks = self.get_tasks(guild_id)
+        if subject:
+            tasks = [task for task in tasks if task.subject == subject]
+        return tasks
+
+    # Mismo ranking que sin FTS5 en SQLite (ver database/search.py)
+    def search_tasks(self, guild_id, query, subject=None, limit=25):
+        terms = query_terms(query)
+        tasks = self.get_task_choices(guild_id, subject)
+        if not terms:
+            return tasks[:limit]
+
+        task_id = task_id_from_query(query)
+        results = [task for task in tasks if task.id == task_id]
+        results.extend(task for task in rank_tasks(tasks, terms, limit) if task.id != task_id)
+        return results[:limit]
+
+    def get_tasks_due_between(self, guild_id, start, end, reminders_only=False):
+        if isinstance(start, datetime.datetime):
+            start = start.timestamp()
+        if isinstance(end, datetime.datetime):
+            end = end.timestamp()
+        start, end = int(start), int(end)
+
+        tasks = [
+            task
+            for task in self.get_tasks(guild_id)
+            if task.due_ts is not None
+            and start <= task.due_ts <= end
+            and (not reminders_only or task.reminders_active == 1)
+        ]
+        return sorted(tasks, key=lambda task: task.due_ts)
+
+    def delete_task(self, task_id):
+        self.delete_tasks([task_id])
+
+    def delete_tasks(self, task_ids):
+        message_refs = []
+        removed_ids = set()
+        with self._lock:
+            for task_id in dict.fromkeys(task_ids):
+                task = self._tasks.pop(task_id, None)
+                if task is None:
+                    continue
+                removed_ids.add(task_id)
+                self._task_ids_by_guild.get(task.guild_id, {}).pop(task_id, None)
+                task_message_refs = self._task_messages.pop(task_id, [])
+                for _channel_id, message_id in task_message_refs:
+                    self._message_tasks.pop(message_id, None)
+                message_refs.extend(task_message_refs)
+            # Equivalente al ON DELETE CASCADE de las tablas hijas
+            if removed_ids:
+                self._deliveries = {key: value for key, value in self._deliveries.items() if key[0] not in removed_ids}
+                self._sent_reminders = {key for key in self._sent_reminders if key[0] not in removed_ids}
+            if not self._tasks:
+                self._next_task_id = max(self._tasks_archive, default=0) + 1
+        return len(removed_ids), message_refs
+
+    def delete_tasks_for_guild(self, guild_id):
+        with self._lock:
+            task_ids = list(self._task_ids_by_guild.get(guild_id, ()))
+        return self.delete_tasks(task_ids)
+
+    def set_enrollments(self, user_id, subjects, guild_id):
+        wanted = {subject.strip() for subject in subjects if subject and subject.strip()}
+        with self._lock:
+            current = self._enrollments.get((guild_id, user_id), set())
+            added = sorted(wanted - current)
+            removed = sorted(current - wanted)
+            if wanted:
+                self._enrollments[(guild_id, user_id)] = wanted
+            else:
+                self._enrollments.pop((guild_id, user_id), None)
+        return added, removed
+
+    def import_enrollments(self, rows, guild_id, replace=False):
+        subjects_by_user = {}
+        for user_id, subject in rows:
+            subject = (subject or "").strip()
+            if subject:
+                subjects_by_user.setdefault(int(user_id), set()).add(subject)
+
+        result = {"users": len(subjects_by_user), "added": 0, "removed": 0}
+        with self._lock:
+            for user_id, subjects in subjects_by_user.items():
+                current = self._enrollments.setdefault((guild_id, user_id), set())
+                if replace:
+                    result["removed"] += len(current - subjects)
+                    current &= subjects
+                result["added"] += len(subjects - current)
+                current |= subjects
+        return result
+
+    def get_user_enrollments(self, user_id, guild_id):
+        with self._lock:
+            return sorted(self._enrollments.get((guild_id, user_id), ()))
+
+    def get_enrollment_snapshot(self, guild_id):
+        with self._lock:
+            subjects_by_user = {
+                user_id: set(subjects)
+                for (enrollment_guild, user_id), subjects in self._enrollments.items()
+                if enrollment_guild == guild_id and subjects
+            }
+        return {
+            "users_with_enrollments": set(subjects_by_user),
+            "subjects_by_user": subjects_by_user,
+        }
+
+    def get_delivered_pairs_for_tasks(self, guild_id, task_ids):
+        task_ids = set(task_ids)
+        with self._lock:
+            return {
+                key
+                for key, (_delivery_date, delivery_guild) in self._deliveries.items()
+                if delivery_guild == guild_id and key[0] in task_ids
+            }
+
+    def is_user_enrolled_in_subject(self, user_id, subject, guild_id):
+        with self._lock:
+            subjects = self._enrollments.get((guild_id, user_id))
+            # Por defecto es verdadero si el usuario no tiene inscripciones registradas
+            if not subjects:
+                return True
+            return subject in subjects
+
+    def mark_as_delivered(self, task_id, user_id, guild_id):
+        now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock:
+            if task_id in self._tasks:
+                self._deliveries[(task_id, user_id)] = (now, guild_id)
+
+    def is_delivered(self, task_id, user_id):
+        with self._lock:
+            return (task_id, user_id) in self._deliveries
+
+    def is_reminder_sent(self, task_id, reminder_type):
+        with self._lock:
+            return (task_id, reminder_type) in self._sent_reminders
+
+    def get_sent_reminders_for_tasks(self, task_ids):
+        task_ids = set(task_ids)
+        with self._lock:
+            return {key for key in self._sent_reminders if key[0] in task_ids}
+
+    def mark_reminder_sent(self, task_id, reminder_type):
+        with self._lock:
+            if task_id in self._tasks:
+                self._sent_reminders.add((task_id, reminder_type))
+
+    def add_course_watch_item(self, item_hash, course_name, week_name, activity_type, title, url, guild_id):
+        return bool(self.add_course_watch_items_bulk(
+            [
+                {
+                    "item_hash": item_hash,
+                    "course_name": course_name,
+                    "week_name": week_name,
+                    "activity_type": activity_type,
+                    "title": title,
+                    "url": url,
+                }
+            ],
+            guild_id,
+        ))
+
+    def add_course_watch_items_bulk(self, items, guild_id):
+        first_seen = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        new_hashes = set()
+        with self._lock:
+            for item in items:
+                item_hash = item["item_hash"]
+                if item_hash in self._course_watch_items:
+                    continue
+                self._course_watch_items[item_hash] = {**item, "guild_id": guild_id, "first_seen": first_seen}
+                new_hashes.add(item_hash)
+        return new_hashes
+
+    def get_daily_command_usage(self, command_key, usage_day):
+        with self._lock:
+            return self._daily_command_usage.get((command_key, usage_day), 0)
+
+    def increment_daily_command_usage(self, command_key, usage_day):
+        with self._lock:
+            key = (command_key, usage_day)
+            self._daily_command_usage[key] = self._daily_command_usage.get(key, 0) + 1
+
+    def add_daily_command_usage(self, entries):
+        with self._lock:
+            for command_key, usage_day, delta in entries:
+                key = (command_key, usage_day)
+                self._daily_command_usage[key] = self._daily_command_usage.get(key, 0) + int(delta)
+
+    def reserve_daily_command_usage(self, command_key, usage_day, limit):
+        with self._lock:
+            key = (command_key, usage_day)
+            used = self._daily_command_usage.get(key, 0)
+            if used >= limit:
+                return None
+            self._daily_command_usage[key] = used + 1
+            return used + 1
+
+    # Mismas reglas que el UPSERT condicional de SQLite: libre, caducado o ya propio
+    def acquire_lease(self, name, owner, ttl_seconds, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            current = self._leases.get(name)
+            if current is not None and current[0] != owner and current[2] > now:
+                return False
+            acquired_at = current[1] if current is not None and current[0] == owner else now
+            self._leases[name] = (owner, acquired_at, now + ttl_seconds)
+            return True
+
+    def release_leases(self, names, owner):
+        released = 0
+        with self._lock:
+            for name in names:
+                if self._leases.get(name, (None,))[0] == owner:
+                    del self._leases[name]
+                    released += 1
+        return released
+
+    def get_leases(self, prefix=None, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            return sorted(
+                (name, owner, expires_at)
+                for name, (owner, _acquired_at, expires_at) in self._leases.items()
+                if expires_at > now and (not prefix or name.startswith(prefix))
+            )
+
+    def save_http_cookies(self, name, cookies):
+        with self._lock:
+            self._http_cookies[name] = cookies
+
+    def get_http_cookies(self, name):
+        with self._lock:
+            return self._http_cookies.get(name)
+
+    def delete_http_cookies(self, name):
+        with self._lock:
+            self._http_cookies.pop(name, None)
+
+    def get_cached_page(self, url):
+        with self._lock:
+            entry = self._page_cache.get(url)
+        return entry[:4] if entry else None
+
+    def save_cached_page(self, url, etag, last_modified, content_hash, body):
+        with self._lock:
+            self._page_cache[url] = (etag, last_modified, content_hash, body, time.time())
+
+    def _archive_tasks(self, grace_days):
+        cutoff = int((datetime.datetime.now() - datetime.timedelta(days=grace_days)).timestamp())
+        archived_at = int(time.time())
+        with self._lock:
+            expired = [task for task in self._tasks.values() if task.due_ts is not None and task.due_ts < cutoff]
+            for task in expired:
+                deliveries = {
+                    user_id: value for (task_id, user_id), value in self._deliveries.items() if task_id == task.id
+                }
+                self._tasks_archive[task.id] = (task, archived_at, list(self._task_messages.get(task.id, [])), deliveries)
+            self.delete_tasks([task.id for task in expired])
+        return len(expired)
+
+    def get_archived_tasks(self, guild_id, query=None, subject=None, limit=20):
+        with self._lock:
+            tasks = [
+                task
+                for task, _archived_at, _messages, _deliveries in self._tasks_archive.values()
+                if task.guild_id == guild_id and (not subject or task.subject == subject)
+            ]
+        tasks.sort(key=lambda task: (task.due_ts or 0, task.id), reverse=True)
+        terms = query_terms(query)
+        return rank_tasks(tasks, terms, limit) if terms else tasks[:limit]
+
+    def get_archived_task(self, task_id):
+        with self._lock:
+            entry = self._tasks_archive.get(task_id)
+            if entry is None:
+                return None
+            task, _archived_at, messages, deliveries = entry
+            return {"task": task, "messages": list(messages), "delivered_by": sorted(deliveries)}
+
+    # Aplica el mismo archivado y las mismas reglas de retención que el backend SQLite (sin compactación)
+    def run_maintenance(self, retention_days=None, batch_rows=None, pause_ms=None, max_pages=None, archive_grace_days=None):
+        started = time.perf_counter()
+        deleted = {}
+        grace_days = load_archive_grace_days(archive_grace_days)
+        archived = self._archive_tasks(grace_days) if grace_days and grace_days > 0 else 0
+        for table, days in load_retention_days(retention_days).items():
+            if not days or days <= 0:
+                continue
+            cutoff = retention_cutoff(table, days)
+            with self._lock:
+                if table in ("sent_reminders", "deliveries", "task_messages"):
+                    past_due = {task.id for task in self._tasks.values() if task.due_ts is not None and task.due_ts < cutoff}
+                if table == "sent_reminders":
+                    expired = {key for key in self._sent_reminders if key[0] in past_due}
+                    self._sent_reminders -= expired
+                    deleted[table] = len(expired)
+                elif table == "deliveries":
+                    expired = [key for key in self._deliveries if key[0] in past_due]
+                    for key in expired:
+                        del self._deliveries[key]
+                    deleted[table] = len(expired)
+                elif table == "task_messages":
+                    deleted[table] = 0
+                    for task_id in past_due & set(self._task_messages):
+                        for _channel_id, message_id in self._task_messages.pop(task_id):
+                            self._message_tasks.pop(message_id, None)
+                            deleted[table] += 1
+                elif table == "tasks":
+                    expired = [task.id for task in self._tasks.values() if task.due_ts is not None and task.due_ts < cutoff]
+                    deleted[table] = self.delete_tasks(expired)[0]
+                elif table == "tasks_archive":
+                    expired = [task_id for task_id, entry in self._tasks_archive.items() if entry[0].due_ts < cutoff]
+                    for task_id in expired:
+                        del self._tasks_archive[task_id]
+                    deleted[table] = len(expired)
+                elif table == "course_watch_items":
+                    expired = [key for key, item in self._course_watch_items.items() if item["first_seen"] < cutoff]
+                    for key in expired:
+                        del self._course_watch_items[key]
+                    deleted[table] = len(expired)
+                elif table == "daily_command_usage":
+                    expired = [key for key in self._daily_command_usage if key[1] < cutoff]
+                    for key in expired:
+                        del self._daily_command_usage[key]
+                    deleted[table] = len(expired)
+                elif table == "page_cache":
+                    expired = [url for url, entry in self._page_cache.items() if entry[4] < cutoff]
+                    for url in expired:
+                        del self._page_cache[url]
+                    deleted[table] = len(expired)
+
+        report = {
+            "deleted": deleted,
+            "archived": archived,
+            "batches": len(deleted),
+            "pages_freed": 0,
+            "freelist_pages": 0,
+            "page_size": 0,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+            "finished_at": time.time(),
+        }
+        self.maintenance_stats["runs"] += 1
+        for table, count in deleted.items():
+            self.maintenance_stats["deleted"][table] = self.maintenance_stats["deleted"].get(table, 0) + count
+        self.maintenance_stats["last_run"] = report
+        return report
+
+    # Nada que respaldar: los datos viven solo en este proceso
+    def backup(self, backup_dir=None, pages_per_step=None, step_sleep_ms=None, compress=None, keep=None):
+        return None
+
+    def get_backup_stats(self):
+        return {"runs": 0, "failures": 0, "last_run": None}
+
+    def get_maintenance_stats(self):
+        return {
+            "runs": self.maintenance_stats["runs"],
+            "deleted": dict(self.maintenance_stats["deleted"]),
+            "last_run": self.maintenance_stats["last_run"],
+        }
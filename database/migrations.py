@@ -0,0 +1,428 @@
+# migrations.py - Migraciones de esquema versionadas con PRAGMA user_version
+import logging
+import time
+
+from database.due_dates import due_date_to_ts
+
+logger = logging.getLogger("s4vi.database")
+
+# Registro ordenado: (versión, nombre, función, transaccional)
+MIGRATIONS = []
+
+
+def migration(version, name, transactional=True):
+    def register(fn):
+        if MIGRATIONS and version <= MIGRATIONS[-1][0]:
+            raise ValueError(f"Migración {version} fuera de orden")
+        MIGRATIONS.append((version, name, fn, transactional))
+        return fn
+
+    return register
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _column_exists(cursor, table, column):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return any(row[1] == column for row in cursor.fetchall())
+
+
+def _add_column_if_missing(cursor, table, column, definition):
+    if not _column_exists(cursor, table, column):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+@migration(1, "esquema base")
+def _create_base_schema(cursor):
+    # Definición de la tabla de tareas
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            subject TEXT NOT NULL,
+            title TEXT NOT NULL,
+            due_date TEXT NOT NULL,
+            created_by INTEGER NOT NULL,
+            guild_id INTEGER NOT NULL,
+            message_id INTEGER,
+            channel_id INTEGER,
+            reminders_active INTEGER DEFAULT 1,
+            source_url TEXT
+        )
+    ''')
+
+    # Tabla para rastrear todos los mensajes relacionados con una tarea (anuncios, notificaciones, etc.)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS task_messages (
+            task_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            FOREIGN KEY (task_id) REFERENCES tasks (id)
+        )
+    ''')
+
+    # Mapeo de inscripciones de usuarios por materia
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS enrollments (
+            user_id INTEGER NOT NULL,
+            subject TEXT NOT NULL,
+            guild_id INTEGER NOT NULL,
+            PRIMARY KEY (user_id, subject, guild_id)
+        )
+    ''')
+
+    # Seguimiento de entregas de tareas
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS deliveries (
+            task_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            delivery_date TEXT NOT NULL,
+            guild_id INTEGER NOT NULL,
+            PRIMARY KEY (task_id, user_id)
+        )
+    ''')
+
+    # Seguimiento de recordatorios enviados para evitar duplicados
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sent_reminders (
+            task_id INTEGER NOT NULL,
+            reminder_type TEXT NOT NULL,
+            PRIMARY KEY (task_id, reminder_type)
+        )
+    ''')
+
+    # Registro de actividades detectadas en cursos virtuales (evita duplicados por hash)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS course_watch_items (
+            item_hash TEXT PRIMARY KEY,
+            course_name TEXT NOT NULL,
+            week_name TEXT NOT NULL,
+            activity_type TEXT NOT NULL,
+            title TEXT NOT NULL,
+            url TEXT NOT NULL,
+            guild_id INTEGER NOT NULL,
+            first_seen TEXT NOT NULL
+        )
+    ''')
+
+    # Contador diario global para comandos sensibles (rate limiting persistente)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_command_usage (
+            command_key TEXT NOT NULL,
+            usage_day TEXT NOT NULL,
+            usage_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (command_key, usage_day)
+        )
+    ''')
+
+    # Bases creadas antes de estas columnas (user_version = 0 con esquema antiguo)
+    _add_column_if_missing(cursor, "tasks", "reminders_active", "INTEGER DEFAULT 1")
+    _add_column_if_missing(cursor, "tasks", "source_url", "TEXT")
+
+    # Índices para optimizar consultas frecuentes
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_guild_id ON tasks (guild_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_task_messages_task_id ON task_messages (task_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_enrollments_guild_user ON enrollments (guild_id, user_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_deliveries_guild_task_user ON deliveries (guild_id, task_id, user_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_course_watch_items_guild ON course_watch_items (guild_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_daily_command_usage_day ON daily_command_usage (usage_day)')
+
+
+@migration(2, "fecha de entrega normalizada (due_ts)")
+def _add_due_ts(cursor):
+    _add_column_if_missing(cursor, "tasks", "due_ts", "INTEGER")
+
+    cursor.execute("SELECT id, due_date FROM tasks WHERE due_ts IS NULL AND due_date != 'No asignada'")
+    backfill = [(due_date_to_ts(due_date), task_id) for task_id, due_date in cursor.fetchall()]
+    backfill = [row for row in backfill if row[0] is not None]
+    if backfill:
+        cursor.executemany('UPDATE tasks SET due_ts = ? WHERE id = ?', backfill)
+
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_guild_due_ts ON tasks (guild_id, due_ts)')
+
+
+# Reconstruir una tabla hija con su nueva definición, conservando solo filas con tarea existente
+# (las que chocan con la nueva clave primaria se descartan como duplicadas)
+def _rebuild_child_table(cursor, table, create_sql, columns):
+    cursor.execute(create_sql.format(table=f"{table}_new"))
+    column_list = ", ".join(columns)
+    cursor.execute(
+        f"INSERT OR IGNORE INTO {table}_new ({column_list}) "
+        f"SELECT {column_list} FROM {table} WHERE task_id IN (SELECT id FROM tasks)"
+    )
+    total = cursor.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    orphans = cursor.execute(
+        f"SELECT COUNT(*) FROM {table} WHERE task_id IS NULL OR task_id NOT IN (SELECT id FROM tasks)"
+    ).fetchone()[0]
+    duplicates = total - orphans - cursor.execute(f"SELECT COUNT(*) FROM {table}_new").fetchone()[0]
+    cursor.execute(f"DROP TABLE {table}")
+    cursor.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+    if orphans:
+        logger.info("Migración: %s filas huérfanas descartadas de %s", orphans, table)
+    if duplicates:
+        logger.info("Migración: %s filas duplicadas descartadas de %s", duplicates, table)
+
+
+@migration(3, "claves foráneas con ON DELETE CASCADE")
+def _add_cascading_foreign_keys(cursor):
+    _rebuild_child_table(
+        cursor,
+        "task_messages",
+        '''
+            CREATE TABLE {table} (
+                task_id INTEGER NOT NULL REFERENCES tasks (id) ON DELETE CASCADE,
+                channel_id INTEGER NOT NULL,
+                message_id INTEGER NOT NULL
+            )
+        ''',
+        ("task_id", "channel_id", "message_id"),
+    )
+    _rebuild_child_table(
+        cursor,
+        "deliveries",
+        '''
+            CREATE TABLE {table} (
+                task_id INTEGER NOT NULL REFERENCES tasks (id) ON DELETE CASCADE,
+                user_id INTEGER NOT NULL,
+                delivery_date TEXT NOT NULL,
+                guild_id INTEGER NOT NULL,
+                PRIMARY KEY (task_id, user_id)
+            )
+        ''',
+        ("task_id", "user_id", "delivery_date", "guild_id"),
+    )
+    _rebuild_child_table(
+        cursor,
+        "sent_reminders",
+        '''
+            CREATE TABLE {table} (
+                task_id INTEGER NOT NULL REFERENCES tasks (id) ON DELETE CASCADE,
+                reminder_type TEXT NOT NULL,
+                PRIMARY KEY (task_id, reminder_type)
+            )
+        ''',
+        ("task_id", "reminder_type"),
+    )
+
+    # Los índices se eliminan junto con las tablas originales
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_task_messages_task_id ON task_messages (task_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_deliveries_guild_task_user ON deliveries (guild_id, task_id, user_id)')
+
+
+@migration(4, "índices para la retención")
+def _add_retention_indexes(cursor):
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_due_ts ON tasks (due_ts)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_course_watch_items_first_seen ON course_watch_items (first_seen)')
+
+
+@migration(5, "auto_vacuum incremental", transactional=False)
+def _enable_incremental_auto_vacuum(cursor):
+    # 2 = INCREMENTAL; en una base existente el cambio solo aplica tras un VACUUM completo
+    if cursor.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        return
+    cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    # Reescribe la base completa: en bases grandes el arranque se demora aquí
+    logger.info("Migración: VACUUM completo para activar auto_vacuum incremental...")
+    started = time.perf_counter()
+    cursor.execute("VACUUM")
+    logger.info("Migración: VACUUM completado en %.1f s", time.perf_counter() - started)
+
+
+def _fts5_available(cursor):
+    return any(row[0] == "ENABLE_FTS5" for row in cursor.execute("PRAGMA compile_options"))
+
+
+@migration(6, "instrucciones y búsqueda de texto completo")
+def _add_task_search(cursor):
+    _add_column_if_missing(cursor, "tasks", "instructions", "TEXT")
+    if not _fts5_available(cursor):
+        logger.warning("SQLite compilado sin FTS5: la búsqueda de tareas se hará en memoria")
+        return
+
+    # Índice de contenido externo: el texto vive solo en tasks; los triggers mantienen el índice
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+            title, subject, instructions,
+            content='tasks', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN
+            INSERT INTO tasks_fts (rowid, title, subject, instructions)
+            VALUES (new.id, new.title, new.subject, new.instructions);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_delete AFTER DELETE ON tasks BEGIN
+            INSERT INTO tasks_fts (tasks_fts, rowid, title, subject, instructions)
+            VALUES ('delete', old.id, old.title, old.subject, old.instructions);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS tasks_fts_update AFTER UPDATE OF title, subject, instructions ON tasks BEGIN
+            INSERT INTO tasks_fts (tasks_fts, rowid, title, subject, instructions)
+            VALUES ('delete', old.id, old.title, old.subject, old.instructions);
+            INSERT INTO tasks_fts (rowid, title, subject, instructions)
+            VALUES (new.id, new.title, new.subject, new.instructions);
+        END
+    ''')
+    cursor.execute("INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild')")
+
+
+@migration(7, "archivo de tareas vencidas")
+def _add_task_archive(cursor):
+    # Misma forma que tasks más archived_at; el ID se conserva para seguir siendo citable
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tasks_archive (
+            id INTEGER PRIMARY KEY,
+            subject TEXT NOT NULL,
+            title TEXT NOT NULL,
+            due_date TEXT NOT NULL,
+            created_by INTEGER NOT NULL,
+            guild_id INTEGER NOT NULL,
+            message_id INTEGER,
+            channel_id INTEGER,
+            reminders_active INTEGER DEFAULT 1,
+            source_url TEXT,
+            due_ts INTEGER,
+            instructions TEXT,
+            archived_at INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS task_messages_archive (
+            task_id INTEGER NOT NULL REFERENCES tasks_archive (id) ON DELETE CASCADE,
+            channel_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS deliveries_archive (
+            task_id INTEGER NOT NULL REFERENCES tasks_archive (id) ON DELETE CASCADE,
+            user_id INTEGER NOT NULL,
+            delivery_date TEXT NOT NULL,
+            guild_id INTEGER NOT NULL,
+            PRIMARY KEY (task_id, user_id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_archive_guild_due_ts ON tasks_archive (guild_id, due_ts)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_archive_due_ts ON tasks_archive (due_ts)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_task_messages_archive_task_id ON task_messages_archive (task_id)')
+
+
+@migration(8, "clave primaria por mensaje en task_messages")
+def _key_task_messages_by_message(cursor):
+    # Los IDs de mensaje de Discord son únicos: como clave primaria resuelven mensaje -> tarea
+    # sin escaneo (reacciones y botones) y descartan filas duplicadas
+    _rebuild_child_table(
+        cursor,
+        "task_messages",
+        '''
+            CREATE TABLE {table} (
+                message_id INTEGER PRIMARY KEY,
+                task_id INTEGER NOT NULL REFERENCES tasks (id) ON DELETE CASCADE,
+                channel_id INTEGER NOT NULL
+            )
+        ''',
+        ("message_id", "task_id", "channel_id"),
+    )
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_task_messages_task_id ON task_messages (task_id)')
+
+
+@migration(9, "arrendamientos entre instancias")
+def _add_leases(cursor):
+    # Un dueño por trabajo en segundo plano; se renueva con latidos y caduca en expires_at (epoch)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            acquired_at REAL NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+
+
+@migration(10, "cookies de sesión HTTP persistidas")
+def _add_http_sessions(cursor):
+    # Cookies serializadas (JSON) de sesiones externas, p. ej. Moodle, para no iniciar sesión en cada escaneo
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS http_sessions (
+            name TEXT PRIMARY KEY,
+            cookies TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    ''')
+
+
+@migration(11, "caché de páginas HTTP")
+def _add_page_cache(cursor):
+    # Última versión de cada página de CVirtual: validadores HTTP, hash del contenido y cuerpo comprimido (zlib)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS page_cache (
+            url TEXT PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT,
+            content_hash TEXT NOT NULL,
+            body BLOB NOT NULL,
+            fetched_at REAL NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_page_cache_fetched_at ON page_cache (fetched_at)')
+
+
+def _run_migration(conn, version, fn, transactional):
+    if not transactional:
+        # Operaciones como VACUUM no pueden ejecutarse dentro de una transacción
+        fn(conn.cursor())
+        conn.execute(f"PRAGMA user_version = {int(version)}")
+        return True
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Otro proceso pudo aplicar la migración mientras esperábamos el lock
+        if get_schema_version(conn) >= version:
+            conn.rollback()
+            return False
+        fn(conn.cursor())
+        conn.execute(f"PRAGMA user_version = {int(version)}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return True
+
+
+# Aplicar en orden las migraciones pendientes; devuelve las versiones aplicadas
+def apply_migrations(conn):
+    current = get_schema_version(conn)
+    if current >= latest_version():
+        return []
+
+    applied = []
+    started = time.perf_counter()
+    for version, name, fn, transactional in MIGRATIONS:
+        if version <= current:
+            continue
+        migration_started = time.perf_counter()
+        if _run_migration(conn, version, fn, transactional):
+            applied.append(version)
+            logger.info(
+                "Migración %s (%s) aplicada en %.1f ms",
+                version,
+                name,
+                (time.perf_counter() - migration_started) * 1000,
+            )
+        current = version
+
+    logger.info(
+        "Esquema actualizado a versión %s en %.1f ms",
+        latest_version(),
+        (time.perf_counter() - started) * 1000,
+    )
+    return applied
@@ -0,0 +1,52 @@
+# search.py - Búsqueda de tareas: normalización de texto, consultas FTS5 y ranking de respaldo en Python
+import re
+import unicodedata
+
+WORD_REGEX = re.compile(r"\w+")
+# Términos máximos por consulta (cada uno es una búsqueda de prefijo)
+MAX_QUERY_TERMS = 8
+# Peso de cada columna en el ranking (mismo orden que las columnas de tasks_fts)
+FIELD_WEIGHTS = {"title": 10.0, "subject": 5.0, "instructions": 1.0}
+
+
+# Minúsculas y sin tildes: equivalente a unicode61 remove_diacritics 2
+def normalize_text(text):
+    decomposed = unicodedata.normalize("NFKD", str(text or "").lower())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def query_terms(text):
+    return WORD_REGEX.findall(normalize_text(text))[:MAX_QUERY_TERMS]
+
+
+# Cada término como prefijo entre comillas: el usuario no puede inyectar sintaxis FTS5 (AND, NEAR, columnas)
+def fts_match_expression(terms):
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+# "12" o "#12" también buscan la tarea por ID, como hacían los autocompletados por etiqueta
+def task_id_from_query(text):
+    value = str(text or "").strip().lstrip("#")
+    return int(value) if value.isdigit() else None
+
+
+# Ranking sin FTS5 (backend en memoria o SQLite compilado sin FTS5): todos los términos deben
+# aparecer como prefijo de alguna palabra; pesa más coincidir en el título que en las instrucciones
+def rank_tasks(tasks, terms, limit):
+    scored = []
+    for task in tasks:
+        words = {field: WORD_REGEX.findall(normalize_text(getattr(task, field))) for field in FIELD_WEIGHTS}
+        score = 0.0
+        for term in terms:
+            term_score = sum(
+                weight
+                for field, weight in FIELD_WEIGHTS.items()
+                if any(word.startswith(term) for word in words[field])
+            )
+            if not term_score:
+                break
+            score += term_score
+        else:
+            scored.append((-score, task.id, task))
+    scored.sort(key=lambda entry: entry[:2])
+    return [task for _score, _task_id, task in scored[:limit]]
@@ -0,0 +1,692 @@
+# sharding.py - Modo particionado: una base SQLite por servidor y una base global de enrutamiento
+import argparse
+import contextlib
+import inspect
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from database.backup import DEFAULT_BACKUP_DIR
+from database.db_handler import DELETE_CHUNK_IDS, DatabaseHandler
+from database.instrumentation import QUERY_STATS
+from database.task_row import TASK_SELECT_COLUMNS
+
+logger = logging.getLogger("s4vi.database")
+
+DEFAULT_SHARD_DIR = os.path.join("database", "shards")
+GLOBAL_DB_NAME = "global.db"
+SHARD_FILE_REGEX = re.compile(r"^guild-(\d+)\.db$")
+# Cada base abierta tiene su pool de conexiones, su hilo de escrituras agrupadas y su caché de tareas
+DEFAULT_MAX_OPEN_SHARDS = 32
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def shard_path(shard_dir, guild_id):
+    return os.path.join(shard_dir, f"guild-{int(guild_id)}.db")
+
+
+# Directorio de tareas en la base global: asigna IDs únicos entre servidores y resuelve task_id -> guild_id
+def _ensure_directory_schema(conn):
+    with conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS task_shards (
+                task_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                guild_id INTEGER NOT NULL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_task_shards_guild ON task_shards (guild_id)')
+
+
+def _sum_stats(snapshots):
+    total = {}
+    for snapshot in snapshots:
+        for key, value in snapshot.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                total[key] = total.get(key, 0) + value
+    return total
+
+
+# Misma API que DatabaseHandler, enrutando cada llamada a guild-<id>.db según guild_id (o según el
+# servidor dueño de task_id). Las bases de cada servidor se abren al primer uso, así una purga o un
+# escaneo masivo en un servidor no retiene el lock de escritura de los demás. Como mucho quedan
+# abiertas max_open_shards (DB_MAX_OPEN_SHARDS); al superarlo se cierra la menos usada que no esté en
+# uso. daily_command_usage y el directorio de tareas viven en global.db.
+class ShardedDatabaseHandler:
+    def __init__(
+        self,
+        shard_dir=None,
+        performance_profile=None,
+        write_batch_rows=None,
+        write_batch_ms=None,
+        instrumentation=None,
+        max_open_shards=None,
+        **_options,
+    ):
+        self.shard_dir = shard_dir or os.getenv("DB_SHARD_DIR") or DEFAULT_SHARD_DIR
+        os.makedirs(self.shard_dir, exist_ok=True)
+        # La instrumentación la aplica cada base; este enrutador no se mide para no contar doble
+        self._shard_options = {
+            "performance_profile": performance_profile,
+            "write_batch_rows": write_batch_rows,
+            "write_batch_ms": write_batch_ms,
+            "instrumentation": instrumentation,
+        }
+        self.max_open_shards = max(1, max_open_shards or _env_int("DB_MAX_OPEN_SHARDS", DEFAULT_MAX_OPEN_SHARDS))
+        # guild_id -> handler en orden de uso (LRU) y cuántas llamadas usan cada base ahora mismo
+        self._shards = OrderedDict()
+        self._shard_pins = {}
+        self._shards_evicted = 0
+        self._shards_lock = threading.Lock()
+        self.maintenance_stats = {"runs": 0, "deleted": {}, "last_run": None}
+        self.backup_stats = {"runs": 0, "failures": 0, "last_run": None}
+        self._write_signatures = {}
+
+        self.global_db = DatabaseHandler(os.path.join(self.shard_dir, GLOBAL_DB_NAME), **self._shard_options)
+        conn = self.global_db.get_connection()
+        _ensure_directory_schema(conn)
+        self._task_guilds_lock = threading.Lock()
+        self._task_guilds = dict(conn.execute('SELECT task_id, guild_id FROM task_shards').fetchall())
+
+    # Base del servidor (se abre y migra la primera vez); sin servidor se usa la base global.
+    # Mientras dura el bloque la base no puede cerrarse para dejar sitio a otra.
+    @contextlib.contextmanager
+    def _pinned(self, guild_id):
+        if guild_id is None:
+            yield self.global_db
+            return
+        guild_id = int(guild_id)
+        with self._shards_lock:
+            shard = self._shards.get(guild_id)
+            if shard is None:
+                shard = DatabaseHandler(shard_path(self.shard_dir, guild_id), **self._shard_options)
+                self._shards[guild_id] = shard
+                logger.info("Base particionada abierta para guild %s", guild_id)
+            else:
+                self._shards.move_to_end(guild_id)
+            self._shard_pins[guild_id] = self._shard_pins.get(guild_id, 0) + 1
+            evicted = self._evict_idle_shards()
+        # Cerrar fuera del lock: vuelca las escrituras agrupadas pendientes de cada base
+        for evicted_id, handler in evicted:
+            handler.close()
+            logger.info("Base particionada cerrada para guild %s (límite de %s abiertas)", evicted_id, self.max_open_shards)
+        try:
+            yield shard
+        finally:
+            with self._shards_lock:
+                self._shard_pins[guild_id] -= 1
+                if not self._shard_pins[guild_id]:
+                    del self._shard_pins[guild_id]
+
+    # Sacar del LRU las bases menos usadas sin llamadas en curso (se llama con _shards_lock tomado)
+    def _evict_idle_shards(self):
+        evicted = []
+        for guild_id in list(self._shards):
+            if len(self._shards) <= self.max_open_shards:
+                break
+            if guild_id not in self._shard_pins:
+                evicted.append((guild_id, self._shards.pop(guild_id)))
+        self._shards_evicted += len(evicted)
+        return evicted
+
+    def _open_shards(self):
+        with self._shards_lock:
+            return list(self._shards.values())
+
+    # Servidores con base propia: las ya abiertas más las existentes en disco
+    def shard_ids(self):
+        guild_ids = set()
+        for name in os.listdir(self.shard_dir):
+            match = SHARD_FILE_REGEX.match(name)
+            if match:
+                guild_ids.add(int(match.group(1)))
+        with self._shards_lock:
+            guild_ids.update(self._shards)
+        return sorted(guild_ids)
+
+    # Consultas administrativas entre servidores: fn(handler, guild_id) por cada base.
+    # Devuelve {guild_id: resultado}; los fallos de una base se registran y no cortan el resto
+    def fan_out(self, fn, guild_ids=None):
+        results = {}
+        for guild_id in guild_ids if guild_ids is not None else self.shard_ids():
+            try:
+                with self._pinned(guild_id) as shard:
+                    results[guild_id] = fn(shard, guild_id)
+            except Exception:
+                logger.exception("Fallo en consulta distribuida para guild %s", guild_id)
+        return results
+
+    def _guild_for_task(self, task_id):
+        with self._task_guilds_lock:
+            return self._task_guilds.get(task_id)
+
+    def _group_by_guild(self, task_ids):
+        grouped = {}
+        with self._task_guilds_lock:
+            for task_id in dict.fromkeys(task_ids):
+                guild_id = self._task_guilds.get(task_id)
+                if guild_id is not None:
+                    grouped.setdefault(guild_id, []).append(task_id)
+        return grouped
+
+    # Olvidar tareas del directorio; la secuencia se reinicia si ya no queda ninguna (como en tasks)
+    def _forget_tasks(self, task_ids):
+        task_ids = list(task_ids)
+        if not task_ids:
+            return
+        with self._task_guilds_lock:
+            for task_id in task_ids:
+                self._task_guilds.pop(task_id, None)
+        with self.global_db.get_connection() as conn:
+            for start in range(0, len(task_ids), DELETE_CHUNK_IDS):
+                chunk = task_ids[start:start + DELETE_CHUNK_IDS]
+                placeholders = ", ".join("?" for _ in chunk)
+                conn.execute(f'DELETE FROM task_shards WHERE task_id IN ({placeholders})', chunk)
+            empty = not conn.execute('SELECT EXISTS (SELECT 1 FROM task_shards)').fetchone()[0]
+        if empty:
+            # Sin reutilizar IDs que siguen en el archivo de algún servidor
+            last_archived = max(
+                self.fan_out(
+                    lambda shard, _guild_id: shard.get_connection().execute(
+                        'SELECT COALESCE(MAX(id), 0) FROM tasks_archive'
+                    ).fetchone()[0]
+                ).values(),
+                default=0,
+            )
+            with self.global_db.get_connection() as conn:
+                conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'task_shards'", (last_archived,))
+
+    # Servidor al que afecta una escritura (None si es global o abarca varios servidores).
+    # AsyncDatabaseHandler lo usa para dar a cada servidor su propio hilo escritor
+    def write_shard_for(self, name, args, kwargs):
+        signature = self._write_signatures.get(name)
+        if signature is None:
+            signature = inspect.signature(getattr(type(self), name))
+            self._write_signatures[name] = signature
+        try:
+            arguments = signature.bind(self, *args, **kwargs).arguments
+        except TypeError:
+            return None
+        if arguments.get("guild_id") is not None:
+            return int(arguments["guild_id"])
+        if "task_id" in arguments:
+            return self._guild_for_task(arguments["task_id"])
+        if "task_ids" in arguments:
+            grouped = self._group_by_guild(arguments["task_ids"])
+            return next(iter(grouped)) if len(grouped) == 1 else None
+        return None
+
+    def get_query_stats(self):
+        return QUERY_STATS.snapshot()
+
+    def flush_writes(self):
+        return sum(handler.flush_writes() or 0 for handler in [self.global_db, *self._open_shards()])
+
+    def get_write_batch_stats(self):
+        return _sum_stats(handler.get_write_batch_stats() for handler in [self.global_db, *self._open_shards()])
+
+    def get_task_cache_stats(self):
+        stats = _sum_stats(handler.get_task_cache_stats() for handler in self._open_shards())
+        stats["shards_open"] = len(self._open_shards())
+        stats["shards_evicted"] = self._shards_evicted
+        return stats
+
+    def close(self):
+        with self._shards_lock:
+            shards, self._shards = list(self._shards.values()), OrderedDict()
+        for shard in shards:
+            shard.close()
+        self.global_db.close()
+
+    def init_db(self):
+        applied = self.global_db.init_db()
+        for shard in self._open_shards():
+            shard.init_db()
+        return applied
+
+    # Tareas
+    def add_task(self, subject, title, due_date, created_by, guild_id, message_id=None, channel_id=None, reminders_active=1, source_url=None, instructions=None):
+        with self.global_db.get_connection() as conn:
+            task_id = conn.execute('INSERT INTO task_shards (guild_id) VALUES (?)', (guild_id,)).lastrowid
+        try:
+            with self._pinned(guild_id) as shard:
+                shard.add_task(
+                    subject,
+                    title,
+                    due_date,
+                    created_by,
+                    guild_id,
+                    message_id=message_id,
+                    channel_id=channel_id,
+                    reminders_active=reminders_active,
+                    source_url=source_url,
+                    instructions=instructions,
+                    task_id=task_id,
+                )
+        except Exception:
+            self._forget_tasks([task_id])
+            raise
+        with self._task_guilds_lock:
+            self._task_guilds[task_id] = guild_id
+        return task_id
+
+    # Como con la clave foránea, se ignoran referencias a tareas inexistentes
+    def add_task_message(self, task_id, channel_id, message_id):
+        guild_id = self._guild_for_task(task_id)
+        if guild_id is not None:
+            with self._pinned(guild_id) as shard:
+                shard.add_task_message(task_id, channel_id, message_id)
+
+    def get_task_messages(self, task_id):
+        guild_id = self._guild_for_task(task_id)
+        if guild_id is None:
+            return []
+        with self._pinned(guild_id) as shard:
+            return shard.get_task_messages(task_id)
+
+    # Índice completo de todas las bases (solo al arrancar; después se mantiene en memoria)
+    def get_task_message_index(self):
+        return [pair for pairs in self.fan_out(lambda shard, _guild_id: shard.get_task_message_index()).values() for pair in pairs]
+
+    def get_task_id_for_message(self, guild_id, message_id):
+        with self._pinned(guild_id) as shard:
+            return shard.get_task_id_for_message(guild_id, message_id)
+
+    def update_task(self, task_id, title=None, due_date=None, subject=None, source_url=None, instructions=None):
+        guild_id = self._guild_for_task(task_id)
+        if guild_id is None:
+            return False
+        with self._pinned(guild_id) as shard:
+            return shard.update_task(
+                task_id,
+                title=title,
+                due_date=due_date,
+                subject=subject,
+                source_url=source_url,
+                instructions=instructions,
+            )
+
+    def get_tasks(self, guild_id):
+        with self._pinned(guild_id) as shard:
+            return shard.get_tasks(guild_id)
+
+    def get_task_by_id(self, task_id):
+        guild_id = self._guild_for_task(task_id)
+        if guild_id is None:
+            return None
+        with self._pinned(guild_id) as shard:
+            return shard.get_task_by_id(task_id)
+
+    def get_task_choices(self, guild_id, subject=None):
+        with self._pinned(guild_id) as shard:
+            return shard.get_task_choices(guild_id, subject=subject)
+
+    def search_tasks(self, guild_id, query, subject=None, limit=25):
+        with self._pinned(guild_id) as shard:
+            return shard.search_tasks(guild_id, query, subject=subject, limit=limit)
+
+    def get_tasks_due_between(self, guild_id, start, end, reminders_only=False):
+        with self._pinned(guild_id) as shard:
+            return shard.get_tasks_due_between(guild_id, start, end, reminders_only=reminders_only)
+
+    def delete_task(self, task_id):
+        self.delete_tasks([task_id])
+
+    def delete_tasks(self, task_ids):
+        deleted = 0
+        message_refs = []
+        for guild_id, guild_task_ids in self._group_by_guild(task_ids).items():
+            with self._pinned(guild_id) as shard:
+                shard_deleted, shard_refs = shard.delete_tasks(guild_task_ids)
+            deleted += shard_deleted
+            message_refs.extend(shard_refs)
+            self._forget_tasks(guild_task_ids)
+        return deleted, message_refs
+
+    def delete_tasks_for_guild(self, guild_id):
+        with self._pinned(guild_id) as shard:
+            result = shard.delete_tasks_for_guild(guild_id)
+        with self._task_guilds_lock:
+            task_ids = [task_id for task_id, owner in self._task_guilds.items() if owner == guild_id]
+        self._forget_tasks(task_ids)
+        return result
+
+    def get_archived_tasks(self, guild_id, query=None, subject=None, limit=20):
+        with self._pinned(guild_id) as shard:
+            return shard.get_archived_tasks(guild_id, query=query, subject=subject, limit=limit)
+
+    # El directorio solo conoce tareas activas: se consulta cada base hasta encontrarla
+    def get_archived_task(self, task_id):
+        for archived in self.fan_out(lambda shard, _guild_id: shard.get_archived_task(task_id)).values():
+            if archived is not None:
+                return archived
+        return None
+
+    # Inscripciones
+    def set_enrollments(self, user_id, subjects, guild_id):
+        with self._pinned(guild_id) as shard:
+            return shard.set_enrollments(user_id, subjects, guild_id)
+
+    def import_enrollments(self, rows, guild_id, replace=False):
+        with self._pinned(guild_id) as shard:
+            return shard.import_enrollments(rows, guild_id, replace=replace)
+
+    def get_user_enrollments(self, user_id, guild_id):
+        with self._pinned(guild_id) as shard:
+            return shard.get_user_enrollments(user_id, guild_id)
+
+    def get_enrollment_snapshot(self, guild_id):
+        with self._pinned(guild_id) as shard:
+            return shard.get_enrollment_snapshot(guild_id)
+
+    def is_user_enrolled_in_subject(self, user_id, subject, guild_id):
+        with self._pinned(guild_id) as shard:
+            return shard.is_user_enrolled_in_subject(user_id, subject, guild_id)
+
+    # Entregas y recordatorios
+    def mark_as_delivered(self, task_id, user_id, guild_id):
+        owner = self._guild_for_task(task_id)
+        if owner is not None:
+            with self._pinned(owner) as shard:
+                shard.mark_as_delivered(task_id, user_id, guild_id)
+
+    def is_delivered(self, task_id, user_id):
+        guild_id = self._guild_for_task(task_id)
+        if guild_id is None:
+            return False
+        with self._pinned(guild_id) as shard:
+            return shard.is_delivered(task_id, user_id)
+
+    def get_delivered_pairs_for_tasks(self, guild_id, task_ids):
+        with self._pinned(guild_id) as shard:
+            return shard.get_delivered_pairs_for_tasks(guild_id, task_ids)
+
+    def mark_reminder_sent(self, task_id, reminder_type):
+        guild_id = self._guild_for_task(task_id)
+        if guild_id is not None:
+            with self._pinned(guild_id) as shard:
+                shard.mark_reminder_sent(task_id, reminder_type)
+
+    def is_reminder_sent(self, task_id, reminder_type):
+        guild_id = self._guild_for_task(task_id)
+        if guild_id is None:
+            return False
+        with self._pinned(guild_id) as shard:
+            return shard.is_reminder_sent(task_id, reminder_type)
+
+    def get_sent_reminders_for_tasks(self, task_ids):
+        sent = set()
+        for guild_id, guild_task_ids in self._group_by_guild(task_ids).items():
+            with self._pinned(guild_id) as shard:
+                sent |= shard.get_sent_reminders_for_tasks(guild_task_ids)
+        return sent
+
+    # Monitor de cursos (la novedad se decide por servidor) y límites diarios (globales)
+    def add_course_watch_item(self, item_hash, course_name, week_name, activity_type, title, url, guild_id):
+        with self._pinned(guild_id) as shard:
+            return shard.add_course_watch_item(item_hash, course_name, week_name, activity_type, title, url, guild_id)
+
+    def add_course_watch_items_bulk(self, items, guild_id):
+        with self._pinned(guild_id) as shard:
+            return shard.add_course_watch_items_bulk(items, guild_id)
+
+    def get_daily_command_usage(self, command_key, usage_day):
+        return self.global_db.get_daily_command_usage(command_key, usage_day)
+
+    def increment_daily_command_usage(self, command_key, usage_day):
+        self.global_db.increment_daily_command_usage(command_key, usage_day)
+
+    def add_daily_command_usage(self, entries):
+        self.global_db.add_daily_command_usage(entries)
+
+    def reserve_daily_command_usage(self, command_key, usage_day, limit):
+        return self.global_db.reserve_daily_command_usage(command_key, usage_day, limit)
+
+    # Los arrendamientos coordinan procesos, no servidores: viven en la base global
+    def acquire_lease(self, name, owner, ttl_seconds, now=None):
+        return self.global_db.acquire_lease(name, owner, ttl_seconds, now)
+
+    def release_leases(self, names, owner):
+        return self.global_db.release_leases(names, owner)
+
+    def get_leases(self, prefix=None, now=None):
+        return self.global_db.get_leases(prefix, now)
+
+    def save_http_cookies(self, name, cookies):
+        self.global_db.save_http_cookies(name, cookies)
+
+    def get_http_cookies(self, name):
+        return self.global_db.get_http_cookies(name)
+
+    def delete_http_cookies(self, name):
+        self.global_db.delete_http_cookies(name)
+
+    def get_cached_page(self, url):
+        return self.global_db.get_cached_page(url)
+
+    def save_cached_page(self, url, etag, last_modified, content_hash, body):
+        self.global_db.save_cached_page(url, etag, last_modified, content_hash, body)
+
+    # Mantenimiento base por base; el directorio se depura con las tareas archivadas o purgadas
+    def run_maintenance(self, retention_days=None, batch_rows=None, pause_ms=None, max_pages=None, archive_grace_days=None):
+        started = time.perf_counter()
+        options = {
+            "retention_days": retention_days,
+            "batch_rows": batch_rows,
+            "pause_ms": pause_ms,
+            "max_pages": max_pages,
+            "archive_grace_days": archive_grace_days,
+        }
+        reports = self.fan_out(lambda shard, _guild_id: shard.run_maintenance(**options))
+        reports[None] = self.global_db.run_maintenance(**options)
+
+        for guild_id, shard_report in reports.items():
+            if guild_id is not None and (shard_report["archived"] or shard_report["deleted"].get("tasks")):
+                with self._pinned(guild_id) as shard:
+                    remaining = {row[0] for row in shard.get_connection().execute('SELECT id FROM tasks')}
+                with self._task_guilds_lock:
+                    stale = [task_id for task_id, owner in self._task_guilds.items() if owner == guild_id and task_id not in remaining]
+                self._forget_tasks(stale)
+
+        deleted = {}
+        for shard_report in reports.values():
+            for table, count in shard_report["deleted"].items():
+                deleted[table] = deleted.get(table, 0) + count
+        report = {
+            "deleted": deleted,
+            "archived": sum(shard_report["archived"] for shard_report in reports.values()),
+            "batches": sum(shard_report["batches"] for shard_report in reports.values()),
+            "pages_freed": sum(shard_report["pages_freed"] for shard_report in reports.values()),
+            "freelist_pages": sum(shard_report["freelist_pages"] for shard_report in reports.values()),
+            "page_size": max(shard_report["page_size"] for shard_report in reports.values()),
+            "shards": len(reports),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+            "finished_at": time.time(),
+        }
+        self.maintenance_stats["runs"] += 1
+        for table, count in deleted.items():
+            self.maintenance_stats["deleted"][table] = self.maintenance_stats["deleted"].get(table, 0) + count
+        self.maintenance_stats["last_run"] = report
+        return report
+
+    def get_maintenance_stats(self):
+        return {
+            "runs": self.maintenance_stats["runs"],
+            "deleted": dict(self.maintenance_stats["deleted"]),
+            "last_run": self.maintenance_stats["last_run"],
+        }
+
+    # Un respaldo por base en la misma carpeta; la rotación es independiente por archivo de origen
+    def backup(self, backup_dir=None, pages_per_step=None, step_sleep_ms=None, compress=None, keep=None):
+        backup_dir = backup_dir or os.getenv("DB_BACKUP_DIR") or DEFAULT_BACKUP_DIR
+        options = {
+            "backup_dir": backup_dir,
+            "pages_per_step": pages_per_step,
+            "step_sleep_ms": step_sleep_ms,
+            "compress": compress,
+            "keep": keep,
+        }
+        started = time.perf_counter()
+        try:
+            reports = [self.global_db.backup(**options)]
+            for guild_id in self.shard_ids():
+                with self._pinned(guild_id) as shard:
+                    reports.append(shard.backup(**options))
+        except Exception:
+            self.backup_stats["failures"] += 1
+            raise
+
+        report = {
+            "path": backup_dir,
+            "files": [shard_report["path"] for shard_report in reports],
+            "pages_copied": sum(shard_report["pages_copied"] for shard_report in reports),
+            "steps": sum(shard_report["steps"] for shard_report in reports),
+            "restarts": sum(shard_report["restarts"] for shard_report in reports),
+            "bytes": sum(shard_report["bytes"] for shard_report in reports),
+            "compressed": reports[0]["compressed"],
+            "rotated": [name for shard_report in reports for name in shard_report["rotated"]],
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+            "finished_at": time.time(),
+        }
+        self.backup_stats["runs"] += 1
+        self.backup_stats["last_run"] = report
+        return report
+
+    def get_backup_stats(self):
+        return dict(self.backup_stats)
+
+
+def _copy_guild(conn, guild_id):
+    guild_tasks = 'SELECT id FROM source.tasks WHERE guild_id = ?'
+    conn.execute(
+        f'INSERT INTO tasks ({TASK_SELECT_COLUMNS}) SELECT {TASK_SELECT_COLUMNS} FROM source.tasks WHERE guild_id = ?',
+        (guild_id,),
+    )
+    conn.execute(
+        f'INSERT INTO task_messages (task_id, channel_id, message_id) '
+        f'SELECT task_id, channel_id, message_id FROM source.task_messages WHERE task_id IN ({guild_tasks})',
+        (guild_id,),
+    )
+    conn.execute(
+        f'INSERT INTO deliveries (task_id, user_id, delivery_date, guild_id) '
+        f'SELECT task_id, user_id, delivery_date, guild_id FROM source.deliveries WHERE task_id IN ({guild_tasks})',
+        (guild_id,),
+    )
+    conn.execute(
+        f'INSERT INTO sent_reminders (task_id, reminder_type) '
+        f'SELECT task_id, reminder_type FROM source.sent_reminders WHERE task_id IN ({guild_tasks})',
+        (guild_id,),
+    )
+    conn.execute(
+        'INSERT INTO enrollments (user_id, subject, guild_id) SELECT user_id, subject, guild_id FROM source.enrollments WHERE guild_id = ?',
+        (guild_id,),
+    )
+    conn.execute(
+        'INSERT INTO tasks_archive SELECT * FROM source.tasks_archive WHERE guild_id = ?',
+        (guild_id,),
+    )
+    for table in ("task_messages_archive", "deliveries_archive"):
+        conn.execute(
+            f'INSERT INTO {table} SELECT * FROM source.{table} '
+            f'WHERE task_id IN (SELECT id FROM source.tasks_archive WHERE guild_id = ?)',
+            (guild_id,),
+        )
+    # El hash de una actividad no incluye el servidor: cada base recibe todas las conocidas para
+    # que el primer escaneo tras la división no las anuncie de nuevo en los demás servidores
+    conn.execute('INSERT OR IGNORE INTO course_watch_items SELECT * FROM source.course_watch_items')
+
+
+def _copy_global(conn):
+    conn.execute('INSERT INTO daily_command_usage SELECT * FROM source.daily_command_usage')
+    # La sesión de Moodle y la caché de páginas son globales: sin ellas el primer escaneo tras la
+    # división volvería a iniciar sesión y a descargar todas las páginas
+    conn.execute('INSERT INTO http_sessions SELECT * FROM source.http_sessions')
+    conn.execute('INSERT INTO page_cache SELECT * FROM source.page_cache')
+    conn.execute('INSERT INTO task_shards (task_id, guild_id) SELECT id, guild_id FROM source.tasks')
+    # Los IDs nuevos continúan después del último asignado (o archivado) en la base original
+    row = conn.execute("SELECT seq FROM source.sqlite_sequence WHERE name = 'tasks'").fetchone()
+    last_id = max(
+        row[0] if row else 0,
+        conn.execute('SELECT COALESCE(MAX(task_id), 0) FROM task_shards').fetchone()[0],
+        conn.execute('SELECT COALESCE(MAX(id), 0) FROM source.tasks_archive').fetchone()[0],
+    )
+    conn.execute("DELETE FROM sqlite_sequence WHERE name = 'task_shards'")
+    conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('task_shards', ?)", (last_id,))
+
+
+def _attach_and_copy(conn, source_path, copy, *args):
+    conn.execute("ATTACH DATABASE ? AS source", (source_path,))
+    try:
+        with conn:
+            copy(conn, *args)
+    finally:
+        conn.execute("DETACH DATABASE source")
+
+
+# Dividir una bot.db existente en bases por servidor. La base original no se borra.
+def split_database(source_path, shard_dir=None):
+    shard_dir = shard_dir or DEFAULT_SHARD_DIR
+    if not os.path.exists(source_path):
+        raise FileNotFoundError(source_path)
+    if os.path.exists(os.path.join(shard_dir, GLOBAL_DB_NAME)):
+        raise FileExistsError(f"{shard_dir} ya contiene una base particionada")
+
+    # Llevar el origen al esquema actual para que las columnas coincidan con las bases nuevas
+    DatabaseHandler(source_path, write_batch_ms=0, instrumentation=False).close()
+    with sqlite3.connect(source_path) as source:
+        guild_ids = sorted(
+            row[0]
+            for row in source.execute(
+                'SELECT guild_id FROM tasks UNION SELECT guild_id FROM tasks_archive '
+                'UNION SELECT guild_id FROM enrollments UNION SELECT guild_id FROM course_watch_items'
+            )
+        )
+        source_tasks = source.execute('SELECT COUNT(*) FROM tasks').fetchone()[0]
+    source.close()
+
+    started = time.perf_counter()
+    sharded = ShardedDatabaseHandler(shard_dir, write_batch_ms=0, instrumentation=False)
+    try:
+        _attach_and_copy(sharded.global_db.get_connection(), source_path, _copy_global)
+        copied_tasks = 0
+        for guild_id in guild_ids:
+            with sharded._pinned(guild_id) as shard:
+                conn = shard.get_connection()
+                _attach_and_copy(conn, source_path, _copy_guild, guild_id)
+                copied_tasks += conn.execute('SELECT COUNT(*) FROM tasks').fetchone()[0]
+    finally:
+        sharded.close()
+
+    if copied_tasks != source_tasks:
+        raise RuntimeError(f"Se copiaron {copied_tasks} de {source_tasks} tareas")
+    report = {
+        "guilds": len(guild_ids),
+        "tasks": copied_tasks,
+        "shard_dir": shard_dir,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+    }
+    logger.info("Base %s dividida en %s servidores (%s tareas)", source_path, report["guilds"], report["tasks"])
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dividir bot.db en una base por servidor (DB_BACKEND=sharded)")
+    parser.add_argument("--source", default=os.path.join("database", "bot.db"))
+    parser.add_argument("--shard-dir", default=os.getenv("DB_SHARD_DIR") or DEFAULT_SHARD_DIR)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    report = split_database(args.source, args.shard_dir)
+    print(f"{report['guilds']} servidores, {report['tasks']} tareas copiadas a {report['shard_dir']} en {report['duration_ms']} ms")
+
+
+if __name__ == "__main__":
+    main()
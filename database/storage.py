@@ -0,0 +1,100 @@
+# storage.py - Contrato de almacenamiento usado por los cogs y selección del backend
+import logging
+import os
+from typing import Protocol, runtime_checkable
+
+from database.db_handler import DatabaseHandler
+from database.memory_handler import MemoryDatabaseHandler
+from database.sharding import ShardedDatabaseHandler
+
+logger = logging.getLogger("s4vi.database")
+
+DEFAULT_STORAGE_BACKEND = "sqlite"
+STORAGE_BACKENDS = {
+    "sqlite": DatabaseHandler,
+    "memory": MemoryDatabaseHandler,
+    "sharded": ShardedDatabaseHandler,
+}
+
+
+# Métodos que los cogs (vía AsyncDatabaseHandler) y el mantenimiento esperan de cualquier backend.
+# Las tareas se devuelven como TaskRow; los mensajes como pares (channel_id, message_id).
+@runtime_checkable
+class StorageBackend(Protocol):
+    def init_db(self): ...
+    def close(self): ...
+    def flush_writes(self): ...
+
+    # Tareas
+    def add_task(self, subject, title, due_date, created_by, guild_id, message_id=None, channel_id=None, reminders_active=1, source_url=None, instructions=None): ...
+    def update_task(self, task_id, title=None, due_date=None, subject=None, source_url=None, instructions=None): ...
+    def get_tasks(self, guild_id): ...
+    def get_task_by_id(self, task_id): ...
+    def get_task_choices(self, guild_id, subject=None): ...
+    def search_tasks(self, guild_id, query, subject=None, limit=25): ...
+    def get_tasks_due_between(self, guild_id, start, end, reminders_only=False): ...
+    def delete_task(self, task_id): ...
+    def delete_tasks(self, task_ids): ...
+    def delete_tasks_for_guild(self, guild_id): ...
+    def get_archived_tasks(self, guild_id, query=None, subject=None, limit=20): ...
+    def get_archived_task(self, task_id): ...
+    def add_task_message(self, task_id, channel_id, message_id): ...
+    def get_task_messages(self, task_id): ...
+    def get_task_message_index(self): ...
+    def get_task_id_for_message(self, guild_id, message_id): ...
+
+    # Inscripciones
+    def set_enrollments(self, user_id, subjects, guild_id): ...
+    def import_enrollments(self, rows, guild_id, replace=False): ...
+    def get_user_enrollments(self, user_id, guild_id): ...
+    def get_enrollment_snapshot(self, guild_id): ...
+    def is_user_enrolled_in_subject(self, user_id, subject, guild_id): ...
+
+    # Entregas y recordatorios
+    def mark_as_delivered(self, task_id, user_id, guild_id): ...
+    def is_delivered(self, task_id, user_id): ...
+    def get_delivered_pairs_for_tasks(self, guild_id, task_ids): ...
+    def mark_reminder_sent(self, task_id, reminder_type): ...
+    def is_reminder_sent(self, task_id, reminder_type): ...
+    def get_sent_reminders_for_tasks(self, task_ids): ...
+
+    # Monitor de cursos y límites diarios
+    def add_course_watch_item(self, item_hash, course_name, week_name, activity_type, title, url, guild_id): ...
+    def add_course_watch_items_bulk(self, items, guild_id): ...
+    def get_daily_command_usage(self, command_key, usage_day): ...
+    def increment_daily_command_usage(self, command_key, usage_day): ...
+    def add_daily_command_usage(self, entries): ...
+    def reserve_daily_command_usage(self, command_key, usage_day, limit): ...
+
+    # Arrendamientos entre instancias del bot
+    def acquire_lease(self, name, owner, ttl_seconds, now=None): ...
+    def release_leases(self, names, owner): ...
+    def get_leases(self, prefix=None, now=None): ...
+
+    # Cookies de sesiones HTTP externas (monitor de cursos)
+    def save_http_cookies(self, name, cookies): ...
+    def get_http_cookies(self, name): ...
+    def delete_http_cookies(self, name): ...
+    def get_cached_page(self, url): ...
+    def save_cached_page(self, url, etag, last_modified, content_hash, body): ...
+
+    # Mantenimiento y métricas
+    def run_maintenance(self, retention_days=None, batch_rows=None, pause_ms=None, max_pages=None, archive_grace_days=None): ...
+    def get_maintenance_stats(self): ...
+    def backup(self, backup_dir=None, pages_per_step=None, step_sleep_ms=None, compress=None, keep=None): ...
+    def get_backup_stats(self): ...
+    def get_write_batch_stats(self): ...
+    def get_task_cache_stats(self): ...
+    def get_query_stats(self): ...
+
+
+# Construir el backend indicado (o DB_BACKEND: sqlite por defecto, sharded para una base por servidor,
+# memory para pruebas)
+def create_storage(backend=None, **options):
+    name = (backend or os.getenv("DB_BACKEND") or DEFAULT_STORAGE_BACKEND).strip().lower()
+    storage_cls = STORAGE_BACKENDS.get(name)
+    if storage_cls is None:
+        raise ValueError(f"Backend de almacenamiento desconocido: {name} (opciones: {', '.join(STORAGE_BACKENDS)})")
+    if storage_cls is MemoryDatabaseHandler:
+        logger.warning("Usando backend de almacenamiento '%s': los datos no se persisten en disco", name)
+    return storage_cls(**options)
@@ -0,0 +1,100 @@
+# task_cache.py - Caché en memoria de tareas por servidor (write-through desde DatabaseHandler)
+import os
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_GUILDS = 64
+DEFAULT_MAX_ROWS = 20000
+
+
+# LRU acotado por número de servidores y por filas totales. Las filas cacheadas
+# son compartidas: los consumidores deben tratarlas como solo lectura.
+class TaskCache:
+    def __init__(self, max_guilds=None, max_rows=None):
+        self.max_guilds = max(1, max_guilds or int(os.getenv("DB_TASK_CACHE_GUILDS", DEFAULT_MAX_GUILDS)))
+        self.max_rows = max(1, max_rows or int(os.getenv("DB_TASK_CACHE_ROWS", DEFAULT_MAX_ROWS)))
+        self._entries = OrderedDict()
+        self._rows = 0
+        self._lock = threading.Lock()
+        # Se incrementa en cada escritura; evita guardar lecturas que compitieron con una escritura
+        self._generation = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def generation(self):
+        with self._lock:
+            return self._generation
+
+    def get(self, guild_id):
+        with self._lock:
+            rows = self._entries.get(guild_id)
+            if rows is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(guild_id)
+            self.stats["hits"] += 1
+            return list(rows)
+
+    def store(self, guild_id, rows, generation):
+        with self._lock:
+            if generation != self._generation or len(rows) > self.max_rows:
+                return
+            self._drop(guild_id)
+            self._entries[guild_id] = list(rows)
+            self._rows += len(rows)
+            self._evict()
+
+    # Insertar o reemplazar una tarea en el servidor correspondiente si está cacheado
+    def upsert(self, task):
+        with self._lock:
+            self._generation += 1
+            rows = self._entries.get(task.guild_id)
+            if rows is None:
+                return
+            for index, cached in enumerate(rows):
+                if cached.id == task.id:
+                    rows[index] = task
+                    return
+            rows.append(task)
+            self._rows += 1
+            self._evict()
+
+    def discard(self, task_ids):
+        task_ids = set(task_ids)
+        with self._lock:
+            self._generation += 1
+            for guild_id, rows in self._entries.items():
+                kept = [row for row in rows if row.id not in task_ids]
+                if len(kept) != len(rows):
+                    self._rows -= len(rows) - len(kept)
+                    self._entries[guild_id] = kept
+
+    def invalidate(self, guild_id=None):
+        with self._lock:
+            self._generation += 1
+            self.stats["invalidations"] += 1
+            if guild_id is None:
+                self._entries.clear()
+                self._rows = 0
+            else:
+                self._drop(guild_id)
+
+    def snapshot(self):
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_ratio": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+                "guilds": len(self._entries),
+                "rows": self._rows,
+            }
+
+    def _drop(self, guild_id):
+        rows = self._entries.pop(guild_id, None)
+        if rows is not None:
+            self._rows -= len(rows)
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_guilds or self._rows > self.max_rows):
+            _guild_id, rows = self._entries.popitem(last=False)
+            self._rows -= len(rows)
+            self.stats["evictions"] += 1
@@ -0,0 +1,50 @@
+# task_row.py - Registro compacto de tareas (acceso por nombre en lugar de por posición)
+
+# Columnas de la tabla tasks en el orden de proyección completa
+TASK_COLUMNS = (
+    "id",
+    "subject",
+    "title",
+    "due_date",
+    "created_by",
+    "guild_id",
+    "message_id",
+    "channel_id",
+    "reminders_active",
+    "source_url",
+    "due_ts",
+    "instructions",
+)
+
+TASK_SELECT_COLUMNS = ", ".join(TASK_COLUMNS)
+
+
+# Registro con __slots__: menos memoria que un dict y sin acoplamiento posicional.
+# Las consultas proyectadas solo rellenan sus columnas; el resto queda en None.
+class TaskRow:
+    __slots__ = TASK_COLUMNS
+
+    def __init__(self, **fields):
+        for column in TASK_COLUMNS:
+            setattr(self, column, fields.get(column))
+
+    def as_dict(self):
+        return {column: getattr(self, column) for column in TASK_COLUMNS}
+
+    def __eq__(self, other):
+        if not isinstance(other, TaskRow):
+            return NotImplemented
+        return all(getattr(self, column) == getattr(other, column) for column in TASK_COLUMNS)
+
+    def __repr__(self):
+        return f"TaskRow(id={self.id!r}, subject={self.subject!r}, title={self.title!r}, due_date={self.due_date!r})"
+
+
+# row_factory de sqlite3: construye TaskRow a partir de las columnas seleccionadas
+def task_row_factory(cursor, row):
+    task = TaskRow.__new__(TaskRow)
+    for column in TASK_COLUMNS:
+        setattr(task, column, None)
+    for description, value in zip(cursor.description, row):
+        setattr(task, description[0], value)
+    return task
@@ -0,0 +1,196 @@
+# write_batcher.py - Agrupación de escrituras pequeñas en una sola transacción (group commit)
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+import weakref
+
+DEFAULT_MAX_ROWS = 50
+DEFAULT_MAX_DELAY_MS = 200
+
+logger = logging.getLogger("s4vi.database")
+
+_live_batchers = weakref.WeakSet()
+
+
+def _env_int(name, default):
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+# Acumula INSERTs de alta frecuencia y los confirma juntos cada N ms o M filas.
+# Las lecturas que dependen de estos datos llaman a flush() como barrera.
+class WriteBatcher:
+    def __init__(self, connection_factory, max_rows=None, max_delay_ms=None):
+        self._get_connection = connection_factory
+        self.max_rows = max(1, max_rows if max_rows is not None else _env_int("DB_WRITE_BATCH_ROWS", DEFAULT_MAX_ROWS))
+        self.max_delay_ms = max(0, max_delay_ms if max_delay_ms is not None else _env_int("DB_WRITE_BATCH_MS", DEFAULT_MAX_DELAY_MS))
+
+        self._pending = []
+        self._pending_keys = set()
+        # Claves del lote que se está confirmando: siguen contando como pendientes hasta el commit
+        self._flushing_keys = set()
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._closed = False
+
+        self.stats = {
+            "rows_enqueued": 0,
+            "rows_written": 0,
+            "rows_failed": 0,
+            "flushes": 0,
+            "commits_saved": 0,
+        }
+
+        self._thread = None
+        if self.max_delay_ms > 0:
+            self._thread = threading.Thread(target=self._run, name="s4vi-db-batcher", daemon=True)
+            self._thread.start()
+        _live_batchers.add(self)
+
+    @property
+    def enabled(self):
+        return self.max_rows > 1 and not self._closed
+
+    def _run(self):
+        interval = self.max_delay_ms / 1000
+        while not self._stop_event.wait(interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Fallo en flush periódico de escrituras agrupadas")
+
+    # Encolar una escritura; key permite consultar si un registro sigue pendiente
+    def enqueue(self, sql, params, key=None):
+        if not self.enabled:
+            self._write_now(sql, params)
+            return
+
+        with self._pending_lock:
+            self._pending.append((sql, tuple(params), key))
+            if key is not None:
+                self._pending_keys.add(key)
+            self.stats["rows_enqueued"] += 1
+            should_flush = len(self._pending) >= self.max_rows
+
+        if should_flush:
+            self.flush()
+
+    # Encolar solo si key no está pendiente y exists() es falso; comprobar y encolar bajo el mismo
+    # lock evita que dos hilos den por nuevo el mismo registro. sql debe ser un INSERT OR IGNORE.
+    def enqueue_if_absent(self, sql, params, key, exists):
+        if not self.enabled:
+            conn = self._get_connection()
+            with conn:
+                return conn.execute(sql, params).rowcount > 0
+
+        with self._pending_lock:
+            if key in self._pending_keys or key in self._flushing_keys or exists():
+                return False
+            self._pending.append((sql, tuple(params), key))
+            self._pending_keys.add(key)
+            self.stats["rows_enqueued"] += 1
+            should_flush = len(self._pending) >= self.max_rows
+
+        if should_flush:
+            self.flush()
+        return True
+
+    def is_pending(self, key):
+        with self._pending_lock:
+            return key in self._pending_keys or key in self._flushing_keys
+
+    def pending_count(self):
+        with self._pending_lock:
+            return len(self._pending)
+
+    def snapshot(self):
+        with self._pending_lock:
+            return {**self.stats, "pending": len(self._pending)}
+
+    def _write_now(self, sql, params):
+        conn = self._get_connection()
+        with conn:
+            conn.execute(sql, params)
+
+    # Confirmar todas las escrituras pendientes en una sola transacción
+    def flush(self):
+        with self._flush_lock:
+            with self._pending_lock:
+                batch, self._pending = self._pending, []
+                self._flushing_keys, self._pending_keys = self._pending_keys, set()
+
+            if not batch:
+                return 0
+
+            written = failed = 0
+            conn = self._get_connection()
+            try:
+                with conn:
+                    for sql, group in self._group_by_statement(batch):
+                        conn.executemany(sql, group)
+                written = len(batch)
+            except sqlite3.Error:
+                # Un registro inválido no debe descartar el resto del lote
+                logger.exception("Lote de %s escrituras falló; reintentando fila por fila", len(batch))
+                written, failed = self._flush_row_by_row(conn, batch)
+            finally:
+                with self._pending_lock:
+                    self._flushing_keys = set()
+                    self.stats["flushes"] += 1
+                    self.stats["rows_written"] += written
+                    self.stats["rows_failed"] += failed
+                    self.stats["commits_saved"] += max(0, written - 1)
+            return written
+
+    def _flush_row_by_row(self, conn, batch):
+        written = 0
+        failed = 0
+        with conn:
+            for sql, params, _key in batch:
+                try:
+                    conn.execute(sql, params)
+                    written += 1
+                except sqlite3.Error as error:
+                    failed += 1
+                    logger.warning("Escritura descartada (%s): %s %s", error, " ".join(sql.split()[:4]), params)
+        return written, failed
+
+    def _group_by_statement(self, batch):
+        # Agrupa sentencias consecutivas iguales para executemany sin alterar el orden
+        current_sql = None
+        current_group = []
+        for sql, params, _key in batch:
+            if sql != current_sql and current_group:
+                yield current_sql, current_group
+                current_group = []
+            current_sql = sql
+            current_group.append(params)
+        if current_group:
+            yield current_sql, current_group
+
+    # Detener el flush periódico garantizando que no queden escrituras sin confirmar
+    def close(self):
+        if self._closed:
+            return
+        self._stop_event.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self.flush()
+        self._closed = True
+        _live_batchers.discard(self)
+        if self.stats["rows_written"]:
+            logger.info("Write batcher cerrado: %s", self.stats)
+
+
+@atexit.register
+def _flush_live_batchers():
+    for batcher in list(_live_batchers):
+        try:
+            batcher.close()
+        except Exception:
+            logger.exception("No se pudieron confirmar escrituras pendientes al salir")
@@ -1,14 +1,17 @@
 # keep_alive.py - Servidor Flask para mantener el bot activo
-from flask import Flask, jsonify
+from flask import Flask, jsonify, request
 from threading import Thread
 import ctypes
 import datetime
+import hmac
 import os
 from pathlib import Path
 import shutil
 import time
 import logging
 
+from database.instrumentation import collect_stats
+
 try:
     from waitress import serve as waitress_serve
 except Exception:
@@ -286,6 +289,24 @@ def health():
         }
     )
 
+@app.route('/db-stats')
+def db_stats():
+    # El perfil de consultas, los arrendamientos y los límites no son públicos: sin DB_STATS_TOKEN
+    # la ruta no existe y con él hay que enviar ?token=...
+    expected_token = (os.getenv("DB_STATS_TOKEN") or "").strip()
+    if not expected_token:
+        return jsonify({"error": "no encontrado"}), 404
+    if not hmac.compare_digest(request.args.get("token", ""), expected_token):
+        return jsonify({"error": "no autorizado"}), 403
+
+    timestamps = _get_timestamp_fields()
+    return jsonify(
+        {
+            "actualizado_en": timestamps["actualizado_en"],
+            "base_de_datos": collect_stats(),
+        }
+    )
+
 def run():
     port = int(os.getenv("PORT", 8080))
     if waitress_serve is not None:
@@ -8,8 +8,13 @@ import logging
 import sys
 import asyncio
 from dotenv import load_dotenv
-from database.db_handler import DatabaseHandler
+from database.async_db_handler import AsyncDatabaseHandler
+from database.storage import create_storage
+from database.instrumentation import register_stats_provider
 from keep_alive import keep_alive
+from utils.leases import LeaseManager
+from utils.rate_limiter import RateLimiter
+from utils.task_completion import TaskMessageIndex
 
 load_dotenv()
 TOKEN = (os.getenv("DISCORD_TOKEN") or "").strip()
@@ -55,9 +60,32 @@ class S4VIBot(commands.Bot):
         intents.members = True
         intents.message_content = True
         super().__init__(command_prefix="!", intents=intents)
-        self.db = DatabaseHandler()
+        # Acceso awaitable al almacenamiento (DB_BACKEND) para no bloquear heartbeats ni interacciones
+        self.db = AsyncDatabaseHandler(create_storage())
+        # Métricas de caché y group commit junto a las de consultas (!dbstats y /db-stats)
+        register_stats_provider("cache_tareas", self.db.handler.get_task_cache_stats)
+        register_stats_provider("escrituras_agrupadas", self.db.handler.get_write_batch_stats)
+        register_stats_provider("mantenimiento", self.db.handler.get_maintenance_stats)
+        register_stats_provider("respaldos", self.db.handler.get_backup_stats)
+        # Límites de uso en memoria; las ventanas diarias se vuelcan a daily_command_usage
+        self.rate_limiter = RateLimiter(self.db)
+        register_stats_provider("limites_de_uso", self.rate_limiter.snapshot)
+        # Índice mensaje -> tarea para completar tareas con botón o reacción sin consultar la base
+        self.task_messages = TaskMessageIndex(self.db)
+        register_stats_provider("mensajes_de_tareas", self.task_messages.snapshot)
+        # Arrendamientos en la base para repartir los loops en segundo plano entre instancias
+        self.leases = LeaseManager(self.db)
+        register_stats_provider("arrendamientos", self.leases.snapshot)
 
     async def setup_hook(self):
+        self.rate_limiter.start()
+        self.leases.start()
+        try:
+            await self.task_messages.warm()
+        except Exception:
+            # Sin precarga el índice resuelve cada mensaje por clave primaria en task_messages
+            logger.exception("No se pudo precargar el índice de mensajes de tareas")
+
         # Carga de extensiones (cogs) desde el directorio correspondiente
         for filename in os.listdir("./cogs"):
             if filename.endswith(".py"):
@@ -83,6 +111,18 @@ class S4VIBot(commands.Bot):
     async def on_error(self, event_method, *args, **kwargs):
         logger.exception("Error global en evento Discord: %s", event_method)
 
+    async def close(self):
+        try:
+            await super().close()
+        finally:
+            # Guardar contadores pendientes y liberar las conexiones antes de reconstruir el bot
+            try:
+                await self.rate_limiter.close()
+                # Soltar los trabajos para que otra instancia los tome sin esperar la caducidad
+                await self.leases.close()
+            finally:
+                await self.db.close()
+
 
 def build_bot() -> S4VIBot:
     bot = S4VIBot()
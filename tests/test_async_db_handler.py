@@ -0,0 +1,99 @@
+import asyncio
+import threading
+
+import pytest
+
+from database.async_db_handler import AsyncDatabaseHandler
+from database.db_handler import DatabaseHandler
+
+
+@pytest.mark.asyncio
+async def test_async_facade_mirrors_handler_api(tmp_path):
+    db = AsyncDatabaseHandler(DatabaseHandler(str(tmp_path / "bot.db")))
+
+    task_id = await db.add_task("Matemática", "Guía 1", "18/03/2026 12:00", 100, 200)
+    await db.add_task_message(task_id, 10, 20)
+
+    assert (await db.get_task_by_id(task_id)).title == "Guía 1"
+    assert await db.get_task_messages(task_id) == [(10, 20)]
+
+    await db.close()
+
+
+class _ShardRecorder:
+    max_open_shards = 1
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.order = []
+
+    def write_shard_for(self, name, args, kwargs):
+        return args[0]
+
+    def add_task(self, guild_id, label):
+        if label == "lenta":
+            self.gate.wait(5)
+        self.order.append(label)
+
+    def close(self):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_reused_shard_writes_wait_for_the_evicted_writer_to_drain():
+    handler = _ShardRecorder()
+    db = AsyncDatabaseHandler(handler)
+
+    slow = asyncio.ensure_future(db.add_task(200, "lenta"))
+    await asyncio.sleep(0)
+    # Otro servidor desaloja el escritor de 200 mientras su escritura sigue en curso
+    await db.add_task(300, "otra")
+    follow_up = asyncio.ensure_future(db.add_task(200, "siguiente"))
+    await asyncio.sleep(0.05)
+    handler.gate.set()
+    await asyncio.gather(slow, follow_up)
+
+    assert handler.order == ["otra", "lenta", "siguiente"]
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_maintenance_jobs_do_not_occupy_the_reader_pool(tmp_path):
+    handler = DatabaseHandler(str(tmp_path / "bot.db"))
+    db = AsyncDatabaseHandler(handler, reader_threads=1)
+    task_id = await db.add_task("Ética", "Foro", "19/03/2099 18:00", 100, 200)
+    release = threading.Event()
+    real_run_maintenance = handler.run_maintenance
+
+    def slow_maintenance(**kwargs):
+        release.wait(5)
+        return real_run_maintenance(**kwargs)
+
+    handler.run_maintenance = slow_maintenance
+    maintenance = asyncio.ensure_future(db.run_maintenance(pause_ms=0, archive_grace_days=0))
+    await asyncio.sleep(0)
+
+    # Con el único lector libre, la lectura no espera al mantenimiento en curso
+    assert (await asyncio.wait_for(db.get_task_by_id(task_id), timeout=1)).title == "Foro"
+    release.set()
+    assert (await maintenance)["archived"] == 0
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_writes_share_a_single_writer_thread_off_the_event_loop(tmp_path):
+    handler = DatabaseHandler(str(tmp_path / "bot.db"))
+    db = AsyncDatabaseHandler(handler)
+    loop_thread = threading.get_ident()
+    writer_threads = set()
+
+    def record_writer(*args, **kwargs):
+        writer_threads.add(threading.get_ident())
+
+    for index in range(5):
+        await db.run_write(record_writer, index)
+
+    assert len(writer_threads) == 1
+    assert loop_thread not in writer_threads
+
+    await db.close()
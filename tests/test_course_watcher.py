@@ -1,6 +1,28 @@
+import asyncio
+
+import json
+from types import SimpleNamespace
+
+import aiohttp
 import pytest
+from discord.ext import tasks
+from yarl import URL
+
+from cogs.course_watcher import COURSES, DAILY_SCAN_LIMIT, MOODLE_BASE_URL, MOODLE_COOKIES_KEY, CourseWatcher
+from database.async_db_handler import AsyncDatabaseHandler
+from database.memory_handler import MemoryDatabaseHandler
+from utils.leases import LeaseManager
+from utils.rate_limiter import RateLimiter
+
+
+def _make_watcher(monkeypatch, db=None, **bot_attributes):
+    # __init__ real sin arrancar el bucle de escaneo programado
+    monkeypatch.setattr(tasks.Loop, "start", lambda self, *args, **kwargs: None)
+    return CourseWatcher(SimpleNamespace(db=db, **bot_attributes))
+
 
-from cogs.course_watcher import CourseWatcher
+def _watcher_with_storage(monkeypatch):
+    return _make_watcher(monkeypatch, AsyncDatabaseHandler(MemoryDatabaseHandler()))
 
 
 class _FakeResponse:
@@ -36,7 +58,7 @@ class _FakeSession:
 
 @pytest.mark.asyncio
 async def test_request_text_with_retry_succeeds_after_retry(monkeypatch):
-    watcher = object.__new__(CourseWatcher)
+    watcher = _make_watcher(monkeypatch)
 
     sleep_calls = []
 
@@ -69,7 +91,7 @@ async def test_request_text_with_retry_succeeds_after_retry(monkeypatch):
 
 @pytest.mark.asyncio
 async def test_request_text_with_retry_flags_blocked_for_cloudflare(monkeypatch):
-    watcher = object.__new__(CourseWatcher)
+    watcher = _make_watcher(monkeypatch)
 
     async def _fake_sleep_backoff(_attempt):
         return None
@@ -91,3 +113,290 @@ async def test_request_text_with_retry_flags_blocked_for_cloudflare(monkeypatch)
     assert result["ok"] is False
     assert result["blocked"] is True
     assert result["reason"] == "cloudflare-bloqueo"
+
+
+@pytest.mark.asyncio
+async def test_shared_http_session_is_reused_and_rebuilt_after_connection_failures(monkeypatch):
+    watcher = _make_watcher(monkeypatch)
+
+    async def _fake_sleep_backoff(_attempt):
+        return None
+
+    monkeypatch.setattr(watcher, "_sleep_backoff", _fake_sleep_backoff)
+
+    class _DisconnectingSession:
+        closed = False
+
+        def request(self, method, url, **kwargs):
+            raise aiohttp.ServerDisconnectedError()
+
+    first = await watcher._get_http_session()
+    assert await watcher._get_http_session() is first
+
+    result = await watcher._request_text_with_retry(_DisconnectingSession(), "GET", "https://example.com/course", max_attempts=2)
+    assert result["ok"] is False
+
+    second = await watcher._get_http_session()
+    assert second is not first
+    assert first.closed
+    await watcher._close_http_session()
+    assert second.closed
+
+
+@pytest.mark.asyncio
+async def test_courses_are_scanned_concurrently_within_the_limit(monkeypatch):
+    watcher = _make_watcher(monkeypatch)
+    monkeypatch.setenv("COURSE_SCAN_CONCURRENCY", "2")
+    running = {"now": 0, "max": 0}
+
+    async def _fake_scan_course(session, course_name, course_url, requested_week, use_manual_cookie, page_stats=None):
+        running["now"] += 1
+        running["max"] = max(running["max"], running["now"])
+        # Los cursos terminan en orden inverso al de COURSES
+        await asyncio.sleep(0.01 * (len(COURSES) - list(COURSES).index(course_name)))
+        running["now"] -= 1
+        return [{"course_name": course_name}], False
+
+    monkeypatch.setattr(watcher, "_scan_course", _fake_scan_course)
+
+    results, blocked = await watcher._scan_courses_concurrently(None, None, False)
+
+    assert blocked is False
+    assert running["max"] == 2
+    assert set(results) == set(COURSES)
+
+
+@pytest.mark.asyncio
+async def test_block_in_one_course_cancels_the_rest(monkeypatch):
+    watcher = _make_watcher(monkeypatch)
+    monkeypatch.setenv("COURSE_SCAN_CONCURRENCY", "5")
+    first_course = next(iter(COURSES))
+    cancelled = []
+
+    async def _fake_scan_course(session, course_name, course_url, requested_week, use_manual_cookie, page_stats=None):
+        if course_name == first_course:
+            return None, True
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(course_name)
+            raise
+        return [], False
+
+    monkeypatch.setattr(watcher, "_scan_course", _fake_scan_course)
+
+    results, blocked = await asyncio.wait_for(watcher._scan_courses_concurrently(None, None, False), timeout=2)
+
+    assert blocked is True
+    assert results == {}
+    assert sorted(cancelled) == sorted(name for name in COURSES if name != first_course)
+
+
+@pytest.mark.asyncio
+async def test_persisted_moodle_cookies_skip_login_and_expiry_relogs_once(monkeypatch):
+    watcher = _watcher_with_storage(monkeypatch)
+    state = {"logins": 0, "expired": False}
+
+    async def _fake_authenticate(session):
+        state["logins"] += 1
+        state["expired"] = False
+        session.cookie_jar.update_cookies({"MoodleSession": f"s{state['logins']}"}, response_url=URL(MOODLE_BASE_URL))
+        return True, False
+
+    async def _fake_request(session, method, url, use_manual_cookie=True, **kwargs):
+        await asyncio.sleep(0)
+        final_url = f"{MOODLE_BASE_URL}/login/index.php" if state["expired"] else url
+        return {"ok": True, "text": "<html>curso</html>", "status": 200, "final_url": final_url}
+
+    monkeypatch.setattr(watcher, "_authenticate_session", _fake_authenticate)
+    monkeypatch.setattr(watcher, "_request_text_with_retry", _fake_request)
+
+    # Primer escaneo: inicia sesión y guarda las cookies en la base
+    session = await watcher._get_http_session()
+    assert await watcher._ensure_authenticated(session) == (True, False)
+    stored = json.loads(await watcher.bot.db.get_http_cookies(MOODLE_COOKIES_KEY))
+    assert [(cookie["name"], cookie["value"]) for cookie in stored] == [("MoodleSession", "s1")]
+
+    # Tras reiniciar (sesión HTTP nueva) se restaura sin otro login
+    await watcher._close_http_session()
+    session = await watcher._get_http_session()
+    assert await watcher._ensure_authenticated(session) == (True, False)
+    assert state["logins"] == 1
+    assert session.cookie_jar.filter_cookies(URL(f"{MOODLE_BASE_URL}/my/"))["MoodleSession"].value == "s1"
+
+    # Moodle expira la sesión: varios cursos concurrentes disparan un único re-login
+    state["expired"] = True
+    results = await asyncio.gather(*(watcher._fetch_course_html(session, url) for url in COURSES.values()))
+    assert all(html == "<html>curso</html>" for html, _blocked in results)
+    assert state["logins"] == 2
+
+    await watcher._close_http_session()
+    await watcher.bot.db.close()
+
+
+@pytest.mark.asyncio
+async def test_one_course_scan_is_fanned_out_to_every_guild(monkeypatch):
+    watcher = _watcher_with_storage(monkeypatch)
+    scans = []
+    blocked = {"next": False}
+
+    async def _fake_ensure_authenticated(session, validate=False):
+        return True, False
+
+    async def _fake_scan_courses_concurrently(session, requested_week, use_manual_cookie, page_stats=None):
+        scans.append(requested_week)
+        await asyncio.sleep(0.01)
+        if blocked["next"]:
+            blocked["next"] = False
+            return {}, True
+        course_name = next(iter(COURSES))
+        item = {
+            "course_name": course_name,
+            "week_name": "Semana 9",
+            "activity_type": "FORO",
+            "title": "Foro 1",
+            "url": "https://example.com/foro",
+        }
+        return {course_name: [item]}, False
+
+    monkeypatch.setattr(watcher, "_ensure_authenticated", _fake_ensure_authenticated)
+    monkeypatch.setattr(watcher, "_scan_courses_concurrently", _fake_scan_courses_concurrently)
+
+    first, second = await asyncio.gather(
+        watcher._scan_courses_for_guild(1, scan_token="slot:a"),
+        watcher._scan_courses_for_guild(2, scan_token="slot:a"),
+    )
+    again = await watcher._scan_courses_for_guild(1, scan_token="slot:a")
+
+    assert scans == [None]
+    # Cada servidor recibe los items detectados para programar sus tareas; las novedades se
+    # siguen decidiendo contra course_watch_items
+    assert [item["title"] for item in first["new_items"] + second["new_items"]] == ["Foro 1"]
+    assert [item["title"] for item in second["detected_items"]] == ["Foro 1"]
+    assert again["new_items"] == [] and len(again["detected_items"]) == 1
+
+    await watcher._scan_courses_for_guild(1, requested_week=9, scan_token="slot:a")
+    assert scans == [None, 9]
+
+    # Otro reparto (p. ej. /tareas nuevas) escanea de nuevo aunque el slot siga en caché
+    await watcher._scan_courses_for_guild(1, scan_token="manual:1")
+    assert scans == [None, 9, None]
+
+    # Un bloqueo no se guarda: el siguiente servidor del mismo reparto vuelve a intentarlo
+    blocked["next"] = True
+    assert (await watcher._scan_courses_for_guild(1, scan_token="manual:2"))["blocked"] is True
+    assert (await watcher._scan_courses_for_guild(2, scan_token="manual:2"))["blocked"] is False
+    assert scans == [None, 9, None, None, None]
+
+    watcher._forget_course_scans("slot:a")
+    assert all(key[2] != "slot:a" for key in watcher._scan_cache)
+
+    await watcher._close_http_session()
+    await watcher.bot.db.close()
+
+
+@pytest.mark.asyncio
+async def test_page_cache_sends_conditional_headers_and_skips_unchanged_parsing(monkeypatch):
+    watcher = _watcher_with_storage(monkeypatch)
+    url = "https://example.com/course"
+    page = "<html>semana 9</html>"
+    sent_headers = []
+    responses = [
+        _FakeResponse(200, page, url),
+        _FakeResponse(304, "", url),
+        _FakeResponse(200, page, url),
+        _FakeResponse(304, "", url),
+    ]
+    responses[0].headers = {"ETag": '"v1"', "Last-Modified": "Sat, 17 Oct 2026 10:00:00 GMT"}
+
+    class _RecordingSession(_FakeSession):
+        def request(self, method, url, **kwargs):
+            sent_headers.append(kwargs.get("headers", {}))
+            return super().request(method, url, **kwargs)
+
+    session = _RecordingSession(responses)
+    parses = []
+
+    def _fake_parse(html):
+        parses.append(html)
+        return {"week_name": "Semana 9"}
+
+    page_stats = watcher._new_page_stats()
+    for _ in range(3):
+        html, blocked = await watcher._fetch_course_html(session, url, page_stats=page_stats)
+        assert (html, blocked) == (page, False)
+        assert await watcher._parse_once("semana", html, _fake_parse, page_stats=page_stats) == {"week_name": "Semana 9"}
+
+    assert "If-None-Match" not in sent_headers[0]
+    assert sent_headers[1]["If-None-Match"] == '"v1"'
+    assert sent_headers[1]["If-Modified-Since"] == "Sat, 17 Oct 2026 10:00:00 GMT"
+    assert parses == [page]
+    report = watcher._page_cache_report(page_stats)
+    assert report["requests"] == 3
+    assert (report["not_modified"], report["unchanged"], report["parse_skipped"]) == (1, 1, 2)
+    assert report["bytes_saved"] == len(page)
+    assert report["hit_ratio"] == pytest.approx(0.667)
+
+    # Otro escaneo simultáneo lleva sus propias métricas y no altera las de este
+    other_stats = watcher._new_page_stats()
+    await watcher._fetch_course_html(session, url, page_stats=other_stats)
+    assert other_stats["not_modified"] == 1
+    assert watcher._page_cache_report(page_stats)["requests"] == 3
+
+    await watcher.bot.db.close()
+
+
+class _FakeFollowup:
+    def __init__(self):
+        self.messages = []
+
+    async def send(self, content=None, **kwargs):
+        self.messages.append(content)
+
+
+def _scan_interaction(interaction_id, guild):
+    async def _defer(**kwargs):
+        return None
+
+    return SimpleNamespace(
+        id=interaction_id,
+        user=SimpleNamespace(id=1),
+        guild=guild,
+        response=SimpleNamespace(defer=_defer),
+        followup=_FakeFollowup(),
+    )
+
+
+@pytest.mark.asyncio
+async def test_scan_command_quota_is_shared_across_bot_instances(monkeypatch):
+    db = AsyncDatabaseHandler(MemoryDatabaseHandler())
+    guild = SimpleNamespace(id=200)
+    scans = []
+    watchers = []
+    # Dos procesos del bot sobre la misma base, cada uno con su limitador y sus arrendamientos
+    for owner in ("a", "b"):
+        watcher = _make_watcher(
+            monkeypatch,
+            db,
+            guilds=[guild],
+            rate_limiter=RateLimiter(db),
+            leases=LeaseManager(db, owner=owner),
+        )
+        watchers.append(watcher)
+
+    async def _fake_scan_and_notify(guild, requested_week=None, command_user_id=None, scan_token=None):
+        scans.append(scan_token)
+        return {"new_activities": 0, "created_tasks": 0, "already_assigned": []}
+
+    for watcher in watchers:
+        monkeypatch.setattr(watcher, "_scan_and_notify", _fake_scan_and_notify)
+
+    interactions = [_scan_interaction(index, guild) for index in range(4)]
+    for index, interaction in enumerate(interactions):
+        await CourseWatcher.tareas_nuevas.callback(watchers[index % 2], interaction)
+
+    # Dos instancias, un solo cupo diario entre ambas
+    assert len(scans) == DAILY_SCAN_LIMIT
+    assert all("límite global" in interaction.followup.messages[0] for interaction in interactions[DAILY_SCAN_LIMIT:])
+    await db.close()
+
@@ -1,4 +1,15 @@
-from database.db_handler import DatabaseHandler
+import datetime
+import gzip
+import logging
+import os
+import sqlite3
+import threading
+
+from database.backup import rotate_backups
+from database.db_handler import DatabaseHandler, read_enrollment_csv
+from database.due_dates import DUE_DATE_TIMEZONE, due_date_to_ts
+from database.instrumentation import QUERY_STATS
+from database.migrations import latest_version
 
 
 def test_add_task_and_fetch_by_id(tmp_path):
@@ -9,9 +20,9 @@ def test_add_task_and_fetch_by_id(tmp_path):
     task = db.get_task_by_id(task_id)
 
     assert task is not None
-    assert task[0] == task_id
-    assert task[1] == "Matemática"
-    assert task[2] == "Guía 1"
+    assert task.id == task_id
+    assert task.subject == "Matemática"
+    assert task.title == "Guía 1"
 
 
 def test_update_task_partial_keeps_other_fields(tmp_path):
@@ -23,8 +34,8 @@ def test_update_task_partial_keeps_other_fields(tmp_path):
     task = db.get_task_by_id(task_id)
 
     assert updated is True
-    assert task[2] == "Guía 1 - Actualizada"
-    assert task[3] == "18/03/2026 12:00"
+    assert task.title == "Guía 1 - Actualizada"
+    assert task.due_date == "18/03/2026 12:00"
 
 
 def test_mark_reminder_sent_is_idempotent_with_unique_constraint(tmp_path):
@@ -60,3 +71,406 @@ def test_enrollment_snapshot_and_delivered_pairs(tmp_path):
     assert snapshot["subjects_by_user"][1] == {"Matemática", "Ética"}
     assert snapshot["subjects_by_user"][2] == {"Matemática"}
     assert (task_id, 2) in delivered
+
+
+def test_connection_is_reused_per_thread_with_profile_pragmas(tmp_path):
+    db = DatabaseHandler(str(tmp_path / "bot.db"), performance_profile="safe")
+
+    conn = db.get_connection()
+    assert db.get_connection() is conn
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 2
+
+    db.close()
+    assert db.get_connection() is not conn
+
+
+def test_small_writes_are_group_committed_and_visible_after_barrier(tmp_path):
+    db = DatabaseHandler(str(tmp_path / "bot.db"), write_batch_rows=100, write_batch_ms=0)
+
+    task_id = db.add_task("Ética", "Foro", "19/03/2026 18:00", 100, 200)
+    for reminder_type in ("24h", "6h", "1h"):
+        db.mark_reminder_sent(task_id, reminder_type)
+    db.mark_as_delivered(task_id, 5, 200)
+
+    assert db.get_write_batch_stats()["pending"] == 4
+
+    reminders = db.get_sent_reminders_for_tasks([task_id])
+    stats = db.get_write_batch_stats()
+
+    assert reminders == {(task_id, "24h"), (task_id, "6h"), (task_id, "1h")}
+    assert db.is_delivered(task_id, 5) is True
+    assert stats["pending"] == 0
+    assert stats["flushes"] == 1
+    assert stats["commits_saved"] == 3
+
+
+def test_message_lookup_only_flushes_when_that_message_is_pending(tmp_path):
+    db = DatabaseHandler(str(tmp_path / "bot.db"), write_batch_rows=100, write_batch_ms=0)
+    task_id = db.add_task("Ética", "Foro", "19/03/2026 18:00", 100, 200)
+    db.add_task_message(task_id, 10, 20)
+    db.mark_reminder_sent(task_id, "24h")
+
+    # Un ✅ en un mensaje cualquiera no fuerza el group commit
+    assert db.get_task_id_for_message(200, 99) is None
+    assert db.get_write_batch_stats()["pending"] == 2
+    assert db.get_task_id_for_message(200, 20) == task_id
+    assert db.get_write_batch_stats()["pending"] == 0
+    assert db.get_task_id_for_message(300, 20) is None
+
+
+def test_course_watch_item_is_new_for_exactly_one_racing_thread(tmp_path):
+    # Lotes pequeños: parte de las comprobaciones coincide con un lote a medio confirmar
+    db = DatabaseHandler(str(tmp_path / "bot.db"), write_batch_rows=3, write_batch_ms=0)
+    hashes = [f"h{index}" for index in range(200)]
+    barrier = threading.Barrier(8)
+    announced = []
+
+    def scan():
+        barrier.wait()
+        for item_hash in hashes:
+            if db.add_course_watch_item(item_hash, "MATEMATICA", "Semana 8", "TAREA", "Guía", "https://example.com", 200):
+                announced.append(item_hash)
+
+    threads = [threading.Thread(target=scan) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(announced) == sorted(hashes)
+    db.close()
+
+
+def test_close_flushes_pending_writes(tmp_path):
+    db_file = str(tmp_path / "bot.db")
+    db = DatabaseHandler(db_file, write_batch_rows=100, write_batch_ms=0)
+    task_id = db.add_task("Ética", "Foro", "19/03/2026 18:00", 100, 200)
+    db.add_task_message(task_id, 10, 20)
+    db.close()
+
+    reopened = DatabaseHandler(db_file)
+    assert reopened.get_task_messages(task_id) == [(10, 20)]
+
+
+def _watch_item(item_hash, title):
+    return {
+        "item_hash": item_hash,
+        "course_name": "MATEMATICA",
+        "week_name": "Semana 8",
+        "activity_type": "TAREA",
+        "title": title,
+        "url": f"https://example.com/{item_hash}",
+    }
+
+
+def test_bulk_course_watch_items_returns_only_new_hashes(tmp_path):
+    db = DatabaseHandler(str(tmp_path / "bot.db"))
+    guild_id = 200
+
+    assert db.add_course_watch_item("a", "MATEMATICA", "Semana 8", "TAREA", "Guía", "https://example.com/a", guild_id)
+
+    new_hashes = db.add_course_watch_items_bulk(
+        [_watch_item("a", "Guía"), _watch_item("b", "Foro"), _watch_item("b", "Foro"), _watch_item("c", "Lab")],
+        guild_id,
+    )
+    assert new_hashes == {"b", "c"}
+    assert db.add_course_watch_items_bulk([_watch_item("c", "Lab")], guild_id) == set()
+
+
+def test_task_choices_filter_by_subject(tmp_path):
+    db = DatabaseHandler(str(tmp_path / "bot.db"))
+    guild_id = 200
+
+    math_id = db.add_task("Matemática", "Guía 1", "18/03/2026 12:00", 100, guild_id)
+    db.add_task("Ética", "Foro", "19/03/2026 18:00", 100, guild_id, reminders_active=0)
+
+    choices = db.get_task_choices(guild_id, subject="Matemática")
+    assert [(t.id, t.subject, t.title) for t in choices] == [(math_id, "Matemática", "Guía 1")]
+
+
+def test_due_ts_is_normalized_and_range_query_uses_it(tmp_path):
+    db = DatabaseHandler(str(tmp_path / "bot.db"))
+    guild_id = 200
+
+    soon_id = db.add_task("Matemática", "Guía 1", "18/03/2026 12:00", 100, guild_id)
+    later_id = db.add_task("Ética", "Foro", "25/03/2026 12:00", 100, guild_id)
+    db.add_task("Ética", "Sin fecha", "No asignada", 100, guild_id)
+    db.add_task("Matemática", "Silenciada", "18/03/2026 13:00", 100, guild_id, reminders_active=0)
+
+    expected_ts = int(datetime.datetime(2026, 3, 18, 12, 0, tzinfo=DUE_DATE_TIMEZONE).timestamp())
+    assert db.get_task_by_id(soon_id).due_ts == expected_ts
+    assert due_date_to_ts("No asignada") is None
+
+    window = db.get_tasks_due_between(guild_id, expected_ts - 3600, expected_ts + 24 * 3600, reminders_only=True)
+    assert [task.id for task in window] == [soon_id]
+
+    db.update_task(later_id, due_date="18/03/2026 18:00")
+    window = db.get_tasks_due_between(guild_id, expected_ts - 3600, expected_ts + 24 * 3600, reminders_only=True)
+    assert [task.id for task in window] == [soon_id, later_id]
+
+
+def test_migrations_upgrade_legacy_schema_and_backfill_due_ts(tmp_path, caplog):
+    db_file = str(tmp_path / "bot.db")
+    legacy = sqlite3.connect(db_file)
+    legacy.execute(
+        "CREATE TABLE tasks (id INTEGER PRIMARY KEY AUTOINCREMENT, subject TEXT NOT NULL, title TEXT NOT NULL, "
+        "due_date TEXT NOT NULL, created_by INTEGER NOT NULL, guild_id INTEGER NOT NULL, message_id INTEGER, channel_id INTEGER)"
+    )
+    legacy.execute(
+        "INSERT INTO tasks (subject, title, due_date, created_by, guild_id) VALUES ('Ética', 'Foro', '18/03/2026 12:00', 1, 200)"
+    )
+    legacy.execute("CREATE TABLE sent_reminders (task_id INTEGER NOT NULL, reminder_type TEXT NOT NULL, PRIMARY KEY (task_id, reminder_type))")
+    legacy.executemany("INSERT INTO sent_reminders VALUES (?, '24h')", [(1,), (99,)])
+    legacy.execute("CREATE TABLE task_messages (id INTEGER PRIMARY KEY AUTOINCREMENT, task_id INTEGER, channel_id INTEGER, message_id INTEGER)")
+    legacy.executemany("INSERT INTO task_messages (task_id, channel_id, message_id) VALUES (1, 10, ?)", [(20,), (20,), (21,)])
+    legacy.commit()
+    legacy.close()
+
+    caplog.set_level(logging.INFO, logger="s4vi.database")
+    db = DatabaseHandler(db_file)
+    task = db.get_tasks(200)[0]
+
+    assert db.get_connection().execute("PRAGMA user_version").fetchone()[0] == latest_version()
+    assert task.reminders_active == 1
+    assert task.due_ts == due_date_to_ts("18/03/2026 12:00")
+    # La reconstrucción con claves foráneas descarta recordatorios de tareas inexistentes
+    assert db.get_sent_reminders_for_tasks([1, 99]) == {(1, "24h")}
+    # task_messages queda con clave primaria por mensaje, sin duplicados
+    assert sorted(db.get_task_message_index()) == [(20, 1), (21, 1)]
+    assert db.get_task_id_for_message(200, 21) == 1
+    # Huérfanas y duplicadas se informan por separado; el VACUUM de la migración 5 queda registrado
+    assert "1 filas huérfanas descartadas de sent_reminders" in caplog.text
+    assert "1 filas duplicadas descartadas de task_messages" in caplog.text
+    assert "huérfanas descartadas de task_messages" not in caplog.text
+    assert "VACUUM completado en" in caplog.text
+    # Las tareas existentes quedan indexadas para la búsqueda de texto completo
+    assert [task.id for task in db.search_tasks(200, "foro etica")] == [1]
+
+
+def test_search_without_fts5_ranks_in_memory_like_the_index(tmp_path):
+    db = DatabaseHandler(str(tmp_path / "bot.db"), write_batch_ms=0)
+    guide = db.add_task("Matemática", "Guía de álgebra", "18/03/2026 12:00", 1, 200)
+    forum = db.add_task("Ética", "Foro", "19/03/2026 18:00", 1, 200, instructions="Leer la guía del capítulo 2")
+    indexed = [task.id for task in db.search_tasks(200, "GUIA")]
+
+    db.fts_enabled = False
+    assert [task.id for task in db.search_tasks(200, "GUIA")] == indexed == [guide, forum]
+    assert [task.id for task in db.search_tasks(200, "capitulo lee")] == [forum]
+
+
+def test_init_db_skips_migrations_when_schema_is_current(tmp_path):
+    db = DatabaseHandler(str(tmp_path / "bot.db"))
+    assert db.init_db() == []
+
+
+def test_task_cache_is_write_through_and_counts_hits(tmp_path):
+    db = DatabaseHandler(str(tmp_path / "bot.db"))
+    guild_id = 200
+
+    first_id = db.add_task("Matemática", "Guía 1", "18/03/2026 12:00", 100, guild_id)
+    assert [task.id for task in db.get_tasks(guild_id)] == [first_id]
+    assert db.get_task_cache_stats()["misses"] == 1
+
+    second_id = db.add_task("Ética", "Foro", "19/03/2026 18:00", 100, guild_id)
+    db.update_task(first_id, title="Guía 1 - Actualizada")
+    cached = db.get_tasks(guild_id)
+    assert {task.id: task.title for task in cached} == {first_id: "Guía 1 - Actualizada", second_id: "Foro"}
+
+    db.delete_task(second_id)
+    assert [task.id for task in db.get_task_choices(guild_id)] == [first_id]
+
+    stats = db.get_task_cache_stats()
+    assert stats["misses"] == 1
+    assert stats["hits"] == 2
+    assert stats["rows"] == 1
+
+
+def test_task_cache_is_bounded_by_guild_count(tmp_path):
+    db = DatabaseHandler(str(tmp_path / "bot.db"))
+    db.task_cache.max_guilds = 2
+
+    for guild_id in (1, 2, 3):
+        db.add_task("Matemática", "Guía", "18/03/2026 12:00", 100, guild_id)
+        db.get_tasks(guild_id)
+
+    stats = db.get_task_cache_stats()
+    assert stats["guilds"] == 2
+    assert stats["evictions"] == 1
+
+
+def test_instrumentation_records_methods_slow_queries_and_full_scans(tmp_path, monkeypatch):
+    monkeypatch.setenv("DB_SLOW_QUERY_MS", "0")
+    monkeypatch.setenv("DB_QUERY_PLAN_AUDIT", "1")
+    QUERY_STATS.reset()
+    db = DatabaseHandler(str(tmp_path / "bot.db"), instrumentation=True)
+    try:
+        task_id = db.add_task("Matemática", "Guía 1", "18/03/2026 12:00", 100, 200)
+        db.get_tasks(200)
+        db.get_connection().execute("SELECT item_hash FROM course_watch_items WHERE title = ?", ("Foro",)).fetchall()
+        db.add_task("Matemática", "Guía 2", "18/03/2026 12:00", 100, 200)
+        conn = db.get_connection()
+        assert len(list(conn.execute("SELECT id FROM tasks WHERE guild_id = ?", (200,)))) == 2
+        conn.execute("SELECT id FROM tasks WHERE guild_id = ?", (200,)).fetchone()
+        conn.execute("UPDATE tasks SET title = title WHERE guild_id = ?", (200,))
+        stats = db.get_query_stats()
+    finally:
+        db.close()
+        QUERY_STATS.configure(slow_query_ms=100, plan_audit=False)
+
+    assert stats["methods"]["add_task"]["calls"] == 2
+    assert stats["methods"]["get_tasks"]["rows"] == 1
+    # SELECT: filas leídas (iteración + fetchone); UPDATE: filas modificadas
+    assert stats["statements"]["SELECT id FROM tasks WHERE guild_id = ?"]["rows"] == 3
+    assert stats["statements"]["UPDATE tasks SET title = title WHERE guild_id = ?"]["rows"] == 2
+    assert task_id is not None
+    assert stats["slow_queries"]
+    assert all("Matemática" not in slow["params"] for slow in stats["slow_queries"])
+    assert any("course_watch_items" in sql for sql in stats["full_scans"])
+    assert "add_task" in QUERY_STATS.format_report()
+
+
+def test_guild_purge_cascades_and_returns_message_refs(tmp_path):
+    db = DatabaseHandler(str(tmp_path / "bot.db"))
+    first_id = db.add_task("Matemática", "Guía 1", "18/03/2026 12:00", 100, 200)
+    second_id = db.add_task("Ética", "Foro", "19/03/2026 18:00", 100, 200)
+    other_id = db.add_task("Ética", "Foro", "19/03/2026 18:00", 100, 300)
+    db.add_task_message(first_id, 10, 20)
+    db.add_task_message(second_id, 11, 21)
+    db.mark_as_delivered(first_id, 1, 200)
+    db.mark_reminder_sent(second_id, "24h")
+
+    deleted, message_refs = db.delete_tasks_for_guild(200)
+
+    conn = db.get_connection()
+    assert deleted == 2
+    assert sorted(message_refs) == [(10, 20), (11, 21)]
+    assert db.get_tasks(200) == []
+    assert [task.id for task in db.get_tasks(300)] == [other_id]
+    assert conn.execute("SELECT COUNT(*) FROM task_messages").fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM deliveries").fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM sent_reminders").fetchone()[0] == 0
+
+    assert db.delete_tasks([other_id, other_id]) == (1, [])
+    assert db.add_task("Ética", "Foro", "19/03/2026 18:00", 100, 300) == 1
+
+
+def test_set_enrollments_applies_only_the_diff(tmp_path):
+    db = DatabaseHandler(str(tmp_path / "bot.db"))
+    db.set_enrollments(1, ["Ética", "Matemática"], 200)
+
+    added, removed = db.set_enrollments(1, ["Matemática ", "Programación"], 200)
+
+    assert added == ["Programación"]
+    assert removed == ["Ética"]
+    assert sorted(db.get_user_enrollments(1, 200)) == ["Matemática", "Programación"]
+    assert db.set_enrollments(1, ["Programación", "Matemática"], 200) == ([], [])
+
+
+def test_import_enrollments_from_csv(tmp_path):
+    db = DatabaseHandler(str(tmp_path / "bot.db"))
+    db.set_enrollments(2, ["Ética"], 200)
+    rows, skipped = read_enrollment_csv("user_id,materia\n1,Ética\n1,Matemática\n2,Matemática\nx,Ética\n3,\n")
+
+    result = db.import_enrollments(rows, 200, replace=True)
+
+    assert skipped == 2
+    assert result == {"users": 2, "added": 3, "removed": 1}
+    assert db.get_user_enrollments(2, 200) == ["Matemática"]
+    assert db.import_enrollments(rows, 200)["added"] == 0
+
+
+def test_maintenance_purges_expired_rows_in_batches(tmp_path):
+    db = DatabaseHandler(str(tmp_path / "bot.db"), write_batch_rows=1)
+    old_id = db.add_task("Ética", "Foro viejo", "18/03/2020 12:00", 100, 200)
+    recent_id = db.add_task("Ética", "Foro", "18/03/2099 12:00", 100, 200)
+    db.mark_reminder_sent(old_id, "24h")
+    db.mark_as_delivered(old_id, 1, 200)
+    db.add_task_message(old_id, 10, 20)
+    db.add_task_message(recent_id, 10, 21)
+    db.add_course_watch_items_bulk(
+        [_watch_item(f"h{index}", f"Foro {index}") for index in range(5)],
+        200,
+    )
+    conn = db.get_connection()
+    with conn:
+        conn.execute("UPDATE course_watch_items SET first_seen = '2020-01-01 00:00:00' WHERE item_hash != 'h0'")
+        conn.execute("INSERT INTO daily_command_usage VALUES ('scan', '2020-01-01', 3)")
+        conn.execute("INSERT INTO page_cache VALUES ('https://example.com/old', NULL, NULL, 'h', x'00', 0)")
+    db.save_cached_page("https://example.com/new", '"v1"', None, "h", b"\x00")
+
+    # Sin archivado ni retención de tasks: la tarea vieja se conserva, sus filas hijas no
+    report = db.run_maintenance(batch_rows=2, pause_ms=0, archive_grace_days=0)
+
+    assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    assert report["deleted"] == {
+        "sent_reminders": 1,
+        "deliveries": 1,
+        "task_messages": 1,
+        "course_watch_items": 4,
+        "daily_command_usage": 1,
+        "page_cache": 1,
+    }
+    assert report["batches"] >= 3
+    assert [task.id for task in db.get_tasks(200)] == [old_id, recent_id]
+    assert db.get_sent_reminders_for_tasks([old_id]) == set()
+    assert not db.is_delivered(old_id, 1)
+    assert sorted(db.get_task_message_index()) == [(21, recent_id)]
+    assert db.get_cached_page("https://example.com/new") == ('"v1"', None, "h", b"\x00")
+
+    # Borrar tareas es opcional y explícito
+    report = db.run_maintenance(pause_ms=0, archive_grace_days=0, retention_days={"tasks": 120})
+    assert report["deleted"]["tasks"] == 1
+    assert [task.id for task in db.get_tasks(200)] == [recent_id]
+    assert db.get_maintenance_stats()["runs"] == 2
+
+
+def test_archival_moves_past_due_tasks_with_messages_and_deliveries(tmp_path):
+    db = DatabaseHandler(str(tmp_path / "bot.db"), write_batch_ms=0)
+    past_ids = [db.add_task("Ética", f"Foro {index}", f"0{index + 1}/03/2026 12:00", 100, 200) for index in range(3)]
+    current_id = db.add_task("Ética", "Foro actual", "18/03/2099 12:00", 100, 200)
+    db.add_task_message(past_ids[0], 10, 20)
+    db.mark_as_delivered(past_ids[0], 1, 200)
+    db.mark_reminder_sent(past_ids[0], "24h")
+    assert len(db.get_tasks(200)) == 4
+
+    report = db.run_maintenance(batch_rows=2, pause_ms=0, archive_grace_days=14, retention_days={"tasks_archive": 0})
+
+    assert report["archived"] == 3
+    assert [task.id for task in db.get_tasks(200)] == [current_id]
+    assert db.get_sent_reminders_for_tasks(past_ids) == set()
+    archived = db.get_archived_task(past_ids[0])
+    assert (archived["task"].title, archived["messages"], archived["delivered_by"]) == ("Foro 0", [(10, 20)], [1])
+    assert [task.id for task in db.get_archived_tasks(200)] == list(reversed(past_ids))
+    assert [task.id for task in db.get_archived_tasks(200, query="foro 1")] == [past_ids[1]]
+
+    # Vaciar la tabla activa no reutiliza IDs que siguen en el archivo
+    db.delete_tasks_for_guild(200)
+    assert db.add_task("Ética", "Nuevo", "18/03/2099 12:00", 100, 200) == past_ids[-1] + 1
+
+
+def test_backup_copies_in_steps_and_rotates(tmp_path):
+    db = DatabaseHandler(str(tmp_path / "bot.db"))
+    for index in range(50):
+        db.add_task("Matemática", f"Guía {index}" * 20, "18/03/2026 12:00", 100, 200)
+    db.mark_reminder_sent(1, "24h")
+    backup_dir = str(tmp_path / "backups")
+
+    report = db.backup(backup_dir=backup_dir, pages_per_step=2, step_sleep_ms=0, compress=False, keep=5)
+
+    assert report["steps"] > 1
+    assert report["pages_copied"] >= report["steps"]
+    restored = sqlite3.connect(report["path"])
+    assert restored.execute("SELECT COUNT(*) FROM tasks").fetchone()[0] == 50
+    assert restored.execute("SELECT COUNT(*) FROM sent_reminders").fetchone()[0] == 1
+    restored.close()
+
+    compressed = db.backup(backup_dir=backup_dir, compress=True, keep=5)
+    with gzip.open(compressed["path"], "rb") as file:
+        assert file.read(16) == b"SQLite format 3\x00"
+
+    for stamp in ("20200101-000000", "20200102-000000"):
+        open(os.path.join(backup_dir, f"bot-{stamp}.db"), "wb").close()
+    assert rotate_backups(backup_dir, db.db_path, keep=2) == ["bot-20200101-000000.db", "bot-20200102-000000.db"]
+    assert db.get_backup_stats()["runs"] == 2
+    assert not any(name.endswith(".partial") for name in os.listdir(backup_dir))
@@ -25,3 +25,18 @@ def test_health_endpoint_returns_heartbeat_fields(monkeypatch):
     assert data["estado"] == "ok"
     assert "heartbeat_age_seconds" in data
     assert "cleanup" in data
+
+
+def test_db_stats_endpoint_requires_token_when_configured(monkeypatch):
+    client = keep_alive.app.test_client()
+    # Cerrada por defecto: sin token configurado no se expone nada
+    monkeypatch.delenv("DB_STATS_TOKEN", raising=False)
+    assert client.get("/db-stats").status_code == 404
+
+    monkeypatch.setenv("DB_STATS_TOKEN", "secreto")
+    assert client.get("/db-stats").status_code == 403
+    assert client.get("/db-stats?token=otro").status_code == 403
+
+    response = client.get("/db-stats?token=secreto")
+    assert response.status_code == 200
+    assert "consultas" in response.get_json()["base_de_datos"]
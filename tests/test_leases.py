@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+
+import pytest
+
+from database.async_db_handler import AsyncDatabaseHandler
+from database.db_handler import DatabaseHandler
+from utils.leases import LeaseManager
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.asyncio
+async def test_guild_jobs_are_split_between_instances_and_taken_over_on_expiry(tmp_path):
+    # Dos procesos sobre el mismo archivo: cada uno con su propio handler y conexión
+    db_file = str(tmp_path / "bot.db")
+    first_db = AsyncDatabaseHandler(DatabaseHandler(db_file))
+    second_db = AsyncDatabaseHandler(DatabaseHandler(db_file))
+    clock = FakeClock()
+    first = LeaseManager(first_db, owner="a", ttl_seconds=30, heartbeat_seconds=10, clock=clock)
+    second = LeaseManager(second_db, owner="b", ttl_seconds=30, heartbeat_seconds=10, clock=clock)
+    guilds = [SimpleNamespace(id=guild_id) for guild_id in (1, 2, 3, 4)]
+
+    await first.heartbeat()
+    assert [guild.id for guild in await first.claim_guilds("recordatorios", guilds)] == [1, 2, 3, 4]
+
+    # Llega una segunda instancia: la primera suelta su excedente y la segunda lo toma
+    await second.heartbeat()
+    assert await second.claim_guilds("recordatorios", guilds) == []
+    assert [guild.id for guild in await first.claim_guilds("recordatorios", guilds)] == [1, 2]
+    assert [guild.id for guild in await second.claim_guilds("recordatorios", guilds)] == [3, 4]
+
+    # Los trabajos exclusivos tienen un único dueño mientras se renueven
+    assert await first.acquire("mantenimiento-db")
+    assert not await second.acquire("mantenimiento-db")
+
+    # La primera muere sin latir: al caducar, la segunda asume todo
+    clock.now += 31
+    await second.heartbeat()
+    assert [guild.id for guild in await second.claim_guilds("recordatorios", guilds)] == [1, 2, 3, 4]
+    assert await second.acquire("mantenimiento-db")
+
+    # Al volver, la primera detecta que perdió sus arrendamientos
+    await first.heartbeat()
+    assert first.stats["lost"] == 3
+    assert first.held() == ["instancia:a"]
+
+    await second.close()
+    assert await second_db.get_leases(now=clock.now) == [("instancia:a", "a", clock.now + 30)]
+
+    await first_db.close()
+    await second_db.close()
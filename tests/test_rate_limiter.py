@@ -0,0 +1,125 @@
+from types import SimpleNamespace
+from zoneinfo import ZoneInfo
+
+import discord
+import pytest
+
+from database.async_db_handler import AsyncDatabaseHandler
+from database.memory_handler import MemoryDatabaseHandler
+from utils.rate_limiter import FixedWindow, RateLimiter, TokenBucket, rate_limited
+
+TIMEZONE = ZoneInfo("America/El_Salvador")
+
+
+class FakeClock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def _interaction(user_id, guild_id=200, interaction_type=discord.InteractionType.application_command):
+    return SimpleNamespace(
+        user=SimpleNamespace(id=user_id),
+        guild=SimpleNamespace(id=guild_id),
+        type=interaction_type,
+        client=SimpleNamespace(),
+    )
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_is_scoped_per_user_and_refills():
+    clock = FakeClock(1_000_000.0)
+    limiter = RateLimiter(clock=clock)
+    limiter.add_rule("buscar", TokenBucket(capacity=2, refill_per_second=1), scope="user")
+
+    assert (await limiter.hit("buscar", user_id=1)).allowed
+    assert (await limiter.hit("buscar", user_id=1)).allowed
+    denied = await limiter.hit("buscar", user_id=1)
+    assert not denied.allowed
+    assert denied.retry_after == pytest.approx(1.0)
+    assert (await limiter.hit("buscar", user_id=2)).allowed
+
+    clock.now += 1
+    assert (await limiter.hit("buscar", user_id=1)).allowed
+
+
+@pytest.mark.asyncio
+async def test_daily_window_loads_once_and_flushes_to_daily_command_usage():
+    clock = FakeClock(1_773_856_800.0)  # 18/03/2026 12:00 en El Salvador
+    db = AsyncDatabaseHandler(MemoryDatabaseHandler())
+    await db.increment_daily_command_usage("reporte:user:1", "2026-03-18")
+    limiter = RateLimiter(db, clock=clock)
+    limiter.add_rule("reporte", FixedWindow(2, daily=True, timezone=TIMEZONE), scope="user", persist_key="reporte")
+
+    assert (await limiter.hit("reporte", user_id=1)).allowed
+    assert not (await limiter.hit("reporte", user_id=1)).allowed
+    assert limiter.stats["db_loads"] == 1
+    assert await db.get_daily_command_usage("reporte:user:1", "2026-03-18") == 1
+
+    assert await limiter.flush() == 1
+    assert await db.get_daily_command_usage("reporte:user:1", "2026-03-18") == 2
+
+    # Un proceso nuevo respeta lo consumido antes del reinicio; al día siguiente se reinicia
+    restarted = RateLimiter(db, clock=clock)
+    restarted.add_rule("reporte", FixedWindow(2, daily=True, timezone=TIMEZONE), scope="user", persist_key="reporte")
+    assert not (await restarted.hit("reporte", user_id=1)).allowed
+    clock.now += 86400
+    assert (await restarted.hit("reporte", user_id=1)).allowed
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_daily_window_survives_the_rule_being_re_added_mid_day():
+    clock = FakeClock(1_773_856_800.0)
+    db = AsyncDatabaseHandler(MemoryDatabaseHandler())
+    limiter = RateLimiter(db, clock=clock)
+    limiter.add_rule("reporte", FixedWindow(2, daily=True, timezone=TIMEZONE), scope="user", persist_key="reporte")
+    assert (await limiter.hit("reporte", user_id=1)).allowed
+    await limiter.flush()
+    assert (await limiter.hit("reporte", user_id=1)).allowed
+
+    # Recarga del cog: la regla nueva parte de lo persistido más lo pendiente de volcar
+    limiter.add_rule("reporte", FixedWindow(2, daily=True, timezone=TIMEZONE), scope="user", persist_key="reporte")
+    assert not (await limiter.hit("reporte", user_id=1)).allowed
+    assert limiter.stats["db_loads"] == 2
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_global_daily_quota_is_shared_by_limiters_on_the_same_database():
+    clock = FakeClock(1_773_856_800.0)
+    db = AsyncDatabaseHandler(MemoryDatabaseHandler())
+    # Dos instancias del bot: cada una con su limitador y la misma base
+    limiters = [RateLimiter(db, clock=clock), RateLimiter(db, clock=clock)]
+    for limiter in limiters:
+        limiter.add_rule("escaneo", FixedWindow(2, daily=True, timezone=TIMEZONE), scope="global", persist_key="escaneo")
+
+    results = [await limiter.hit("escaneo", user_id=1) for limiter in limiters + limiters]
+    assert [result.allowed for result in results] == [True, True, False, False]
+    assert await db.get_daily_command_usage("escaneo", "2026-03-18") == 2
+    # La reserva ya quedó escrita: no hay nada que volcar
+    assert await limiters[0].flush() == 0
+
+    clock.now += 86400
+    assert (await limiters[1].hit("escaneo", user_id=1)).allowed
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_decorator_returns_empty_choices_for_limited_autocomplete():
+    calls = []
+
+    class FakeCog:
+        @rate_limited("autocompletar", TokenBucket(capacity=1, refill_per_second=0.001))
+        async def autocomplete(self, interaction, current):
+            calls.append(current)
+            return ["opción"]
+
+    cog = FakeCog()
+    interaction = _interaction(1, interaction_type=discord.InteractionType.autocomplete)
+
+    assert await cog.autocomplete(interaction, "a") == ["opción"]
+    assert await cog.autocomplete(interaction, "ab") == []
+    assert calls == ["a"]
@@ -0,0 +1,105 @@
+import sqlite3
+
+import pytest
+
+from database.async_db_handler import AsyncDatabaseHandler
+from database.db_handler import DatabaseHandler
+from database.sharding import ShardedDatabaseHandler, shard_path, split_database
+
+
+def test_guilds_get_separate_files_and_task_ids_stay_global(tmp_path):
+    shard_dir = tmp_path / "shards"
+    db = ShardedDatabaseHandler(str(shard_dir), write_batch_ms=0)
+    first_id = db.add_task("Matemática", "Guía 1", "18/03/2026 12:00", 100, 200)
+    second_id = db.add_task("Ética", "Foro", "19/03/2026 18:00", 100, 300)
+    db.add_task_message(second_id, 10, 20)
+    db.mark_reminder_sent(second_id, "24h")
+
+    assert (first_id, second_id) == (1, 2)
+    assert db.shard_ids() == [200, 300]
+    assert [task.id for task in db.get_tasks(300)] == [second_id]
+    assert db.get_sent_reminders_for_tasks([first_id, second_id]) == {(second_id, "24h")}
+    assert db.fan_out(lambda shard, guild_id: len(shard.get_tasks(guild_id))) == {200: 1, 300: 1}
+
+    assert db.delete_tasks([first_id, second_id]) == (2, [(10, 20)])
+    assert db.get_task_by_id(second_id) is None
+    db.close()
+
+    # El directorio sobrevive reinicios: los IDs no se reutilizan mientras queden tareas
+    reopened = ShardedDatabaseHandler(str(shard_dir), write_batch_ms=0)
+    third_id = reopened.add_task("Ética", "Foro 2", "19/03/2026 18:00", 100, 300)
+    assert reopened.add_task("Ética", "Foro 3", "19/03/2026 18:00", 100, 200) == third_id + 1
+    assert reopened.get_task_by_id(third_id).guild_id == 300
+    reopened.close()
+
+
+def test_split_database_copies_each_guild_into_its_own_shard(tmp_path):
+    source_path = str(tmp_path / "bot.db")
+    source = DatabaseHandler(source_path, write_batch_ms=0)
+    task_a = source.add_task("Matemática", "Guía 1", "18/03/2026 12:00", 100, 200)
+    task_b = source.add_task("Ética", "Foro", "19/03/2026 18:00", 100, 300)
+    source.delete_task(source.add_task("Ética", "Borrada", "19/03/2026 18:00", 100, 300))
+    source.add_task_message(task_b, 10, 20)
+    source.mark_as_delivered(task_b, 1, 300)
+    source.set_enrollments(1, ["Ética"], 300)
+    item = {"item_hash": "a", "course_name": "MAT", "week_name": "S1", "activity_type": "TAREA", "title": "Guía", "url": "https://example.com/a"}
+    source.add_course_watch_items_bulk([item], 200)
+    source.increment_daily_command_usage("scan", "2026-03-18")
+    source.save_http_cookies("cvirtual", '[{"name": "MoodleSession"}]')
+    source.save_cached_page("https://example.com/a", '"v1"', None, "hash", b"body")
+    source.close()
+
+    shard_dir = str(tmp_path / "shards")
+    report = split_database(source_path, shard_dir)
+    assert (report["guilds"], report["tasks"]) == (2, 2)
+    with pytest.raises(FileExistsError):
+        split_database(source_path, shard_dir)
+
+    with sqlite3.connect(shard_path(shard_dir, 300)) as conn:
+        assert conn.execute("SELECT id FROM tasks").fetchall() == [(task_b,)]
+    db = ShardedDatabaseHandler(shard_dir, write_batch_ms=0)
+    assert db.get_task_messages(task_b) == [(10, 20)]
+    assert db.is_delivered(task_b, 1)
+    assert db.get_user_enrollments(1, 300) == ["Ética"]
+    assert db.get_daily_command_usage("scan", "2026-03-18") == 1
+    # La sesión de Moodle y la caché de páginas pasan a global.db
+    assert db.get_http_cookies("cvirtual") == '[{"name": "MoodleSession"}]'
+    assert db.get_cached_page("https://example.com/a") == ('"v1"', None, "hash", b"body")
+    # Actividades ya conocidas no se vuelven a anunciar en ningún servidor
+    assert db.add_course_watch_items_bulk([item], 300) == set()
+    # Los IDs continúan después del último asignado en la base original
+    assert db.add_task("Ética", "Nueva", "19/03/2026 18:00", 100, 200) == task_b + 2
+    assert db.get_task_by_id(task_a).guild_id == 200
+    db.close()
+
+
+@pytest.mark.asyncio
+async def test_async_facade_uses_one_writer_per_guild(tmp_path):
+    db = AsyncDatabaseHandler(ShardedDatabaseHandler(str(tmp_path / "shards"), write_batch_ms=0))
+    first_id = await db.add_task("Matemática", "Guía 1", "18/03/2026 12:00", 100, 200)
+    await db.add_task("Ética", "Foro", "19/03/2026 18:00", 100, 300)
+    await db.mark_reminder_sent(first_id, "24h")
+    await db.increment_daily_command_usage("scan", "2026-03-18")
+
+    assert set(db._shard_writers) == {200, 300}
+    assert await db.is_reminder_sent(first_id, "24h")
+    await db.close()
+
+
+def test_open_shards_are_capped_and_busy_shards_are_never_closed(tmp_path):
+    db = ShardedDatabaseHandler(str(tmp_path / "shards"), write_batch_ms=0, max_open_shards=2)
+    task_ids = {guild_id: db.add_task("Ética", "Foro", "19/03/2026 18:00", 100, guild_id) for guild_id in (200, 300, 400)}
+
+    assert list(db._shards) == [300, 400]
+    assert db.get_task_cache_stats()["shards_evicted"] == 1
+    # Una base cerrada se reabre al volver a usarla
+    assert db.get_task_by_id(task_ids[200]).guild_id == 200
+    assert list(db._shards) == [400, 200]
+
+    # Con 300 en uso, abrir otra cierra la siguiente menos usada y no la ocupada
+    with db._pinned(300):
+        db.get_tasks(200)
+        db.get_tasks(400)
+        assert list(db._shards) == [300, 400]
+    db.close()
+
@@ -0,0 +1,169 @@
+import pytest
+
+from database.db_handler import DatabaseHandler
+from database.memory_handler import MemoryDatabaseHandler
+from database.storage import StorageBackend, create_storage
+
+
+@pytest.fixture(params=["sqlite", "memory", "sharded"])
+def storage(request, tmp_path):
+    if request.param == "sqlite":
+        backend = create_storage("sqlite", db_path=str(tmp_path / "bot.db"))
+    elif request.param == "sharded":
+        backend = create_storage("sharded", shard_dir=str(tmp_path / "shards"))
+    else:
+        backend = create_storage("memory")
+    yield backend
+    backend.close()
+
+
+def test_backends_implement_storage_protocol(storage):
+    assert isinstance(storage, StorageBackend)
+
+
+def test_task_lifecycle_matches_across_backends(storage):
+    first_id = storage.add_task("Matemática", "Guía 1", "18/03/2026 12:00", 100, 200)
+    second_id = storage.add_task("Ética", "Foro", "19/03/2026 18:00", 100, 200, reminders_active=0)
+    storage.add_task_message(first_id, 10, 20)
+    storage.mark_as_delivered(first_id, 1, 200)
+    storage.mark_reminder_sent(first_id, "24h")
+    storage.mark_reminder_sent(first_id, "24h")
+
+    assert storage.update_task(second_id, title="Foro 2") is True
+    assert storage.update_task(999, title="Nada") is False
+    assert [task.id for task in storage.get_task_choices(200, subject="Ética")] == [second_id]
+    assert storage.get_task_by_id(second_id).title == "Foro 2"
+    start = storage.get_task_by_id(first_id).due_ts
+    assert [task.id for task in storage.get_tasks_due_between(200, start, start + 7 * 86400, reminders_only=True)] == [first_id]
+    assert storage.get_delivered_pairs_for_tasks(200, [first_id, second_id]) == {(first_id, 1)}
+    assert storage.get_sent_reminders_for_tasks([first_id]) == {(first_id, "24h")}
+
+    assert storage.delete_tasks_for_guild(200) == (2, [(10, 20)])
+    assert storage.get_tasks(200) == []
+    assert not storage.is_delivered(first_id, 1)
+    assert not storage.is_reminder_sent(first_id, "24h")
+    assert storage.add_task("Ética", "Foro", "19/03/2026 18:00", 100, 200) == 1
+
+
+def test_search_is_ranked_and_accent_insensitive_across_backends(storage):
+    guide = storage.add_task("Matemática", "Guía de álgebra", "18/03/2026 12:00", 100, 200)
+    forum = storage.add_task("Ética", "Foro", "19/03/2026 18:00", 100, 200, instructions="Leer la guía del capítulo 2")
+    storage.add_task("Matemática", "Guía de álgebra", "18/03/2026 12:00", 100, 300)
+
+    assert [task.id for task in storage.search_tasks(200, "guia")] == [guide, forum]
+    assert [task.id for task in storage.search_tasks(200, "ALGEB")] == [guide]
+    assert [task.id for task in storage.search_tasks(200, "guía", subject="Ética")] == [forum]
+    assert [task.id for task in storage.search_tasks(200, f"#{forum}")] == [forum]
+    # La sintaxis de FTS5 escrita por el usuario se trata como texto
+    assert [task.id for task in storage.search_tasks(200, 'guia"*(')] == [guide, forum]
+
+    storage.update_task(forum, instructions="Resumen")
+    assert storage.search_tasks(200, "capitulo") == []
+    storage.delete_task(guide)
+    assert storage.search_tasks(200, "algebra") == []
+    assert [task.id for task in storage.search_tasks(200, "")] == [forum]
+
+
+def test_archival_matches_across_backends(storage):
+    old_id = storage.add_task("Ética", "Foro viejo", "01/03/2020 12:00", 100, 200)
+    current_id = storage.add_task("Ética", "Foro", "18/03/2099 12:00", 100, 200)
+    storage.mark_as_delivered(old_id, 1, 200)
+
+    report = storage.run_maintenance(pause_ms=0, archive_grace_days=14, retention_days={"tasks_archive": 0})
+
+    assert report["archived"] == 1
+    assert [task.id for task in storage.get_tasks(200)] == [current_id]
+    assert storage.get_archived_task(old_id)["delivered_by"] == [1]
+    assert [task.id for task in storage.get_archived_tasks(200, query="viejo")] == [old_id]
+    assert storage.get_archived_tasks(300) == []
+
+
+def test_retention_prunes_child_rows_but_keeps_tasks_across_backends(storage):
+    old_id = storage.add_task("Ética", "Foro viejo", "01/03/2020 12:00", 100, 200)
+    storage.add_task_message(old_id, 10, 20)
+    storage.mark_as_delivered(old_id, 1, 200)
+    storage.mark_reminder_sent(old_id, "24h")
+
+    report = storage.run_maintenance(pause_ms=0, archive_grace_days=0)
+
+    assert {table: report["deleted"][table] for table in ("sent_reminders", "deliveries", "task_messages")} == {
+        "sent_reminders": 1,
+        "deliveries": 1,
+        "task_messages": 1,
+    }
+    assert [task.id for task in storage.get_tasks(200)] == [old_id]
+    assert storage.get_task_message_index() == []
+    assert not storage.is_delivered(old_id, 1)
+
+
+def test_task_message_index_matches_across_backends(storage):
+    task_id = storage.add_task("Ética", "Foro", "18/03/2099 12:00", 100, 200)
+    storage.add_task_message(task_id, 10, 20)
+    storage.add_task_message(task_id, 10, 20)
+    storage.add_task_message(task_id, 11, 21)
+
+    assert sorted(storage.get_task_message_index()) == [(20, task_id), (21, task_id)]
+    assert storage.get_task_id_for_message(200, 21) == task_id
+    assert storage.get_task_id_for_message(200, 99) is None
+    # Un mensaje de la tarea no se resuelve desde otro servidor
+    assert storage.get_task_id_for_message(300, 21) is None
+
+    storage.delete_task(task_id)
+    assert storage.get_task_message_index() == []
+
+
+def test_enrollments_watch_items_and_counters_match_across_backends(storage):
+    assert storage.is_user_enrolled_in_subject(1, "Ética", 200) is True
+    storage.set_enrollments(1, ["Ética", "Matemática"], 200)
+    assert storage.set_enrollments(1, ["Matemática"], 200) == ([], ["Ética"])
+    assert storage.is_user_enrolled_in_subject(1, "Ética", 200) is False
+    assert storage.import_enrollments([(2, "Ética"), (2, "Ética")], 200) == {"users": 1, "added": 1, "removed": 0}
+    assert storage.get_enrollment_snapshot(200)["subjects_by_user"] == {1: {"Matemática"}, 2: {"Ética"}}
+
+    item = {"item_hash": "a", "course_name": "MAT", "week_name": "S1", "activity_type": "TAREA", "title": "Guía", "url": "https://example.com/a"}
+    assert storage.add_course_watch_items_bulk([item], 200) == {"a"}
+    assert storage.add_course_watch_item("a", "MAT", "S1", "TAREA", "Guía", "https://example.com/a", 200) is False
+
+    storage.increment_daily_command_usage("scan", "2026-03-18")
+    storage.increment_daily_command_usage("scan", "2026-03-18")
+    assert storage.get_daily_command_usage("scan", "2026-03-18") == 2
+    assert storage.get_daily_command_usage("scan", "2026-03-19") == 0
+    assert storage.reserve_daily_command_usage("scan", "2026-03-18", 3) == 3
+    assert storage.reserve_daily_command_usage("scan", "2026-03-18", 3) is None
+    assert storage.reserve_daily_command_usage("scan", "2026-03-19", 3) == 1
+
+
+def test_leases_match_across_backends(storage):
+    assert storage.acquire_lease("escaneo:1", "a", 30, now=100)
+    assert not storage.acquire_lease("escaneo:1", "b", 30, now=110)
+    assert storage.acquire_lease("escaneo:1", "a", 30, now=120)
+    # Caducado (sin renovar hasta 150): cualquier otra instancia puede tomarlo
+    assert storage.acquire_lease("escaneo:1", "b", 30, now=150)
+    assert storage.acquire_lease("instancia:b", "b", 30, now=150)
+
+    assert storage.get_leases("escaneo:", now=160) == [("escaneo:1", "b", 180)]
+    assert storage.release_leases(["escaneo:1", "instancia:b"], "a") == 0
+    assert storage.release_leases(["escaneo:1"], "b") == 1
+    assert storage.get_leases(now=160) == [("instancia:b", "b", 180)]
+
+
+def test_http_cookies_match_across_backends(storage):
+    assert storage.get_http_cookies("cvirtual") is None
+    storage.save_http_cookies("cvirtual", '[{"name": "MoodleSession"}]')
+    storage.save_http_cookies("cvirtual", '[{"name": "MoodleSession", "value": "b"}]')
+    assert storage.get_http_cookies("cvirtual") == '[{"name": "MoodleSession", "value": "b"}]'
+    storage.delete_http_cookies("cvirtual")
+    assert storage.get_http_cookies("cvirtual") is None
+
+
+def test_create_storage_uses_environment_variable(monkeypatch, tmp_path):
+    monkeypatch.setenv("DB_BACKEND", "memory")
+    assert isinstance(create_storage(), MemoryDatabaseHandler)
+
+    monkeypatch.setenv("DB_BACKEND", "sqlite")
+    sqlite_backend = create_storage(db_path=str(tmp_path / "bot.db"))
+    assert isinstance(sqlite_backend, DatabaseHandler)
+    sqlite_backend.close()
+
+    with pytest.raises(ValueError):
+        create_storage("postgres")
@@ -0,0 +1,73 @@
+from types import SimpleNamespace
+
+import pytest
+
+from database.async_db_handler import AsyncDatabaseHandler
+from database.memory_handler import MemoryDatabaseHandler
+from utils.task_completion import NEGATIVE_TTL_SECONDS, TaskMessageIndex, complete_task_from_message
+
+
+@pytest.mark.asyncio
+async def test_completion_resolves_tasks_from_the_warmed_message_index():
+    db = AsyncDatabaseHandler(MemoryDatabaseHandler())
+    task_id = await db.add_task("Ética", "Foro", "18/03/2099 12:00", 100, 200)
+    await db.add_task_message(task_id, 10, 20)
+    client = SimpleNamespace(db=db, task_messages=TaskMessageIndex(db))
+    await client.task_messages.warm()
+    await client.task_messages.add(task_id, 11, 21)
+
+    assert (await complete_task_from_message(client, 200, 1, 21)).id == task_id
+    assert await db.is_delivered(task_id, 1)
+    # Mensajes no rastreados o de otro servidor no completan nada
+    assert await complete_task_from_message(client, 200, 2, 99) is None
+    assert await complete_task_from_message(client, 300, 2, 20) is None
+
+    _deleted, message_refs = await db.delete_tasks([task_id])
+    assert await complete_task_from_message(client, 200, 2, 20) is None
+    assert client.task_messages.stats["stale"] == 1
+    client.task_messages.forget(message_refs)
+    assert len(client.task_messages) == 0
+
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_warmed_index_still_resolves_messages_registered_after_warming():
+    db = AsyncDatabaseHandler(MemoryDatabaseHandler())
+    task_id = await db.add_task("Ética", "Foro", "18/03/2099 12:00", 100, 200)
+    index = TaskMessageIndex(db)
+    await index.warm()
+    # Registrado sin pasar por el índice (otra instancia o escritura directa)
+    await db.add_task_message(task_id, 10, 30)
+
+    assert (await index.resolve(30, 200)).id == task_id
+    assert index.get(30) == task_id
+    assert index.stats["db_lookups"] == 1
+    # El segundo intento ya es un acierto en memoria
+    await index.resolve(30, 200)
+    assert index.stats["hits"] == 1
+    assert await index.resolve(99, 200) is None
+
+    await db.close()
+
+
+@pytest.mark.asyncio
+async def test_messages_that_are_not_tasks_are_remembered_for_a_while():
+    db = AsyncDatabaseHandler(MemoryDatabaseHandler())
+    task_id = await db.add_task("Ética", "Foro", "18/03/2099 12:00", 100, 200)
+    now = [0.0]
+    index = TaskMessageIndex(db, clock=lambda: now[0])
+
+    # Reacciones repetidas a un mensaje cualquiera: una sola consulta mientras dura el TTL
+    for _ in range(3):
+        assert await index.resolve(99, 200) is None
+    assert (index.stats["db_lookups"], index.stats["negative_hits"]) == (1, 2)
+    now[0] += NEGATIVE_TTL_SECONDS + 1
+    assert await index.resolve(99, 200) is None
+    assert index.stats["db_lookups"] == 2
+
+    # Registrar el mensaje como tarea olvida el negativo
+    await index.add(task_id, 10, 99)
+    assert (await index.resolve(99, 200)).id == task_id
+
+    await db.close()
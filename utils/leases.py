@@ -0,0 +1,160 @@
+# leases.py - Reparto de trabajo en segundo plano entre instancias del bot mediante arrendamientos en la base
+import asyncio
+import logging
+import math
+import os
+import socket
+import time
+import uuid
+
+logger = logging.getLogger("s4vi.leases")
+
+DEFAULT_TTL_SECONDS = 30
+DEFAULT_HEARTBEAT_SECONDS = 10
+INSTANCE_PREFIX = "instancia:"
+
+
+def _env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def default_owner_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+# Arrendamientos con latido: cada instancia se anuncia con "instancia:<id>", renueva cada
+# `heartbeat_seconds` lo que posee y pierde lo que no renueve en `ttl_seconds`. Así, si un proceso
+# muere, otro toma sus trabajos en cuanto caducan. Sin base (db=None) todo se concede (una sola instancia).
+class LeaseManager:
+    def __init__(self, db=None, owner=None, ttl_seconds=None, heartbeat_seconds=None, clock=time.time):
+        self.db = db
+        self.owner = owner or default_owner_id()
+        self.ttl_seconds = ttl_seconds or _env_float("LEASE_TTL_SECONDS", DEFAULT_TTL_SECONDS)
+        heartbeat_seconds = heartbeat_seconds or _env_float("LEASE_HEARTBEAT_SECONDS", DEFAULT_HEARTBEAT_SECONDS)
+        # El latido debe llegar bastante antes de la caducidad
+        self.heartbeat_seconds = min(heartbeat_seconds, self.ttl_seconds / 2)
+        self._clock = clock
+        self.instance_lease = f"{INSTANCE_PREFIX}{self.owner}"
+        self._held = set()
+        self._heartbeat_task = None
+        self.stats = {"acquired": 0, "renewed": 0, "lost": 0, "released": 0, "denied": 0}
+
+    def is_held(self, name):
+        return self.db is None or name in self._held
+
+    def held(self):
+        return sorted(self._held)
+
+    async def _try_acquire(self, name):
+        renewing = name in self._held
+        granted = await self.db.acquire_lease(name, self.owner, self.ttl_seconds, self._clock())
+        if granted:
+            self._held.add(name)
+            self.stats["renewed" if renewing else "acquired"] += 1
+        elif renewing:
+            self._held.discard(name)
+            self.stats["lost"] += 1
+            logger.warning("Arrendamiento %s perdido: otra instancia lo tomó", name)
+        else:
+            self.stats["denied"] += 1
+        return granted
+
+    # Tomar (o renovar) un trabajo exclusivo, p. ej. el mantenimiento de la base
+    async def acquire(self, name):
+        if self.db is None:
+            return True
+        try:
+            return await self._try_acquire(name)
+        except Exception:
+            logger.exception("No se pudo tomar el arrendamiento %s", name)
+            return False
+
+    async def release(self, names):
+        names = [name for name in names if name in self._held]
+        if not names or self.db is None:
+            return 0
+        self._held.difference_update(names)
+        released = await self.db.release_leases(names, self.owner)
+        self.stats["released"] += released
+        return released
+
+    async def live_instances(self):
+        if self.db is None:
+            return 1
+        rows = await self.db.get_leases(INSTANCE_PREFIX, self._clock())
+        return max(1, len(rows))
+
+    # Repartir un trabajo por servidor: cada instancia viva se queda con ceil(servidores / instancias)
+    # arrendamientos "<trabajo>:<guild_id>". Conserva los que ya tiene, toma libres o caducados hasta su
+    # cuota y suelta el excedente para que una instancia recién llegada pueda tomarlo en su siguiente ciclo.
+    async def claim_guilds(self, job, guilds):
+        guilds = list(guilds)
+        if self.db is None:
+            return guilds
+        try:
+            share = math.ceil(len(guilds) / await self.live_instances())
+            keys = {f"{job}:{guild.id}": guild for guild in guilds}
+            held = [key for key in keys if key in self._held]
+            # Excedente sobre la cuota y servidores que ya no están (el bot salió de ellos)
+            excess = held[share:] + [name for name in self._held if name.startswith(f"{job}:") and name not in keys]
+            if excess:
+                await self.release(excess)
+            claimed = set()
+            for key in held[:share]:
+                if await self._try_acquire(key):
+                    claimed.add(key)
+            for key in keys:
+                if len(claimed) >= share:
+                    break
+                if key not in self._held and await self._try_acquire(key):
+                    claimed.add(key)
+            return [guild for key, guild in keys.items() if key in claimed]
+        except Exception:
+            logger.exception("No se pudieron repartir los servidores del trabajo %s", job)
+            return []
+
+    # Renovar todo lo que se posee (y el anuncio de la instancia) antes de que caduque
+    async def heartbeat(self):
+        await self.acquire(self.instance_lease)
+        for name in list(self._held):
+            if name != self.instance_lease:
+                await self.acquire(name)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.heartbeat()
+            except Exception:
+                logger.exception("Fallo en el latido de arrendamientos")
+            await asyncio.sleep(self.heartbeat_seconds)
+
+    def is_running(self):
+        return self._heartbeat_task is not None and not self._heartbeat_task.done()
+
+    def start(self):
+        if self.db is not None and not self.is_running():
+            self._heartbeat_task = asyncio.get_running_loop().create_task(self._run())
+
+    # Detener el latido y liberar todo para que otra instancia lo tome sin esperar la caducidad
+    async def close(self):
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            self._heartbeat_task = None
+        try:
+            await self.release(list(self._held))
+        except Exception:
+            logger.exception("No se pudieron liberar los arrendamientos al cerrar")
+
+    def snapshot(self):
+        return {**self.stats, "owner": self.owner, "held": len(self._held), "heartbeat_running": self.is_running()}
+
+
+# Sin gestor en el cliente (p. ej. en pruebas) todo el trabajo es local
+_fallback_manager = LeaseManager()
+
+
+def get_lease_manager(client):
+    return getattr(client, "leases", None) or _fallback_manager
@@ -0,0 +1,312 @@
+# rate_limiter.py - Límites de uso en memoria (token bucket y ventana fija) con persistencia diaria
+import asyncio
+import datetime
+import functools
+import logging
+import time
+from typing import NamedTuple
+
+import discord
+
+logger = logging.getLogger("s4vi.rate_limiter")
+
+DEFAULT_FLUSH_INTERVAL_SECONDS = 30
+SCOPES = ("user", "guild", "global")
+
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    remaining: int
+    retry_after: float
+
+
+# Ráfagas de hasta `capacity` usos, recargando `refill_per_second` fichas por segundo
+class TokenBucket:
+    def __init__(self, capacity, refill_per_second):
+        self.capacity = max(1, capacity)
+        self.refill_per_second = max(0.001, refill_per_second)
+        self._buckets = {}
+
+    def hit(self, key, now):
+        tokens, updated_at = self._buckets.get(key, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - updated_at) * self.refill_per_second)
+        if tokens < 1:
+            self._buckets[key] = (tokens, now)
+            return RateLimitResult(False, 0, (1 - tokens) / self.refill_per_second)
+        self._buckets[key] = (tokens - 1, now)
+        return RateLimitResult(True, int(tokens - 1), 0.0)
+
+    # Olvidar las claves que ya recargaron por completo (equivalen a una clave nueva)
+    def prune(self, now):
+        full = [
+            key
+            for key, (tokens, updated_at) in self._buckets.items()
+            if tokens + (now - updated_at) * self.refill_per_second >= self.capacity
+        ]
+        for key in full:
+            del self._buckets[key]
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+# Como máximo `limit` usos por ventana: de `window_seconds` segundos o por día calendario en `timezone`
+class FixedWindow:
+    def __init__(self, limit, window_seconds=None, daily=False, timezone=None):
+        if not daily and not window_seconds:
+            raise ValueError("FixedWindow requiere window_seconds o daily=True")
+        self.limit = max(1, limit)
+        self.window_seconds = window_seconds
+        self.daily = daily
+        self.timezone = timezone
+        self._counts = {}
+
+    def window_id(self, now):
+        if self.daily:
+            return datetime.datetime.fromtimestamp(now, self.timezone).strftime("%Y-%m-%d")
+        return str(int(now // self.window_seconds))
+
+    def _retry_after(self, now):
+        if self.daily:
+            current = datetime.datetime.fromtimestamp(now, self.timezone)
+            next_day = (current + datetime.timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+            return max(0.0, next_day.timestamp() - now)
+        return self.window_seconds - (now % self.window_seconds)
+
+    # Valor ya consumido en otra ejecución del proceso (cargado desde la base)
+    def seed(self, key, window_id, used):
+        self._counts[(key, window_id)] = max(self._counts.get((key, window_id), 0), used)
+
+    def hit(self, key, now):
+        window_id = self.window_id(now)
+        used = self._counts.get((key, window_id), 0)
+        if used >= self.limit:
+            return RateLimitResult(False, 0, self._retry_after(now))
+        self._counts[(key, window_id)] = used + 1
+        return RateLimitResult(True, self.limit - used - 1, 0.0)
+
+    def prune(self, now):
+        current = self.window_id(now)
+        for counter_key in [counter_key for counter_key in self._counts if counter_key[1] != current]:
+            del self._counts[counter_key]
+
+    def __len__(self):
+        return len(self._counts)
+
+
+class _Rule:
+    __slots__ = ("name", "strategy", "scope", "persist_key")
+
+    def __init__(self, name, strategy, scope, persist_key):
+        self.name = name
+        self.strategy = strategy
+        self.scope = scope
+        self.persist_key = persist_key
+
+
+# Motor de límites del bot: reglas con nombre, claves por usuario/servidor/global y
+# persistencia periódica de las ventanas diarias en daily_command_usage. Las ventanas diarias
+# globales no se cuentan en memoria: cada uso se reserva en la base (cupo compartido entre instancias).
+class RateLimiter:
+    def __init__(self, db=None, flush_interval_seconds=DEFAULT_FLUSH_INTERVAL_SECONDS, clock=time.time):
+        self.db = db
+        self.flush_interval_seconds = flush_interval_seconds
+        self._clock = clock
+        self._rules = {}
+        # (regla, clave, ventana) -> tarea de carga desde la base (compartida por llamadas concurrentes)
+        self._loads = {}
+        self._dirty = {}
+        self._flush_task = None
+        self.stats = {"allowed": 0, "limited": 0, "db_loads": 0, "flushes": 0, "rows_flushed": 0}
+
+    # persist_key: solo para ventanas diarias; el contador sobrevive reinicios vía daily_command_usage
+    def add_rule(self, name, strategy, scope="user", persist_key=None):
+        if scope not in SCOPES:
+            raise ValueError(f"Alcance inválido: {scope}")
+        if persist_key and not (isinstance(strategy, FixedWindow) and strategy.daily):
+            raise ValueError("Solo las ventanas diarias pueden persistirse")
+        rule = _Rule(name, strategy, scope, persist_key)
+        self._rules[name] = rule
+        # Una regla reemplazada empieza con contadores vacíos: se vuelve a cargar lo persistido
+        self._loads = {marker: load for marker, load in self._loads.items() if marker[0] != name}
+        return rule
+
+    def ensure_rule(self, name, strategy, scope="user", persist_key=None):
+        return self._rules.get(name) or self.add_rule(name, strategy, scope, persist_key)
+
+    def _scope_key(self, rule, user_id, guild_id):
+        if rule.scope == "user":
+            return f"user:{user_id}"
+        if rule.scope == "guild":
+            return f"guild:{guild_id}"
+        return "global"
+
+    def _storage_key(self, rule, scope_key):
+        # Las reglas globales conservan la clave histórica (p. ej. tareas_nuevas_global)
+        return rule.persist_key if rule.scope == "global" else f"{rule.persist_key}:{scope_key}"
+
+    async def _fetch_persisted(self, rule, scope_key, window_id):
+        storage_key = self._storage_key(rule, scope_key)
+        try:
+            used = await self.db.get_daily_command_usage(storage_key, window_id)
+        except Exception:
+            logger.exception("No se pudo cargar el contador persistido de %s", rule.name)
+            return
+        self.stats["db_loads"] += 1
+        # Más los usos aún sin volcar (p. ej. si la regla se reemplazó a mitad del día)
+        rule.strategy.seed(scope_key, window_id, used + self._dirty.get((storage_key, window_id), 0))
+
+    async def _load_persisted(self, rule, scope_key, window_id):
+        if self.db is None:
+            return
+        marker = (rule.name, scope_key, window_id)
+        load = self._loads.get(marker)
+        if load is None:
+            load = asyncio.ensure_future(self._fetch_persisted(rule, scope_key, window_id))
+            self._loads[marker] = load
+        await load
+
+    # Cupo global persistido: se reserva en la base con una sola sentencia, así varias instancias del
+    # bot comparten el mismo límite. Devuelve None si la base falla (se sigue con el contador local).
+    async def _reserve_global(self, rule, scope_key, now):
+        window_id = rule.strategy.window_id(now)
+        try:
+            used = await self.db.reserve_daily_command_usage(
+                self._storage_key(rule, scope_key),
+                window_id,
+                rule.strategy.limit,
+            )
+        except Exception:
+            logger.exception("No se pudo reservar el cupo global de %s; se usa el contador local", rule.name)
+            return None
+        if used is None:
+            rule.strategy.seed(scope_key, window_id, rule.strategy.limit)
+            return RateLimitResult(False, 0, rule.strategy._retry_after(now))
+        rule.strategy.seed(scope_key, window_id, used)
+        return RateLimitResult(True, rule.strategy.limit - used, 0.0)
+
+    # Consumir un uso de la regla; interaction aporta usuario y servidor si no se pasan explícitos
+    async def hit(self, name, interaction=None, user_id=None, guild_id=None):
+        rule = self._rules[name]
+        if interaction is not None:
+            user_id = user_id if user_id is not None else interaction.user.id
+            guild_id = guild_id if guild_id is not None else getattr(interaction.guild, "id", None)
+        scope_key = self._scope_key(rule, user_id, guild_id)
+        now = self._clock()
+
+        if rule.persist_key and rule.scope == "global" and self.db is not None:
+            result = await self._reserve_global(rule, scope_key, now)
+            if result is not None:
+                self.stats["allowed" if result.allowed else "limited"] += 1
+                return result
+
+        window_id = None
+        if rule.persist_key:
+            window_id = rule.strategy.window_id(now)
+            # Una lectura por clave y día, no por invocación
+            await self._load_persisted(rule, scope_key, window_id)
+
+        result = rule.strategy.hit(scope_key, now)
+        if result.allowed:
+            self.stats["allowed"] += 1
+            if rule.persist_key:
+                dirty_key = (self._storage_key(rule, scope_key), window_id)
+                self._dirty[dirty_key] = self._dirty.get(dirty_key, 0) + 1
+        else:
+            self.stats["limited"] += 1
+        return result
+
+    # Volcar a la base los incrementos acumulados en una sola escritura
+    async def flush(self):
+        if not self._dirty or self.db is None:
+            return 0
+        pending, self._dirty = self._dirty, {}
+        entries = [(key, window_id, delta) for (key, window_id), delta in pending.items()]
+        try:
+            await self.db.add_daily_command_usage(entries)
+        except Exception:
+            # Reintentar en el siguiente ciclo sin perder los incrementos
+            for dirty_key, delta in pending.items():
+                self._dirty[dirty_key] = self._dirty.get(dirty_key, 0) + delta
+            raise
+        self.stats["flushes"] += 1
+        self.stats["rows_flushed"] += len(entries)
+        return len(entries)
+
+    def prune(self):
+        now = self._clock()
+        for rule in self._rules.values():
+            rule.strategy.prune(now)
+        # Los marcadores de carga solo importan para la ventana vigente de cada regla persistida
+        current = {
+            rule.name: rule.strategy.window_id(now) for rule in self._rules.values() if rule.persist_key
+        }
+        self._loads = {marker: load for marker, load in self._loads.items() if current.get(marker[0]) == marker[2]}
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval_seconds)
+            try:
+                await self.flush()
+                self.prune()
+            except Exception:
+                logger.exception("Fallo al volcar contadores de límites de uso")
+
+    def start(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+
+    def snapshot(self):
+        return {
+            **self.stats,
+            "rules": {name: {"scope": rule.scope, "keys": len(rule.strategy)} for name, rule in self._rules.items()},
+            "pending_rows": len(self._dirty),
+        }
+
+
+# Limiter de respaldo si el cliente no expone uno (p. ej. en pruebas); sin persistencia
+_fallback_limiter = RateLimiter()
+
+
+def get_rate_limiter(client):
+    return getattr(client, "rate_limiter", None) or _fallback_limiter
+
+
+# Decorador para callbacks de app commands y autocompletados (después de `self` va la interacción).
+# Si se supera el límite, un comando responde un aviso efímero y un autocompletado devuelve [].
+def rate_limited(name, strategy, scope="user", message=None):
+    def decorator(callback):
+        @functools.wraps(callback)
+        async def wrapper(self, interaction, *args, **kwargs):
+            limiter = get_rate_limiter(interaction.client)
+            limiter.ensure_rule(name, strategy, scope)
+            result = await limiter.hit(name, interaction)
+            if result.allowed:
+                return await callback(self, interaction, *args, **kwargs)
+
+            if interaction.type == discord.InteractionType.autocomplete:
+                return []
+            text = message or f"Demasiadas solicitudes. Intenta de nuevo en {max(1, round(result.retry_after))} s."
+            if interaction.response.is_done():
+                await interaction.followup.send(text, ephemeral=True)
+            else:
+                await interaction.response.send_message(text, ephemeral=True)
+            return None
+
+        return wrapper
+
+    return decorator
+
+
+# Autocompletados que consultan tareas (uno por tecla): ráfagas de 10 y 5 por segundo sostenidas, por usuario
+task_autocomplete_limit = rate_limited(
+    "autocompletado_tareas",
+    TokenBucket(capacity=10, refill_per_second=5),
+    scope="user",
+)
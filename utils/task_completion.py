@@ -0,0 +1,130 @@
+# task_completion.py - Completar tareas desde sus mensajes (botón persistente o reacción ✅)
+import logging
+import time
+from collections import OrderedDict
+
+import discord
+
+from utils.embeds import create_error_embed, create_success_embed
+
+logger = logging.getLogger("s4vi.task_completion")
+
+COMPLETE_EMOJI = "✅"
+COMPLETE_BUTTON_ID = "s4vi:completar-tarea"
+# Mensajes que no son de una tarea (cualquier ✅ del servidor): se recuerdan un rato para no
+# consultar la base con cada reacción repetida
+NEGATIVE_TTL_SECONDS = 60
+MAX_NEGATIVE_ENTRIES = 2048
+
+
+# Índice en memoria mensaje -> tarea de todos los mensajes rastreados. Se precarga al arrancar
+# (una lectura de task_messages) y se mantiene con cada registro y borrado, así que los aciertos no
+# consultan la base. Un fallo sí la consulta: el mensaje pudo registrarlo otra instancia o un
+# add_task_message directo después de la precarga.
+class TaskMessageIndex:
+    def __init__(self, db=None, clock=time.monotonic):
+        self.db = db
+        self._tasks_by_message = {}
+        # message_id -> instante en que caduca el "no es una tarea"
+        self._not_tasks = OrderedDict()
+        self._clock = clock
+        self.warmed = False
+        self.stats = {"hits": 0, "misses": 0, "db_lookups": 0, "negative_hits": 0, "stale": 0}
+
+    async def warm(self):
+        pairs = await self.db.get_task_message_index()
+        self._tasks_by_message = {message_id: task_id for message_id, task_id in pairs}
+        self.warmed = True
+        logger.info("Índice de mensajes de tareas precargado: %s mensajes", len(self._tasks_by_message))
+
+    # Registrar un mensaje recién enviado en la base y en el índice
+    async def add(self, task_id, channel_id, message_id):
+        await self.db.add_task_message(task_id, channel_id, message_id)
+        self._tasks_by_message[message_id] = task_id
+        self._not_tasks.pop(message_id, None)
+
+    # Quitar los pares (channel_id, message_id) devueltos al borrar tareas
+    def forget(self, message_refs):
+        for _channel_id, message_id in message_refs:
+            self._tasks_by_message.pop(message_id, None)
+
+    def get(self, message_id):
+        return self._tasks_by_message.get(message_id)
+
+    # Tarea vigente del mensaje, o None. Las entradas de tareas ya borradas o archivadas se descartan.
+    async def resolve(self, message_id, guild_id=None):
+        task_id = self._tasks_by_message.get(message_id)
+        if task_id is None:
+            self.stats["misses"] += 1
+            expires_at = self._not_tasks.get(message_id)
+            if expires_at is not None and expires_at > self._clock():
+                self.stats["negative_hits"] += 1
+                return None
+            # Se consulta la clave primaria de task_messages y se guarda el resultado
+            self.stats["db_lookups"] += 1
+            task_id = await self.db.get_task_id_for_message(guild_id, message_id)
+            if task_id is None:
+                self._remember_not_task(message_id)
+                return None
+            self._not_tasks.pop(message_id, None)
+            self._tasks_by_message[message_id] = task_id
+        else:
+            self.stats["hits"] += 1
+
+        task = await self.db.get_task_by_id(task_id)
+        if task is None:
+            self.stats["stale"] += 1
+            self._tasks_by_message.pop(message_id, None)
+        return task
+
+    def _remember_not_task(self, message_id):
+        self._not_tasks[message_id] = self._clock() + NEGATIVE_TTL_SECONDS
+        self._not_tasks.move_to_end(message_id)
+        while len(self._not_tasks) > MAX_NEGATIVE_ENTRIES:
+            self._not_tasks.popitem(last=False)
+
+    def __len__(self):
+        return len(self._tasks_by_message)
+
+    def snapshot(self):
+        return {**self.stats, "messages": len(self._tasks_by_message), "not_tasks": len(self._not_tasks), "warmed": self.warmed}
+
+
+def get_task_message_index(client):
+    index = getattr(client, "task_messages", None)
+    if index is None:
+        # Sin índice en el cliente (p. ej. en pruebas) se usa uno sin precarga sobre client.db
+        index = TaskMessageIndex(client.db)
+        client.task_messages = index
+    return index
+
+
+# Marcar como entregada la tarea del mensaje; devuelve la tarea o None si el mensaje no corresponde
+# a una tarea vigente del servidor
+async def complete_task_from_message(client, guild_id, user_id, message_id):
+    task = await get_task_message_index(client).resolve(message_id, guild_id)
+    if task is None or task.guild_id != guild_id:
+        return None
+    await client.db.mark_as_delivered(task.id, user_id, guild_id)
+    return task
+
+
+# Vista persistente (timeout=None y custom_id fijo): el botón sigue funcionando tras reinicios
+# porque la tarea se resuelve por el mensaje que lo contiene, no por estado de la vista
+class TaskCompletionView(discord.ui.View):
+    def __init__(self):
+        super().__init__(timeout=None)
+
+    @discord.ui.button(label="Marcar como entregada", emoji=COMPLETE_EMOJI, style=discord.ButtonStyle.success, custom_id=COMPLETE_BUTTON_ID)
+    async def complete(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if interaction.guild is None or interaction.message is None:
+            await interaction.response.send_message(embed=create_error_embed("Tarea no encontrada."), ephemeral=True)
+            return
+        task = await complete_task_from_message(interaction.client, interaction.guild.id, interaction.user.id, interaction.message.id)
+        if task is None:
+            await interaction.response.send_message(embed=create_error_embed("Esta tarea ya no está activa."), ephemeral=True)
+            return
+        await interaction.response.send_message(
+            embed=create_success_embed(f"Tarea **{task.title}** marcada como entregada."),
+            ephemeral=True,
+        )